@@ -0,0 +1,153 @@
+"""Benchmark of compressing tweets at ingest time against compressing a finished hour with bz2
+
+The bz2 path is the one taken by :func:`deepthought.helpers.upload_dir`: the hour is written uncompressed, then read
+back and rewritten by :func:`deepthought.helpers.compress_file`, and has to be decompressed as a whole before any of it
+can be read. The ingest path writes compressed frames directly and only decompresses the frames that are read.
+
+Usage::
+
+    python benchmarks/compression.py [--dir <hour dir>] [--tweets <n>]
+
+If no directory is given, synthetic tweets are used.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from deepthought import helpers
+from deepthought.storage import reader
+from deepthought.storage.segment import SegmentWriter, index_path
+from deepthought.storage.frames import CompressedSegmentWriter
+
+
+WORDS = ["the", "event", "breaking", "news", "love", "game", "tonight", "music", "vote", "happy", "world", "live",
+         "video", "photo", "follow", "today", "people", "new", "time", "best", "watch", "free", "win", "day"]
+
+
+def synthetic_tweets(n, start=1420070400.0, tps=50):
+    """Generates tweets shaped like the ones returned by the sample stream
+
+    Args:
+        n (int): The number of tweets
+        start (float): The timestamp of the first tweet
+        tps (int): The number of tweets per second
+
+    Returns:
+        records (list): A list of (timestamp, payload) tuples
+    """
+    rand = random.Random(42)
+    records = []
+    for i in xrange(n):
+        text = " ".join(rand.choice(WORDS) for _ in xrange(rand.randint(5, 20)))
+        tweet = {
+            "id": 550000000000000000 + i,
+            "text": text,
+            "lang": "en",
+            "created_at": time.strftime("%a %b %d %H:%M:%S +0000 %Y", time.gmtime(start + i / tps)),
+            "user": {"id": rand.randint(1, 10 ** 9), "screen_name": "user%d" % rand.randint(1, 10 ** 6),
+                     "followers_count": rand.randint(0, 10 ** 5), "description": text[::-1], "lang": "en"},
+            "entities": {"hashtags": [], "urls": [], "user_mentions": []},
+            "retweet_count": 0,
+            "favorite_count": 0
+        }
+        records.append((start + i / float(tps), json.dumps(tweet)))
+    return records
+
+
+def cpu_time():
+    """Returns the user and system CPU time used by this process so far"""
+    t = os.times()
+    return t[0] + t[1]
+
+
+def measure(func):
+    """Runs a function and returns its result along with the CPU and wall time it took"""
+    cpu, wall = cpu_time(), time.time()
+    result = func()
+    return result, cpu_time() - cpu, time.time() - wall
+
+
+def bench_bz2(records, dir_path):
+    """Writes an uncompressed segment, compresses it with bz2, then reads the middle 5 minutes back"""
+    path = os.path.join(dir_path, "tweets.seg")
+
+    def write():
+        segment = SegmentWriter(path)
+        segment.write_batch(records)
+        segment.close()
+        return helpers.compress_file(path)
+
+    compressed_path, write_cpu, write_wall = measure(write)
+    size = os.path.getsize(compressed_path) + os.path.getsize(index_path(path))
+
+    def read():
+        helpers.decompress_file(compressed_path)
+        return len(list(reader.open_tweets(dir_path).read_raw(*middle_range(records))))
+
+    count, read_cpu, read_wall = measure(read)
+    return size, write_cpu, write_wall, read_cpu, read_wall, count
+
+
+def bench_frames(records, dir_path):
+    """Writes a compressed segment at ingest, then reads the middle 5 minutes back"""
+    path = os.path.join(dir_path, "tweets.segz")
+
+    def write():
+        segment = CompressedSegmentWriter(path)
+        # Mimic the writer, which hands over one batch per second
+        for i in xrange(0, len(records), 50):
+            segment.write_batch(records[i:i + 50])
+        segment.close()
+
+    _, write_cpu, write_wall = measure(write)
+    size = os.path.getsize(path) + os.path.getsize(index_path(path))
+
+    def read():
+        return len(list(reader.open_tweets(dir_path).read_raw(*middle_range(records))))
+
+    count, read_cpu, read_wall = measure(read)
+    return size, write_cpu, write_wall, read_cpu, read_wall, count
+
+
+def middle_range(records):
+    """Returns a 5 minute time range in the middle of the records"""
+    middle = records[len(records) // 2][0]
+    return middle, middle + 5 * 60
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--dir", help="an hour directory to take the tweets from")
+    parser.add_argument("--tweets", type=int, default=180000, help="the number of synthetic tweets")
+    args = parser.parse_args()
+
+    if args.dir:
+        with reader.open_tweets(args.dir) as tweets:
+            records = list(tweets.read_raw())
+    else:
+        records = synthetic_tweets(args.tweets)
+    raw_size = sum(len(payload) for timestamp, payload in records)
+    print "%d tweets, %.1f MB of JSON\n" % (len(records), raw_size / 1024.0 / 1024)
+
+    print "%-8s %12s %10s %10s %10s %10s %8s" % ("path", "bytes", "write cpu", "write wall", "read cpu",
+                                                 "read wall", "read")
+    for name, bench in (("bz2", bench_bz2), ("frames", bench_frames)):
+        dir_path = tempfile.mkdtemp()
+        try:
+            size, write_cpu, write_wall, read_cpu, read_wall, count = bench(records, dir_path)
+        finally:
+            shutil.rmtree(dir_path)
+        print "%-8s %12d %9.2fs %9.2fs %9.2fs %9.2fs %8d" % (name, size, write_cpu, write_wall, read_cpu,
+                                                            read_wall, count)
+
+
+if __name__ == "__main__":
+    main()
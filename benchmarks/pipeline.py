@@ -0,0 +1,69 @@
+"""Load test of the crawler and analyser, driven by synthetic or replayed tweets instead of the Twitter API
+
+The crawler is fed as fast as the source can generate tweets, then every hour it wrote is analysed. The throughput of
+each stage is reported, the lowest of which is the maximum sustainable throughput of the pipeline on this machine.
+
+Usage::
+
+    python benchmarks/pipeline.py [--replay <hour dir> ...] [--tps <n>] [--seconds <n>]
+"""
+
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import crawler
+from deepthought import config, sources
+from deepthought.processing import analyser
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--replay", nargs="+", metavar="DIR", help="replay archived hours instead of synthetic tweets")
+    parser.add_argument("--tps", type=float, default=50, help="the average TPS of the synthetic tweets")
+    parser.add_argument("--seconds", type=int, default=60 * 60, help="the number of seconds of synthetic tweets")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARN)
+
+    if args.replay:
+        source = sources.ReplaySource(args.replay, speed=None)
+    else:
+        # A spike 10 minutes in, so that the spike detection has something to find
+        spike = sources.Spike(10 * 60, 60, 4, ["earthquake"])
+        source = sources.SyntheticSource(sources.constant(args.tps), spikes=[spike], duration=args.seconds,
+                                         speed=None, seed=42)
+
+    working_dir = tempfile.mkdtemp()
+    config.working_dir = working_dir
+    try:
+        # Crawl until the source runs out
+        c = crawler.Crawler(source)
+        start = time.time()
+        c.run()
+        crawl_time = time.time() - start
+        total = c.total_tweets
+
+        # Analyse every hour the crawler wrote
+        start = time.time()
+        for name in sorted(os.listdir(working_dir)):
+            analyser.Analyser().analyse(os.path.join(working_dir, name))
+        analyse_time = time.time() - start
+    finally:
+        shutil.rmtree(working_dir)
+
+    print "%d tweets" % total
+    print "%-10s %10s %14s" % ("stage", "seconds", "tweets/second")
+    for stage, seconds in (("crawler", crawl_time), ("analyser", analyse_time)):
+        print "%-10s %10.2f %14.0f" % (stage, seconds, total / seconds)
+    print "\nMaximum sustainable throughput: %.0f tweets/second" % (total / max(crawl_time, analyse_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Benchmark of the search index against loading the search.json of every hour
+
+Synthetic word frequencies are written for a number of hours, as search.json files and into the search index. The
+frequency of random words over every hour is then looked up both ways.
+
+Usage::
+
+    python benchmarks/search_index.py [--hours <n>] [--words <n>] [--queries <n>]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from deepthought.storage import index
+
+
+def lookup_json(cache_dir, query):
+    """Looks a word up in the search.json of every hour, as the search used to"""
+    frequency = {}
+    for name in os.listdir(cache_dir):
+        with open(os.path.join(cache_dir, name, "search.json"), 'r') as f:
+            frequency[name] = json.load(f).get(query, 0)
+    return frequency
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, dirs, files in os.walk(path) for name in files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--hours", type=int, default=500, help="the number of hours")
+    parser.add_argument("--words", type=int, default=20000, help="the number of distinct words of every hour")
+    parser.add_argument("--queries", type=int, default=20, help="the number of words looked up")
+    args = parser.parse_args()
+
+    r = random.Random(42)
+    vocabulary = [u"word%d" % i for i in xrange(args.words * 5)]
+    root = tempfile.mkdtemp()
+    cache_dir = os.path.join(root, "search-cache")
+    inverted_index = index.InvertedIndex(os.path.join(root, "search-index"), fanout=8)
+    try:
+        start = index.hour_number("01-01-2016_00")
+        add_seconds = 0.0
+        for i in xrange(args.hours):
+            name = index.hour_name(start + i)
+            # A few words are used every hour, most of them rarely
+            counts = dict((word, int(r.paretovariate(1.2))) for word in r.sample(vocabulary, args.words))
+            os.makedirs(os.path.join(cache_dir, name))
+            with open(os.path.join(cache_dir, name, "search.json"), 'w') as f:
+                json.dump(counts, f)
+            begin = time.time()
+            inverted_index.add_hour(name, counts)
+            add_seconds += time.time() - begin
+
+        queries = r.sample(vocabulary, args.queries)
+        begin = time.time()
+        expected = [lookup_json(cache_dir, query) for query in queries]
+        json_seconds = (time.time() - begin) / args.queries
+
+        reader = index.InvertedIndex(inverted_index.dir_path)
+        begin = time.time()
+        found = [reader.lookup(query) for query in queries]
+        index_seconds = (time.time() - begin) / args.queries
+
+        for frequency, counts in zip(expected, found):
+            assert dict((name, count) for name, count in frequency.iteritems() if count) == counts
+
+        print "%d hours of %d words, index of %d runs" % (args.hours, args.words, len(reader.runs))
+        print "%-12s %14s %12s" % ("", "ms per query", "size (MB)")
+        print "%-12s %14.2f %12.1f" % ("search.json", json_seconds * 1000, dir_size(cache_dir) / 1e6)
+        print "%-12s %14.2f %12.1f" % ("index", index_seconds * 1000, dir_size(inverted_index.dir_path) / 1e6)
+        print "%.1f ms to add an hour to the index on average" % (add_seconds / args.hours * 1000)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Sweep of the spike detection parameters over archived tps.csv files
+
+Every combination of the given EMA lengths, growth lengths and spike thresholds is evaluated in one call to
+:meth:`deepthought.processing.timeseries.TPSSeries.sweep`, and the number of spikes found by each is printed.
+
+Usage::
+
+    python benchmarks/spike_sweep.py [--dirs <hour dir> ...] [--ema 5 15 30] [--growth 5 10] [--threshold 0.5 1.3]
+
+If no directories are given, a month of synthetic TPS is used.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from deepthought.processing import timeseries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--dirs", nargs="+", metavar="DIR", help="the hour directories containing tps.csv")
+    parser.add_argument("--ema", nargs="+", type=int, default=[5, 15, 30, 60])
+    parser.add_argument("--growth", nargs="+", type=int, default=[5, 10, 20])
+    parser.add_argument("--threshold", nargs="+", type=float, default=[0.3, 0.5, 0.8, 1.0, 1.3, 2.0])
+    args = parser.parse_args()
+
+    start = time.time()
+    if args.dirs:
+        series = timeseries.TPSSeries.from_dirs(args.dirs)
+    else:
+        seconds = 30 * 24 * 60 * 60
+        series = timeseries.TPSSeries(np.arange(seconds), np.random.RandomState(42).poisson(50, seconds))
+    print "Loaded %d seconds of TPS in %.2fs" % (len(series.timestamps), time.time() - start)
+
+    start = time.time()
+    results = series.sweep(args.ema, args.growth, args.threshold)
+    print "Evaluated %d combinations in %.2fs\n" % (len(results), time.time() - start)
+
+    print "%6s %6s %9s %8s" % ("ema", "growth", "threshold", "spikes")
+    for (ema_length, growth_length, threshold), spikes in sorted(results.iteritems()):
+        print "%6d %6d %9.2f %8d" % (ema_length, growth_length, threshold, len(spikes))
+
+
+if __name__ == "__main__":
+    main()
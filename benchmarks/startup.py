@@ -0,0 +1,98 @@
+"""Benchmark of the time taken to start every role of the app
+
+Each role is started in a new process, from the first import of the app until its threads are created, and the heavy
+dependencies loaded on the way are listed. For comparison, the previous start is reproduced by importing every module
+and dependency of every role first, as importing main.py used to.
+
+Usage::
+
+    python benchmarks/startup.py [--runs <n>]
+
+The threads are created but never started, so no tweet is crawled and no port is opened.
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+# The dependencies which are slow to import
+HEAVY = ("numpy", "scipy", "nltk", "gensim", "boto", "flask", "flask_restful", "twitter")
+
+ROLES = ("previous", "all", "crawler", "processor", "api")
+
+
+def import_everything():
+    """Imports what importing main.py used to, before any thread was created"""
+    import twitter
+    import boto.s3.connection
+    import nltk.corpus
+    import gensim
+    import crawler
+    from deepthought import console, helpers
+    from deepthought.processing import processor, analyser, langprocess
+    from deepthought.api import api_server
+
+
+def run(role):
+    """Creates the threads of a role, in this process
+
+    Returns:
+        (seconds, heavy dependencies loaded) (tuple)
+    """
+    start = time.time()
+    if role == "previous":
+        import_everything()
+        role = "all"
+
+    from deepthought import app
+    threads = app.App(role).create_threads()
+    seconds = time.time() - start
+
+    if 'processor' in threads:
+        threads['processor'].pool.terminate()
+    return seconds, [name for name in HEAVY if name in sys.modules]
+
+
+def measure(role, cwd):
+    """Starts a role in a new process
+
+    Returns:
+        (seconds, heavy dependencies loaded) (tuple)
+    """
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--run", role], cwd=cwd)
+    seconds, heavy = output.split()
+    return float(seconds), heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=5, help="the number of times every role is started")
+    parser.add_argument("--run", choices=ROLES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        seconds, heavy = run(args.run)
+        print seconds, ",".join(heavy) or "-"
+        return
+
+    # The logs of the app are written to the working directory of the processes
+    cwd = tempfile.mkdtemp()
+    try:
+        print "%-10s %10s %10s  %s" % ("role", "median (s)", "min (s)", "heavy dependencies loaded")
+        for role in ROLES:
+            results = [measure(role, cwd) for _ in xrange(args.runs)]
+            times = sorted(seconds for seconds, heavy in results)
+            print "%-10s %10.3f %10.3f  %s" % (role, times[len(times) // 2], times[0], results[-1][1])
+    finally:
+        shutil.rmtree(cwd)
+
+
+if __name__ == "__main__":
+    main()
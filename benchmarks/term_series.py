@@ -0,0 +1,95 @@
+"""Storage cost of the per-minute term series of an hour, compared to the hourly search.json
+
+The word frequency and term series stages are run over the records of an hour. The size of terms.npz is compared to
+the size of search.json, and to the size of the same per-minute counts written as JSON, both as they are written and
+as they are uploaded.
+
+Usage::
+
+    python benchmarks/term_series.py [--dir <hour dir>] [--tps <n>]
+
+If no directory is given, an hour of synthetic tweets is generated.
+"""
+
+import os
+import bz2
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from deepthought import sources
+from deepthought.storage import projection, reader
+from deepthought.processing import analyser, stages, termseries
+
+
+def sizes(path):
+    """Returns the size of a file, and its size once uploaded, which is compressed with BZ2 unless it is a .npz"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if path.endswith(".npz"):
+        return len(data), len(data)
+    return len(data), len(bz2.compress(data))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--dir", help="the hour directory to analyse, the results are written to a temporary directory")
+    parser.add_argument("--tps", type=float, default=50, help="the average TPS of the synthetic tweets")
+    args = parser.parse_args()
+
+    if args.dir:
+        with reader.open_records(args.dir) as records:
+            records = list(records.read())
+    else:
+        # The tweets are spread evenly over an hour, as they would be by the crawler at the TPS of the source
+        start = termseries.hour_start(time.time())
+        tweets = sources.SyntheticSource(sources.constant(args.tps), duration=60 * 60, speed=None, seed=42)
+        records = [(start + i / args.tps, projection.project(tweet)) for i, tweet in enumerate(tweets)]
+
+    working_dir = tempfile.mkdtemp()
+    try:
+        a = analyser.Analyser()
+        a.dir_path = working_dir
+        a.stages = [stages.WordFrequencyStage(), stages.TermSeriesStage()]
+        start = time.time()
+        for stage in a.stages:
+            stage.start(a)
+        for timestamp, record in records:
+            for stage in a.stages:
+                stage.feed(timestamp, record)
+        for stage in a.stages:
+            stage.finish(a)
+        print "Counted the words of %d tweets in %.2fs\n" % (len(records), time.time() - start)
+
+        # The same per-minute counts, as JSON
+        series = termseries.TermSeries.load(os.path.join(working_dir, "terms.npz"))
+        minute_json = {}
+        for i, word in enumerate(series.vocab):
+            begin, end = series.indptr[i], series.indptr[i + 1]
+            minute_json[word] = dict(zip(series.minutes[begin:end].tolist(), series.counts[begin:end].tolist()))
+        minute_json_path = os.path.join(working_dir, "terms.json")
+        with open(minute_json_path, 'w') as f:
+            json.dump(minute_json, f)
+
+        print "%d words, %d (word, minute) counts\n" % (len(series.vocab), len(series.counts))
+        print "%-28s %12s %14s" % ("file", "bytes", "uploaded bytes")
+        for name, path in (("search.json (hourly)", "search.json"), ("terms.json (per minute)", "terms.json"),
+                           ("terms.npz (per minute)", "terms.npz")):
+            size, uploaded = sizes(os.path.join(working_dir, path))
+            print "%-28s %12d %14d" % (name, size, uploaded)
+
+        word = a.stages[0].freq_dict.most_common(1)[0][0]
+        start = time.time()
+        termseries.TermSeries.load(os.path.join(working_dir, "terms.npz")).series(word, 1)
+        print "\nLoaded terms.npz and looked up '%s' in %.1fms" % (word, (time.time() - start) * 1000)
+    finally:
+        shutil.rmtree(working_dir)
+
+
+if __name__ == "__main__":
+    main()
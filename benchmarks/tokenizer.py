@@ -0,0 +1,125 @@
+"""Benchmark of the tokenizer on the records of an hour
+
+The word frequencies and the topic words of every tweet of the hour are computed with
+:mod:`deepthought.processing.tokenizer`, and with the previous implementation for comparison, which joined the whole
+hour into one string and recompiled the emoji pattern for every tweet. Each implementation runs in its own process, so
+that its peak RSS is measured on its own.
+
+Usage::
+
+    python benchmarks/tokenizer.py [--dir <hour dir>] [--tps <n>]
+
+If no directory is given, an hour of synthetic tweets is crawled first.
+"""
+
+import os
+import re
+import sys
+import time
+import shutil
+import logging
+import argparse
+import resource
+import tempfile
+import subprocess
+import collections
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import crawler
+from deepthought import config, sources
+from deepthought.storage import reader
+from deepthought.processing import tokenizer
+
+
+def run_tokenizer(dir_path):
+    """Counts the words and cleans the topic words tweet by tweet, with the tokenizer"""
+    freq_dict = collections.Counter()
+    n = 0
+    with reader.open_records(dir_path) as records:
+        for timestamp, record in records.read():
+            freq_dict.update(tokenizer.words(record.text))
+            u" ".join(tokenizer.topic_words(record.text))
+            n += 1
+    return n
+
+
+def run_previous(dir_path):
+    """Counts the words of the whole hour joined into one string, and cleans the topic words as it used to be done"""
+    stop = set(tokenizer.STOP_WORDS)
+
+    def cleaner(text):
+        tl = unicode(text.lower()).split(' ')
+        myre = re.compile(u'[\U0001f300-\U0001ffff\u2600-\u26ff\u2700-\u27bf]+', re.UNICODE)
+        tl = myre.sub('', ' '.join(tl)).split(' ')
+        tl = filter(lambda w: (not w in stop), tl)
+        tl = filter(lambda w: not any(a in w for a in ['rt', '#', 'http', '@']), tl)
+        return ' '.join(tl)
+
+    tweets = ""
+    n = 0
+    with reader.open_records(dir_path) as records:
+        for timestamp, record in records.read():
+            tweets += record.text.encode("utf-8", errors="replace") + " "
+            u" ".join(cleaner(record.text).split())
+            n += 1
+    stop_words = set(tokenizer.STOP_WORDS)
+    stop_words.update(["rt", "#"])
+    collections.Counter(word for word in tweets.lower().split() if word not in stop_words)
+    return n
+
+
+IMPLEMENTATIONS = {"tokenizer": run_tokenizer, "previous": run_previous}
+
+
+def measure(dir_path, name):
+    """Runs an implementation in a new process
+
+    Returns:
+        (tweets, seconds, peak RSS in MB) (tuple)
+    """
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--dir", dir_path, "--run", name])
+    n, seconds, rss = output.split()
+    return int(n), float(seconds), float(rss)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--dir", help="the hour directory to tokenize")
+    parser.add_argument("--tps", type=float, default=50, help="the average TPS of the synthetic tweets")
+    parser.add_argument("--run", choices=sorted(IMPLEMENTATIONS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        start = time.time()
+        n = IMPLEMENTATIONS[args.run](args.dir)
+        # ru_maxrss is in KB on Linux
+        print n, time.time() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+        return
+
+    logging.basicConfig(level=logging.WARN)
+
+    working_dir = None
+    dir_path = args.dir
+    if dir_path is None:
+        working_dir = tempfile.mkdtemp()
+        config.working_dir = working_dir
+        c = crawler.Crawler(sources.SyntheticSource(sources.constant(args.tps), duration=60 * 60, speed=None, seed=42))
+        c.run()
+        # The crawl may have crossed into another hour, keep the biggest one
+        dir_paths = [os.path.join(working_dir, name) for name in os.listdir(working_dir)]
+        dir_path = max(dir_paths, key=lambda path: sum(os.path.getsize(os.path.join(path, name))
+                                                       for name in os.listdir(path)))
+
+    try:
+        print "%-10s %8s %10s %14s %14s" % ("tokenizer", "tweets", "seconds", "tweets/second", "peak RSS (MB)")
+        for name in ("previous", "tokenizer"):
+            n, seconds, rss = measure(dir_path, name)
+            print "%-10s %8d %10.2f %14.0f %14.1f" % (name, n, seconds, n / seconds, rss)
+    finally:
+        if working_dir is not None:
+            shutil.rmtree(working_dir)
+
+
+if __name__ == "__main__":
+    main()
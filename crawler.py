@@ -3,17 +3,17 @@
 import os
 import time
 import datetime
-import json
 import logging
-import csv
 import threading
 import urllib2
 import traceback
 import shutil
+import argparse
 
-import twitter
-
-from deepthought import config
+from deepthought import config, sources
+from deepthought.metrics import AtomicCounter, MetricsClock
+from deepthought.processing.online import OnlineSpikeDetector
+from deepthought.storage.writer import TweetWriter
 
 
 module_logger = logging.getLogger(__name__)
@@ -25,6 +25,9 @@ def init_twitter_api():
     Returns:
         twitter_api (twitter.TwitterStream): Twitter API object
     """
+    # The Twitter client is only imported when the crawler streams from Twitter, not when it replays or generates tweets
+    import twitter
+
     module_logger.debug("Initializing Twitter API")
     # Authenticate with twitter api
     auth = twitter.oauth.OAuth(config.ot, config.ots, config.ck, config.cs)
@@ -32,32 +35,66 @@ def init_twitter_api():
     return twitter_api
 
 
+class TwitterSource(sources.StreamSource):
+    """The sample stream of the Twitter API, which is the default source of tweets for the crawler"""
+
+    def __iter__(self):
+        """Connects to the Twitter Stream
+
+        Returns:
+            stream (iterator): The stream where the crawler will get the tweets from
+        """
+        import twitter
+
+        twitter_api = init_twitter_api()
+        self.logger.debug("Initializing Twitter Stream")
+        try:
+            return iter(twitter.TwitterStream(auth=twitter_api.auth).statuses.sample(language='en'))
+        except urllib2.URLError:  # This exception is raised when there is no internet
+            self.logger.error("Unable to initialize Twitter stream, please check your internet connection")
+            raise
+
+
 class Crawler(threading.Thread):
     """ Accepts Twitter stream and saves tweets hourly
 
     Attributes:
         total_tweets (int): The total number of tweets the crawler has collected
-        tps (int): Variable to calculate Tweets Per Second
+        tps (AtomicCounter): Counter used to calculate Tweets Per Second
         start_time (datetime): Time when the crawler started
         stream (twitter.TwitterStream): The Twitter stream where the crawler will get the tweets from
         dir (str): The current directory where the crawler is writing to
+        deadline (float): The time at which the current hour ends and the crawler has to change directory
         status (dict): The current status of the crawler
-        files (dict): A dict of files to be used in the crawler, namely tweets.csv and tps.csv
-        writers (dict): A dict of CSV Writers to be used in the crawler
+        tweet_writer (TweetWriter): The writer thread which writes the tweets and tps.csv in batches
+        clock (MetricsClock): The thread which records the TPS every second and keeps the last hour of it
+        detector (OnlineSpikeDetector): Finds spikes as the TPS is recorded, fed by the clock and the writer
         logger (logging.Logger): Logger used for logging
         stopped (bool): Boolean value indicating if crawler has stopped
     """
 
-    def __init__(self):
-        """Initializes crawler"""
+    def __init__(self, source=None, sealed_queue=None):
+        """Initializes crawler
+
+        Args:
+            source (sources.StreamSource): The source of tweets, defaults to the Twitter stream
+            sealed_queue (Queue.Queue): The shared queue between the Crawler and Processor, where the directory of
+                every finished hour is put once all its files are written and closed
+        """
         self.total_tweets = 0
-        self.tps = 0
+        self.tps = AtomicCounter()
         self.start_time = None
+        self.source = source or TwitterSource()
         self.stream = None
         self.dir = ""
+        self.deadline = 0
         self.status = {}
-        self.files = {}
-        self.writers = {}
+        self.tweet_writer = TweetWriter(sealed_queue=sealed_queue)
+        self.clock = MetricsClock(self.tps, self.tweet_writer)
+        self.clock.listeners.append(self.update_status)
+        self.detector = OnlineSpikeDetector()
+        self.clock.listeners.append(self.detector.tick)
+        self.tweet_writer.listeners.append(self.detector.observe)
         self.stopped = False
 
         # Call thread constructor
@@ -69,21 +106,17 @@ class Crawler(threading.Thread):
     def run(self):
         """Main function for the collection of tweets
 
-        It establishes a connection to the Twitter Stream and iterate over each tweet, appending the timestamp and tweet
-        to the tweet.csv file. It also checks if it is time to change directory.
+        It establishes a connection to the source, by default the Twitter Stream, and iterate over each tweet,
+        appending the timestamp and tweet to the tweets.seg segment. It also checks if it is time to change directory.
         """
 
         self.logger.warn("Crawler started")
 
-        # Initializes a Twitter Stream
-        twitter_api = init_twitter_api()
-        self.logger.debug("Initializing Twitter Stream")
-        try:
-            self.stream = twitter.TwitterStream(auth=twitter_api.auth) \
-                .statuses.sample(language='en')
-        except urllib2.URLError:  # This exception is raised when there is no internet
-            self.logger.error("Unable to initialize Twitter stream, please check your internet connection")
-            raise
+        # Initializes the stream of the source
+        self.stream = iter(self.source)
+
+        # Start the writer before the first directory is handed to it
+        self.tweet_writer.start()
 
         # Initializes the directory the crawler is going to write to
         self.init_dir()
@@ -92,7 +125,7 @@ class Crawler(threading.Thread):
         self.start_time = datetime.datetime.now()
 
         # Start updating status every second from now
-        self.update_status()
+        self.clock.start()
 
         # Iterate the tweets in the stream
         try:
@@ -103,25 +136,23 @@ class Crawler(threading.Thread):
 
                 # Update counters
                 self.total_tweets += 1
-                self.tps += 1
+                self.tps.increment()
 
-                # Append tweet to csv file
+                # Queue the tweet to be appended to the segment by the writer
                 timestamp = time.time()
-                try:
-                    self.writers["tweets"].writerow({
-                        'timestamp': timestamp,
-                        'tweet': json.dumps(tweet)
-                    })
-                except ValueError:
-                    self.logger.error("Failed to write to tweets.csv")
-                    raise
+                self.tweet_writer.put(timestamp, tweet)
 
                 # Check if it is time to change dir, which happens every hour
-                if self.dir != self.get_curr_hour():
+                if timestamp >= self.deadline:
                     self.change_dir()
         except StopIteration:
             self.logger.error("Twitter stream stopped unexpectedly")
 
+        # Offline sources end, in which case the remaining tweets are written out
+        if not self.stopped:
+            self.logger.warn("Stream ended")
+            self.stop()
+
     def stop(self):
         """Stops the crawler
 
@@ -135,67 +166,60 @@ class Crawler(threading.Thread):
         # Ensure that no more writing will occur
         time.sleep(1.5)
 
-        # Close the files
-        for (file_name, file_handle) in self.files.iteritems():
-            file_handle.close()
+        # Stop the clock, handing its last ticks to the writer
+        self.clock.stop()
+
+        # Write the queued tweets and ticks, and close the files
+        if self.tweet_writer.is_alive():
+            self.tweet_writer.stop()
 
-    def update_status(self):
-        """Update the crawler's status and calculates the TPS
+    def update_status(self, timestamp, tps):
+        """Update the crawler's status, called by the clock every second
 
         Note:
             The tps is calculated using a counter, which is incremented every time a tweet is processed.
-            Every second, the value of the counter is noted and is reset to 0.
-        """
-        # If the crawler has been stopped, break
-        if self.stopped:
-            return
-
-        # Call this function again one second from now
-        t = threading.Timer(1, self.update_status)
-        t.daemon = True
-        t.start()
+            Every second, the clock notes the value of the counter and resets it to 0.
 
+        Args:
+            timestamp (float): The time of the tick
+            tps (int): The number of tweets received in the last second
+        """
         # Calculate time elapsed
         elapsed_time = datetime.datetime.now() - self.start_time
 
         self.status = {
             'duration': int(elapsed_time.total_seconds()),
             'total_tweets': self.total_tweets,
-            'tps': self.tps,
-            'dir': self.dir
+            'tps': tps,
+            'dir': self.dir,
+            'writer': self.tweet_writer.stats(),
+            'ema': self.detector.ema,
+            'growth': self.detector.growth,
+            'live_spikes': len(self.detector.events)
         }
 
-        # Append to the tps file
-        timestamp = str(time.time())
-        try:
-            self.writers["tps"].writerow({
-                'timestamp': timestamp,
-                'tps': self.tps
-            })
-        except ValueError:
-            self.logger.error("Failed to write to tps.csv")
-            raise
-
-        # Reset tps counter
-        self.tps = 0
-
     def change_dir(self):
-        """Sends the old files to the Processor and initializes a new directory"""
+        """Sends the old files to the Processor and initializes a new directory
+
+        The writer puts the old directory onto the queue shared with the Processor once its files are closed.
+        """
         self.logger.info("Changing dir from '" + self.dir + "' to '" + self.get_curr_hour() + "'")
 
-        # Close the old files
-        for (file_name, file_handle) in self.files.iteritems():
-            file_handle.close()
+        # Hand the ticks of the old hour to the writer before it moves on to the new dir
+        # The clock cannot hand ticks it collected before the rotation over after it, so they stay in the old hour
+        with self.clock.flush_lock:
+            self.clock.flush()
 
-        # Init new dir
-        self.init_dir()
+            # Init new dir
+            self.init_dir()
 
     def init_dir(self):
         """Initializes a directory for the crawler
 
-        It also opens tweets.csv and tps.csv in the directory for writing
+        The directory is handed over to the writer, which opens the tweets segment and tps.csv in it
         """
         self.dir = self.get_curr_hour()
+        self.deadline = self.get_next_hour()
         self.logger.debug("Initializing dir '" + self.dir + "'")
 
         # If directory already exists, delete it and make a new one
@@ -205,17 +229,20 @@ class Crawler(threading.Thread):
 
         os.makedirs(self.dir)
 
-        # Creates and opens tweets.csv and tps.csv for writing
-        # They will be closed when it's time to change dir or if the crawler has been stopped
-        self.files["tweets"] = open(os.path.join(self.dir, "tweets.csv"), 'wb', 0)
-        writer = csv.DictWriter(self.files["tweets"], fieldnames=['timestamp', 'tweet'])
-        writer.writeheader()
-        self.writers["tweets"] = writer
+        # The writer will close the old files and open new ones once the tweets and ticks queued so far are written
+        # They will also be closed if the crawler has been stopped
+        self.tweet_writer.rotate(self.dir, self.deadline - 60 * 60)
+
+    @staticmethod
+    def get_next_hour():
+        """Method that returns the time at which the current hour ends
 
-        self.files["tps"] = open(os.path.join(self.dir, "tps.csv"), 'wb', 0)
-        writer = csv.DictWriter(self.files["tps"], fieldnames=['timestamp', 'tps'])
-        writer.writeheader()
-        self.writers["tps"] = writer
+        Returns:
+            The timestamp of the start of the next hour
+        """
+        now = time.time()
+        local_time = time.localtime(now)
+        return int(now) - local_time.tm_min * 60 - local_time.tm_sec + 60 * 60
 
     @staticmethod
     def get_curr_hour():
@@ -241,8 +268,29 @@ def init_logging():
     root_logger.addHandler(console_handler)
 
 
+def parse_source():
+    """Parses the command line arguments to choose the source of tweets
+
+    Returns:
+        source (sources.StreamSource): The chosen source, or None for the Twitter stream
+    """
+    parser = argparse.ArgumentParser(description="Collects tweets and saves them hourly")
+    parser.add_argument("--replay", nargs="+", metavar="DIR", help="replay archived hours instead of the Twitter stream")
+    parser.add_argument("--synthetic", type=float, metavar="TPS", help="generate synthetic tweets at this TPS")
+    parser.add_argument("--duration", type=int, help="the number of seconds of synthetic tweets to generate")
+    parser.add_argument("--speed", type=float, default=1.0, help="speed multiplier, 0 for as fast as possible")
+    args = parser.parse_args()
+
+    speed = args.speed or None
+    if args.replay:
+        return sources.ReplaySource(args.replay, speed=speed)
+    if args.synthetic:
+        return sources.SyntheticSource(sources.constant(args.synthetic), duration=args.duration, speed=speed)
+    return None
+
+
 if __name__ == "__main__":
-    crawler = Crawler()
+    crawler = Crawler(parse_source())
     init_logging()
     while True:
         try:
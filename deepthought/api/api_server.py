@@ -1,13 +1,14 @@
 """
 This module provides a way for the frontend to communicate with the program,
 through this RESTful web API
+
+The responses of the stats, search and dates resources are cached, see :mod:`deepthought.api.responsecache`.
 """
 import logging
 import threading
 import collections
 import shutil
 import os
-import csv
 import uuid
 
 import flask
@@ -16,7 +17,12 @@ import flask_restful
 from flask_restful import Resource
 
 from deepthought import config, helpers
-from deepthought.api import search
+from deepthought.api import search, responsecache
+from deepthought.storage import statstore
+
+
+# The cache of the responses, shared by every request
+cache = responsecache.ResponseCache()
 
 
 class APIServer(threading.Thread):
@@ -25,6 +31,10 @@ class APIServer(threading.Thread):
     S3Dates_url = 's3/dates'
     S3Stats_url = "s3/stats/<string:date>"
     Search_url = 'search/<string:query>'
+    BatchSearch_url = 'search'
+    CrawlerTPS_url = 'crawler/tps'
+    LiveSpikes_url = 'live/spikes'
+    CacheStats_url = 'cache/stats'
 
     def __init__(self):
         """Initializes the API thread"""
@@ -46,7 +56,11 @@ class APIServer(threading.Thread):
         api_base_url = config.api_base_url
         api.add_resource(S3Stats, api_base_url + self.S3Stats_url)
         api.add_resource(Search, api_base_url + self.Search_url)
+        api.add_resource(BatchSearch, api_base_url + self.BatchSearch_url)
         api.add_resource(S3Dates, api_base_url + self.S3Dates_url)
+        api.add_resource(CrawlerTPS, api_base_url + self.CrawlerTPS_url)
+        api.add_resource(LiveSpikes, api_base_url + self.LiveSpikes_url)
+        api.add_resource(CacheStats, api_base_url + self.CacheStats_url)
 
         # Run the Flask server on the specified port
         # The server is not run on the default port to prevent clashes
@@ -61,58 +75,123 @@ class APIServer(threading.Thread):
 class S3Stats(Resource):
     @staticmethod
     def get(date):
-        b = helpers.S3Bucket()
-        kl = b.find_keys(date)
-        if len(kl) == 0 or len(date) != 13:
-            return {"error": "Invalid date provided"}
+        """Returns the stats of an hour, which only change when the hour is published"""
+        return cache.get(('stats', date), lambda: S3Stats.compute(date), hour=date)
 
-        dp = os.path.join(config.working_dir, str(uuid.uuid4()))
-        for k in kl:
-            if any(ss in k.name for ss in ['tps', 'ema', 'growth', 'spikes']):
-                b.download(k, os.path.join(dp, k.name))
+    @staticmethod
+    def compute(date):
+        """Reads the stats of an hour from the local stats store, loading them from Amazon S3 if they are not in it
 
-        stats = collections.defaultdict(dict)
+        Cold hours, e.g. analysed on another machine, are loaded into the store along with the ETags of their keys. Once
+        they are stale, the keys are listed again, and the hour is only loaded again if they changed.
+        """
+        if len(date) != 13:
+            return {"error": "Invalid date provided"}
+        store = statstore.StatsStore()
+        stats = store.get(date)
+        if stats is not None and not store.is_stale(date):
+            return stats
 
-        def proc_file(fp):
-            s = fp.split(os.sep)[-1].split(".")[0].lower()
-            if fp.lower().endswith(".bz2"):
-                fp = helpers.decompress_file(fp)
-            with open(fp, 'r') as f:
-                dr = csv.DictReader(f)
-                for r in dr:
-                    stats[s][r['timestamp']] = r[s]
+        b = helpers.S3Bucket()
+        kl = [k for k in b.find_keys(date, [helpers.hour_prefix(date)])
+              if k.name.split("/")[-1].split(".")[0].lower() in statstore.STATS]
+        etags = dict((k.name, k.etag) for k in kl)
+        if stats is not None and (len(kl) == 0 or etags == store.etags(date)):
+            store.mark_checked(date)
+            return stats
+        if len(kl) == 0:
+            return {"error": "Invalid date provided"}
 
-        threads = []
-        for subdir, dirs, files in os.walk(dp):
-            for file in files:
-                file_path = os.path.join(subdir, file)
-                t = threading.Thread(target=proc_file, args=(file_path,))
-                t.start()
-                threads.append(t)
+        dp = os.path.join(config.working_dir, str(uuid.uuid4()))
+        try:
+            helpers.S3Bucket.download_async(kl, dp)
+            hour_dir = os.path.join(dp, helpers.hour_prefix(date).replace("/", os.sep))
+            for file_name in os.listdir(hour_dir):
+                if file_name.lower().endswith(".bz2"):
+                    helpers.decompress_file(os.path.join(hour_dir, file_name))
+            store.add_hour(date, hour_dir, etags)
+        finally:
+            shutil.rmtree(dp, ignore_errors=True)
+        return store.get(date)
 
-        for t in threads:
-            t.join()
 
-        shutil.rmtree(dp)
+class Search(Resource):
+    @staticmethod
+    def get(query):
+        """Returns the frequency of a word in every hour, or every 'resolution' minutes given as a query parameter
 
-        s = {}
-        for i, d in stats.iteritems():
-            s[i] = collections.OrderedDict(sorted(d.items()))
-        return s
+        The frequency is counted from the 'start' to the 'end' hour given as query parameters, if any.
+        """
+        resolution = flask.request.args.get('resolution', 60, type=int)
+        start = flask.request.args.get('start')
+        end = flask.request.args.get('end')
+        try:
+            return cache.get(('search', query, resolution, start, end),
+                             lambda: search.search(query, resolution, start, end))
+        except ValueError as e:
+            return {"error": str(e)}
 
 
-class Search(Resource):
+class BatchSearch(Resource):
     @staticmethod
-    def get(query):
-        return search.search(query)
+    def get():
+        """Returns the frequency of several keywords or prefixes, given by the repeated 'q' query parameter
+
+        The frequency is counted every 'resolution' minutes, optionally from the 'start' to the 'end' hour.
+        """
+        patterns = flask.request.args.getlist('q')
+        resolution = flask.request.args.get('resolution', 60, type=int)
+        start = flask.request.args.get('start')
+        end = flask.request.args.get('end')
+        try:
+            return cache.get(('batch', tuple(patterns), resolution, start, end),
+                             lambda: search.search_many(patterns, resolution, start, end))
+        except ValueError as e:
+            return {"error": str(e)}
 
 
 class S3Dates(Resource):
     @staticmethod
     def get():
+        return cache.get(('dates',), S3Dates.compute)
+
+    @staticmethod
+    def compute():
         b = helpers.S3Bucket()
         kl = b.find_keys("tps.csv")
         dl = []
         for k in kl:
             dl.append(k.name.split("/")[-2])
-        return dl
\ No newline at end of file
+        return dl
+
+
+class CrawlerTPS(Resource):
+    @staticmethod
+    def get():
+        """Returns the TPS of the running crawler over the last seconds, given by the 'seconds' query parameter"""
+        from deepthought import app
+        crawler = app.threads.get('crawler')
+        if crawler is None:
+            return {"error": "Crawler is not running"}
+
+        seconds = flask.request.args.get('seconds', config.tps_history, type=int)
+        return collections.OrderedDict(crawler.clock.history.last(seconds))
+
+
+class LiveSpikes(Resource):
+    @staticmethod
+    def get():
+        """Returns the spikes found in real time by the running crawler"""
+        from deepthought import app
+        crawler = app.threads.get('crawler')
+        if crawler is None:
+            return {"error": "Crawler is not running"}
+
+        return crawler.detector.recent()
+
+
+class CacheStats(Resource):
+    @staticmethod
+    def get():
+        """Returns the hits, misses and other counts of the response cache"""
+        return cache.get_stats()
@@ -0,0 +1,296 @@
+"""This module caches the responses of the API in memory
+
+The responses are kept in a least recently used cache, for at most config.api_cache_ttl seconds. Concurrent requests
+for a response which is not cached are coalesced: only the first one computes it, and the others wait for its result.
+
+Every response depends either on one hour, e.g. the stats of an hour, or on all of them, e.g. a search. Whenever the
+processor publishes an hour, it appends the name of the hour to a publish log, see :func:`publish`. The cache reads
+the new lines of the log before every request, and only drops the responses depending on the hours published, along
+with those depending on all of them. As the log is a file, this works whether the processor runs in the same process
+as the API or in another one on the same machine. The TTL covers the hours published from other machines.
+
+Once the log reaches config.api_cache_log_size bytes, the next hour published replaces it with a new log, whose first
+line is the "#<generation>" of the log, one more than that of the log it replaces. Each cache keeps the log it reads
+open, so it still reads the last lines of a replaced log before moving on to the new one. A cache which finds that it
+skipped a whole log, as it was not read while that log was in place, drops every response.
+"""
+
+import os
+import fcntl
+import time
+import logging
+import threading
+import collections
+
+from deepthought import config
+
+
+module_logger = logging.getLogger(__name__)
+
+
+def publish(hour, log_path=None):
+    """Records that an hour was published, which invalidates the responses depending on it
+
+    The line is appended in a single write, under a lock shared by the processes publishing, so that the log is never
+    replaced while a line is being appended to it. Once the log reaches config.api_cache_log_size bytes, the line is
+    written to a new log instead, which is renamed over the log.
+
+    Args:
+        hour (str): The name of the hour, e.g. "01-02-2016_13"
+        log_path (str): The path of the publish log, defaults to config.api_cache_publish_log
+    """
+    log_path = log_path or config.api_cache_publish_log
+    with open(log_path + ".lock", 'a') as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            full = os.path.getsize(log_path) >= config.api_cache_log_size
+        except OSError:
+            full = False
+
+        if full:
+            with open(log_path, 'r') as log_file:
+                generation = log_generation(log_file.readline())
+            tmp_path = log_path + ".tmp"
+            with open(tmp_path, 'w') as tmp_file:
+                tmp_file.write("#" + str(generation + 1) + "\n" + hour + "\n")
+            # The caches reading the log keep it open, and read its last lines before the new log
+            os.rename(tmp_path, log_path)
+            return
+
+        fd = os.open(log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+        try:
+            os.write(fd, hour + "\n")
+        finally:
+            os.close(fd)
+
+
+def log_generation(line):
+    """Returns the generation of a publish log given its first line, 0 for the first log, which has no generation"""
+    if line.startswith("#"):
+        try:
+            return int(line[1:])
+        except ValueError:
+            pass
+    return 0
+
+
+class Flight(object):
+    """A computation of a response, which the requests for the same response wait for
+
+    Attributes:
+        hour (str): The hour the response depends on, None if it depends on every hour
+        stale (bool): True if the hour was published during the computation, in which case the response is not cached
+        value: The response, once computed
+        error (Exception): The exception raised by the computation, if any
+    """
+
+    def __init__(self, hour):
+        self.hour = hour
+        self.stale = False
+        self.value = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class ResponseCache(object):
+    """A LRU cache of responses, with a TTL, invalidated by the publish log
+
+    Attributes:
+        size (int): The maximum number of responses kept
+        ttl (float): The number of seconds a response is kept
+        log_path (str): The path of the publish log
+        log_file (file): The publish log being read, None until it exists
+        inode (int): The inode of the publish log being read, which changes once the log is replaced
+        generation (int): The generation of the publish log being read
+        offset (int): The size of the publish log once its lines were read
+        entries (collections.OrderedDict): (expiry time, hour, response) tuples keyed by request, the least recently
+            used first
+        flights (dict): The responses being computed, keyed by request
+        stats (collections.Counter): The number of hits, misses, coalesced requests, expirations, evictions and
+            invalidations
+    """
+
+    def __init__(self, size=None, ttl=None, log_path=None):
+        """Initializes the cache
+
+        Args:
+            size (int): The maximum number of responses kept, defaults to config.api_cache_size
+            ttl (float): The number of seconds a response is kept, defaults to config.api_cache_ttl
+            log_path (str): The path of the publish log, defaults to config.api_cache_publish_log
+        """
+        self.logger = logging.getLogger(__name__)
+        self.size = config.api_cache_size if size is None else size
+        self.ttl = config.api_cache_ttl if ttl is None else ttl
+        self.log_path = log_path or config.api_cache_publish_log
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.flights = {}
+        self.stats = collections.Counter()
+        # Nothing is cached yet, so the hours published before do not matter
+        self.log_file = None
+        self.inode = None
+        self.generation = None
+        self.offset = 0
+        self.open_log(skip=True)
+
+    def get(self, key, compute, hour=None):
+        """Returns a response, computing it unless it is cached or already being computed
+
+        Args:
+            key (tuple): The request, e.g. the name of the resource and its arguments
+            compute (function): Computes the response
+            hour (str): The hour the response depends on, None if it depends on every hour
+
+        Returns:
+            response: The response
+
+        Raises:
+            Exception: The exception raised by the computation, which is not cached
+        """
+        self.read_log()
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None and entry[0] > time.time():
+                self.entries[key] = entry
+                self.stats['hits'] += 1
+                return entry[2]
+            if entry is not None:
+                self.stats['expirations'] += 1
+
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight(hour)
+                self.stats['misses'] += 1
+            else:
+                self.stats['coalesced'] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+        except Exception as e:
+            flight.error = e
+            raise
+        else:
+            with self.lock:
+                if not flight.stale:
+                    self.entries[key] = (time.time() + self.ttl, hour, flight.value)
+                    while len(self.entries) > self.size:
+                        self.entries.popitem(last=False)
+                        self.stats['evictions'] += 1
+            return flight.value
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+
+    def open_log(self, skip=False):
+        """Opens the publish log, if it exists
+
+        Args:
+            skip (bool): True to skip the lines already in the log, False to read them
+        """
+        try:
+            self.log_file = open(self.log_path, 'r')
+        except IOError:
+            self.log_file = None
+            self.inode = None
+            return
+        stat = os.fstat(self.log_file.fileno())
+        self.inode = stat.st_ino
+        # A new log is renamed into place with its generation already written
+        self.generation = log_generation(self.log_file.readline())
+        self.offset = stat.st_size if skip else 0
+
+    def log_changed(self):
+        """Returns True if lines were appended to the publish log since it was read, or if it was replaced"""
+        try:
+            stat = os.stat(self.log_path)
+        except OSError:
+            return False
+        return stat.st_ino != self.inode or stat.st_size != self.offset
+
+    def read_log(self):
+        """Invalidates the responses depending on the hours published since the publish log was last read"""
+        if not self.log_changed():
+            return
+
+        with self.lock:
+            if self.log_file is None:
+                self.open_log()
+                if self.log_file is None:
+                    return
+
+            try:
+                replaced = os.stat(self.log_path).st_ino != self.inode
+            except OSError:
+                replaced = False
+            # The log is only replaced once nothing is appended to it anymore, so it can be read to its end
+            self.read_lines()
+            if replaced:
+                generation = self.generation
+                self.log_file.close()
+                self.open_log()
+                if self.log_file is None:
+                    return
+                if self.generation != generation + 1:
+                    # The hours published in the logs skipped are unknown
+                    self.logger.warn("Publish logs of '" + self.log_path + "' were skipped, clearing the cache")
+                    self.invalidate_all()
+                self.read_lines()
+
+    def read_lines(self):
+        """Reads the complete lines appended to the publish log since it was read, the lock being held"""
+        size = os.fstat(self.log_file.fileno()).st_size
+        if size < self.offset:
+            # The log was truncated, the hours published since are unknown
+            self.logger.warn("The publish log '" + self.log_path + "' was truncated, clearing the cache")
+            self.offset = 0
+            self.invalidate_all()
+            return
+
+        self.log_file.seek(self.offset)
+        lines = self.log_file.read(size - self.offset)
+        # A line being written is read once it is complete
+        lines = lines[:lines.rfind("\n") + 1]
+        self.offset += len(lines)
+        for hour in set(lines.split()):
+            if not hour.startswith("#"):
+                self.invalidate(hour)
+
+    def invalidate(self, hour):
+        """Drops the responses depending on an hour or on every hour, the lock being held"""
+        for key, entry in self.entries.items():
+            if entry[1] is None or entry[1] == hour:
+                del self.entries[key]
+                self.stats['invalidations'] += 1
+        for flight in self.flights.itervalues():
+            if flight.hour is None or flight.hour == hour:
+                flight.stale = True
+
+    def invalidate_all(self):
+        """Drops every response, the lock being held"""
+        self.stats['invalidations'] += len(self.entries)
+        self.entries.clear()
+        for flight in self.flights.itervalues():
+            flight.stale = True
+
+    def get_stats(self):
+        """Returns the number of hits, misses, coalesced requests, expirations, evictions and invalidations
+
+        Returns:
+            stats (dict): The counts, along with the number of responses cached and the hit rate
+        """
+        self.read_log()
+        with self.lock:
+            stats = dict.fromkeys(['hits', 'misses', 'coalesced', 'expirations', 'evictions', 'invalidations'], 0)
+            stats.update(self.stats)
+            stats['entries'] = len(self.entries)
+            requests = stats['hits'] + stats['misses'] + stats['coalesced']
+            stats['hit_rate'] = float(stats['hits'] + stats['coalesced']) / requests if requests else 0.0
+            return stats
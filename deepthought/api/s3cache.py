@@ -0,0 +1,214 @@
+"""This module keeps local copies of the files of every hour on Amazon S3, for the search API
+
+A cache directory holds the files with a given name, e.g. search.json, of every hour, decompressed, along with
+cache.json, its manifest::
+
+    {
+        <key name>: {
+            "etag": <the ETag of the key>,
+            "size": <the size of the key>,
+            "path": <the path of the local copy, null if there is none>,
+            "local_size": <the size of the local copy>,
+            "used": <the last time the local copy was used>,
+            "new": <true until the key is downloaded, after it was added or changed>
+        },
+        ...
+    }
+
+Syncing the cache lists the keys of the bucket, and only forgets the local copies of the keys whose ETag or size
+changed, or which were deleted. A key is then only downloaded when it is new or changed, and when it is needed.
+
+A cache can also be synced for a range of hours only. The keys are then listed one day at a time, by prefix, and only
+the entries of these hours are updated, so syncing takes as long as the range is, whatever the size of the bucket.
+
+Once the local copies take more than the budget of the cache, the least recently used ones are deleted. They are
+downloaded again if they are needed again.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+from deepthought import config, helpers
+
+
+module_logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "cache.json"
+
+# The number of keys downloaded at once
+DOWNLOAD_BATCH = 32
+
+
+def key_hour(name):
+    """Returns the "DD-MM-YYYY_HH" name of the hour of a key, named <working dir>/<date>/<file name>"""
+    parts = name.split("/")
+    return parts[-2] if len(parts) > 1 else ""
+
+
+class S3Cache(object):
+    """The local copies of the files of every hour with a name
+
+    The cache can be used by several threads at once.
+
+    Attributes:
+        dir_path (str): The path of the cache directory
+        key_name (str): The name of the files, e.g. "search.json"
+        budget (int): The maximum total size in bytes of the local copies
+        entries (dict): The manifest of the cache, keyed by key name
+        keys (dict): The keys listed by the last sync, keyed by name
+    """
+
+    def __init__(self, dir_path, key_name, budget=None):
+        self.dir_path = dir_path
+        self.key_name = key_name
+        self.budget = config.search_cache_budget if budget is None else budget
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.RLock()
+        self.keys = {}
+
+        self.entries = {}
+        manifest_path = os.path.join(dir_path, MANIFEST_NAME)
+        if os.path.isfile(manifest_path):
+            try:
+                with open(manifest_path, 'r') as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                self.logger.warn("Ignoring the unreadable manifest of '" + dir_path + "'")
+
+    def sync(self, dates=None):
+        """Lists the keys of the bucket, and forgets the local copies of the keys which changed or were deleted
+
+        Args:
+            dates (list): The "DD-MM-YYYY_HH" names of the hours to sync, listed by day, None to sync every hour
+
+        Returns:
+            names (list): The names of the keys, sorted, only those of the hours given if any
+        """
+        if dates is None:
+            key_list = helpers.S3Bucket().find_keys(self.key_name)
+        else:
+            dates = set(dates)
+            # The hours of a day are listed at once, in a request or a few
+            prefixes = [helpers.hour_prefix(day) for day in sorted(set(date[:11] for date in dates))]
+            key_list = [key for key in helpers.S3Bucket().find_keys(self.key_name, prefixes)
+                        if key_hour(key.name) in dates]
+
+        with self.lock:
+            listed = dict((key.name, key) for key in key_list)
+            if dates is None:
+                self.keys = listed
+                deleted = set(self.entries) - set(listed)
+            else:
+                synced = set(name for name in set(self.entries) | set(self.keys) if key_hour(name) in dates)
+                for name in synced - set(listed):
+                    self.keys.pop(name, None)
+                self.keys.update(listed)
+                deleted = (synced & set(self.entries)) - set(listed)
+
+            for name in deleted:
+                self.remove_copy(name)
+                del self.entries[name]
+
+            for key in key_list:
+                entry = self.entries.get(key.name)
+                if entry is not None and entry['etag'] == key.etag and entry['size'] == key.size:
+                    continue
+                if entry is not None:
+                    self.remove_copy(key.name)
+                self.entries[key.name] = {'etag': key.etag, 'size': key.size, 'path': None, 'local_size': 0,
+                                          'used': 0, 'new': True}
+            self.save()
+            return sorted(listed)
+
+    def is_new(self, name):
+        """Returns True if a key was added or changed since it was last downloaded"""
+        with self.lock:
+            return self.entries[name]['new']
+
+    def get(self, names):
+        """Returns the local copies of keys, downloading the keys which have none
+
+        Args:
+            names (list): The names of the keys, as listed by the last sync
+
+        Returns:
+            paths (dict): The paths of the local copies, keyed by key name, without the keys which failed to download
+        """
+        with self.lock:
+            missing = [self.keys[name] for name in names if not self.has_copy(name)]
+            for i in xrange(0, len(missing), DOWNLOAD_BATCH):
+                self.download(missing[i:i + DOWNLOAD_BATCH])
+
+            now = time.time()
+            paths = {}
+            for name in names:
+                if self.has_copy(name):
+                    self.entries[name]['used'] = now
+                    paths[name] = self.entries[name]['path']
+
+            self.evict(set(paths))
+            self.save()
+            return paths
+
+    def has_copy(self, name):
+        path = self.entries[name]['path']
+        return path is not None and os.path.isfile(path)
+
+    def download(self, key_list):
+        """Downloads keys and decompresses them"""
+        helpers.S3Bucket.download_async(key_list, self.dir_path)
+        for key in key_list:
+            path = os.path.join(self.dir_path, key.name.replace("/", os.sep))
+            if not os.path.isfile(path):
+                self.logger.error("Download of '" + key.name + "' failed!")
+                continue
+            if path.lower().endswith(".bz2"):
+                path = helpers.decompress_file(path)
+            self.entries[key.name].update({'path': path, 'local_size': os.path.getsize(path), 'new': False})
+
+    def evict(self, needed):
+        """Deletes the least recently used local copies until they fit within the budget
+
+        Args:
+            needed (set): The names of the keys whose local copies are being used, which are never deleted
+        """
+        copies = [name for name in self.entries if self.entries[name]['path'] is not None]
+        total = sum(self.entries[name]['local_size'] for name in copies)
+        if total <= self.budget:
+            return
+
+        for name in sorted(copies, key=lambda name: self.entries[name]['used']):
+            if total <= self.budget:
+                break
+            if name in needed:
+                continue
+            total -= self.entries[name]['local_size']
+            self.remove_copy(name)
+
+        if total > self.budget:
+            self.logger.warn("The files used by a search of '" + self.dir_path + "' do not fit within its budget")
+
+    def remove_copy(self, name):
+        """Deletes the local copy of a key, if any"""
+        entry = self.entries[name]
+        if entry['path'] is not None and os.path.isfile(entry['path']):
+            os.remove(entry['path'])
+            try:
+                # The directory of the hour, unless other files are left in it
+                os.removedirs(os.path.dirname(entry['path']))
+            except OSError:
+                pass
+        entry['path'] = None
+        entry['local_size'] = 0
+
+    def save(self):
+        """Writes the manifest, replacing the previous one at once"""
+        if not os.path.isdir(self.dir_path):
+            os.makedirs(self.dir_path)
+        manifest_path = os.path.join(self.dir_path, MANIFEST_NAME)
+        with open(manifest_path + ".tmp", 'w') as f:
+            json.dump(self.entries, f)
+        os.rename(manifest_path + ".tmp", manifest_path)
@@ -1,94 +1,254 @@
 """This module provides the search functionality for the API module."""
-import calendar
 import collections
-import os
-import shutil
 import threading
+import datetime
 import json
 
-from deepthought import helpers
+from deepthought import config
+from deepthought.api import s3cache
+from deepthought.processing import termseries
+from deepthought.storage import index
 
 
-def search(query):
-    """Searches a list of files to find the frequency of the keyword in tweets over time.
+# The search index, opened by the first search, and the lock serializing the hours added to it
+_index = None
+_index_lock = threading.Lock()
 
-    This is done by first getting the list of files to be searched, with the method :meth:`deepthought.search.get_dates_in_range`.
-    If any of the files are missing, the dates will be omitted.
+# The caches of the files of every hour, keyed by directory
+_caches = {}
+_caches_lock = threading.Lock()
 
-    Then, the corresponding search.txt files of the dates are downloaded and opened one by one. Due to the large file
-    sizes and memory limitations, the search.txt fils are read in chunks of 10MB. The builtin function ``count`` is used
-    to find the frequency of the keyword in the chunk of tweets. This frequency will then be added to an overall counter
-    and added to a dict in the format ``frequency_dict[date] = frequency``.
 
-    However, as the file is read in chunks, there exist a possibility that a keyword is cut off between chunks. For example,
-    the keyword "123" will not be accounted for if the file "123*123***" was read in chunks of ["123*1", "23***"].
-    Our solution is to take the last few letters of the previous chunk and append it to the next chunk. The number of
-    letters is determined by len(query) - 1, which is the worst case scenario for a query to be cut off. Returning to
-    the previous example, the number of letters will be len("123") - 1 = 2. Thus, the last :math:`2` letters of
-    :math:`C_i` will be appended to :math:`C_{i+1}`, where :math:`C_i` is the :math:`i` th chunk and :math:`1 < i < N`
-    where :math:`N` is the total number of chunks. So, the last 2 characters of "123*1": "*1" will be appended to
-    23***": "*123***" when counting the frequency of keywords. In pythonic terms:
+def search(query, resolution=60, start=None, end=None):
+    """Searches the word frequencies of every hour to find the frequency of the keyword in tweets over time.
 
-    .. math:: new\ string = C_{i-1} [-len(query):\ ] + C_{i}
+    The search.json files of the hours on Amazon S3 are first listed with :func:`sync_cache`, and the hours which are
+    not in the search index yet, or which changed, are added to it, see :func:`update_index`. The frequency of the
+    keyword in every hour is then read from its postings in the index, with a binary search in each run of the index,
+    instead of loading the search.json of every hour. The hours in which the keyword was not used have a frequency of 0.
+
+    At a resolution under an hour, the terms.npz files of the hours are searched instead, see
+    :mod:`deepthought.processing.termseries`, and the frequency is given for every <resolution> minutes.
+
+    Given a range of hours, only the keys of these hours are listed, by prefix, and only their files are downloaded,
+    see :func:`hour_range`.
 
     Args:
         query (str): The keyword to find
+        resolution (int): The number of minutes the frequency is counted over, which must divide an hour
+        start (str): The "DD-MM-YYYY_HH" name of the first hour searched, None to search every hour
+        end (str): The "DD-MM-YYYY_HH" name of the last hour searched, None to end with the current hour
+
+    Returns:
+        ordered_freq (collections.OrderedDict): An ordered dict of (time, frequency) values, in chronological order
+
+    Raises:
+        ValueError: If the resolution does not divide an hour, or if the range is not valid
+    """
+    if resolution <= 0 or termseries.MINUTES % resolution:
+        raise ValueError("The resolution must divide an hour")
+    first, last, dates = hour_range(start, end)
+
+    if resolution == termseries.MINUTES:
+        cache, names = sync_cache("search-cache", "search.json", dates)
+        inverted_index = update_index(cache, names_in_range(names, first, last))
+        counts = inverted_index.lookup_many([(query, False)], first, last)[0]
+        return collections.OrderedDict((index.hour_name(hour), counts.get(hour, 0))
+                                       for hour in inverted_index.hour_numbers(first, last))
+
+    rows = {}
+
+    def proc_file(f):
+        series = termseries.TermSeries.load(f)
+        for i, (date, count) in enumerate(series.series(query, resolution).iteritems()):
+            rows[series.start + i * resolution * 60] = (date, count)
+
+    cache, names = sync_cache("terms-cache", "terms.npz", dates)
+    process_files(cache.get(names_in_range(names, first, last)).values(), proc_file)
+
+    ordered_freq = collections.OrderedDict(rows[timestamp] for timestamp in sorted(rows))
+    return ordered_freq
+
+
+def search_many(patterns, resolution=60, start=None, end=None):
+    """Searches the frequency of several keywords at once, over every hour or over a range of hours
+
+    A pattern ending with "*" matches every word starting with the rest of it, e.g. "#ep*" for the hashtags starting
+    with "ep", and the frequencies of these words are summed. The patterns are lowercased, like the words counted.
+
+    All of the patterns are looked up in one pass over the search index, or over the terms.npz of every hour at a
+    resolution under an hour, so comparing many keywords costs about as much as searching one.
+
+    Args:
+        patterns (list): The keywords or prefixes to find
+        resolution (int): The number of minutes the frequency is counted over, which must divide an hour
+        start (str): The "DD-MM-YYYY_HH" name of the first hour searched, None to search every hour
+        end (str): The "DD-MM-YYYY_HH" name of the last hour searched, None to end with the current hour
 
     Returns:
-        ordered_freq (collections.OrderedDict): An ordered dict of (time, frequency) values
+        result (collections.OrderedDict): The patterns under "terms", the dates in increasing order under "dates",
+            and under "counts" a matrix of the frequency of every pattern (columns) at every date (rows)
+
+    Raises:
+        ValueError: If there are no patterns or too many, if a pattern is empty, if the resolution does not divide an
+            hour, or if the range is not valid
     """
+    if resolution <= 0 or termseries.MINUTES % resolution:
+        raise ValueError("The resolution must divide an hour")
+    if not patterns or len(patterns) > config.search_max_terms:
+        raise ValueError("Between 1 and " + str(config.search_max_terms) + " terms must be given")
+
+    queries = []
+    for pattern in patterns:
+        pattern = pattern.strip().lower()
+        prefix = pattern.endswith("*")
+        word = pattern.rstrip("*") if prefix else pattern
+        if not word:
+            raise ValueError("The terms must not be empty")
+        queries.append((word, prefix))
+    first, last, dates = hour_range(start, end)
+
+    result = collections.OrderedDict([('terms', patterns)])
+    if resolution == termseries.MINUTES:
+        cache, names = sync_cache("search-cache", "search.json", dates)
+        inverted_index = update_index(cache, names_in_range(names, first, last))
+        hours = inverted_index.hour_numbers(first, last)
+        counts = inverted_index.lookup_many(queries, first, last)
+        result['dates'] = [index.hour_name(hour) for hour in hours]
+        result['counts'] = [[query_counts.get(hour, 0) for query_counts in counts] for hour in hours]
+        return result
 
-    frequency = []
-
-    # gen_uniq_dir = lambda: os.path.join(config.working_dir, str(uuid.uuid4()))
-    # tmp_dir = gen_uniq_dir()
-    # while os.path.isdir(tmp_dir):
-    # tmp_dir = gen_uniq_dir()
-
-    dir = "search-cache"
-    b = helpers.S3Bucket()
-    kl = b.find_keys("search.json")
-    n = 0
-    if os.path.isdir(dir):
-        for root, dirs, files in os.walk(dir):
-            n += len(files)
-        if n != len(kl):
-            shutil.rmtree(dir)
-            helpers.S3Bucket.download_async(kl, dir)
-    else:
-        os.mkdir(dir)
-        helpers.S3Bucket.download_async(kl, dir)
-
-    def proc_file(f, s):
-        if f.lower().endswith(".bz2"):
-            f = helpers.decompress_file(f)
-        with open(f, 'r') as json_file:
-            freq_dict = json.load(json_file)
-            date = s.split(os.sep)[-1]
-            if query in freq_dict:
-                freq = freq_dict[query]
-            else:
-                freq = 0
-
-            frequency.append({date: freq})
+    rows = {}
 
+    def proc_file(f):
+        series = termseries.TermSeries.load(f)
+        counts = [series.minute_counts(word, prefix).reshape(-1, resolution).sum(axis=1) for word, prefix in queries]
+        for i, date in enumerate(series.dates(resolution)):
+            rows[series.start + i * resolution * 60] = (date, [int(query_counts[i]) for query_counts in counts])
+
+    cache, names = sync_cache("terms-cache", "terms.npz", dates)
+    process_files(cache.get(names_in_range(names, first, last)).values(), proc_file)
+
+    result['dates'] = [rows[timestamp][0] for timestamp in sorted(rows)]
+    result['counts'] = [rows[timestamp][1] for timestamp in sorted(rows)]
+    return result
+
+
+def process_files(paths, proc_file):
+    """Calls a function with every file in its own thread, and waits for all of them"""
     threads = []
-    for subdir, dirs, files in os.walk(dir):
-        for file in files:
-            file_path = os.path.join(subdir, file)
-            t = threading.Thread(target=proc_file, args=(file_path, subdir))
-            t.start()
-            threads.append(t)
+    for file_path in paths:
+        t = threading.Thread(target=proc_file, args=(file_path,))
+        t.start()
+        threads.append(t)
 
     for t in threads:
         t.join()
 
-    frequency_dict = {}
-    for d in frequency:
-        frequency_dict.update(d)
 
-    ordered_freq = collections.OrderedDict(sorted(frequency_dict.items()))
-    return ordered_freq
+def hour_range(start=None, end=None):
+    """Parses the range of hours of a search
+
+    A range with a start but no end ends with the current hour. The hours of a range are listed, so that only their
+    keys are listed and downloaded, one day at a time. A range therefore needs a start, and can span at most
+    config.search_max_days days.
+
+    Args:
+        start (str): The "DD-MM-YYYY_HH" name of the first hour, None for every hour
+        end (str): The "DD-MM-YYYY_HH" name of the last hour, None to end with the current hour
+
+    Returns:
+        (first, last, dates) (tuple): The numbers of the first and last hours, and the names of the hours of the
+            range, all None if no range is given
+
+    Raises:
+        ValueError: If start or end is not the name of an hour, if there is an end but no start, if start is after
+            end, or if the range spans too many days
+    """
+    if start and not end:
+        end = datetime.datetime.now().strftime("%d-%m-%Y_%H")
+    try:
+        first = index.hour_number(start) if start else None
+        last = index.hour_number(end) if end else None
+    except ValueError:
+        raise ValueError("The range must be given as DD-MM-YYYY_HH dates")
+
+    if first is None and last is None:
+        return None, None, None
+    if first is None:
+        raise ValueError("A range with an end must also have a start")
+    if first > last:
+        raise ValueError("The start of the range must not be after its end")
+    if (last - first) // 24 + 1 > config.search_max_days:
+        raise ValueError("The range must span at most " + str(config.search_max_days) + " days")
+    return first, last, get_dates_in_range(start, end)
+
+
+def names_in_range(names, first=None, last=None):
+    """Returns the names of the keys of the hours within [first, last], given as hour numbers
+
+    The keys are named <working dir>/<date>/<file name>, and those whose date is not the name of an hour are left out.
+    """
+    if first is None and last is None:
+        return names
+
+    in_range = []
+    for name in names:
+        try:
+            hour = index.hour_number(s3cache.key_hour(name))
+        except ValueError:
+            continue
+        if (first is None or hour >= first) and (last is None or hour <= last):
+            in_range.append(name)
+    return in_range
+
+
+def update_index(cache, names):
+    """Adds the hours of search.json files of a cache to the search index, unless they are in it already
+
+    Only the files of the hours which are not in the index, or which changed on Amazon S3, are downloaded. The hours
+    analysed by a processor running on the same machine are already in the index, as it adds every hour it analyses.
+
+    Args:
+        cache (s3cache.S3Cache): The synced cache of the search.json files
+        names (list): The names of the keys of the search.json files
+
+    Returns:
+        inverted_index (index.InvertedIndex): The search index
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = index.InvertedIndex()
+
+        indexed = _index.hours()
+        names = [name for name in names if cache.is_new(name) or s3cache.key_hour(name) not in indexed]
+        for name, f in sorted(cache.get(names).iteritems()):
+            with open(f, 'r') as json_file:
+                try:
+                    _index.add_hour(s3cache.key_hour(name), json.load(json_file))
+                except ValueError:
+                    # Not the file of an hour
+                    pass
+    return _index
+
+
+def sync_cache(dir, key_name, dates=None):
+    """Syncs the cache of the files of every hour with a name, see :class:`deepthought.api.s3cache.S3Cache`
+
+    Args:
+        dir (str): The path of the cache directory
+        key_name (str): The name of the files, e.g. "search.json"
+        dates (list): The "DD-MM-YYYY_HH" names of the hours to sync, None to sync every hour
+
+    Returns:
+        (cache, names) (tuple): The cache, and the names of the keys synced, sorted
+    """
+    with _caches_lock:
+        if dir not in _caches:
+            _caches[dir] = s3cache.S3Cache(dir, key_name)
+        cache = _caches[dir]
+    return cache, cache.sync(dates)
 
 
 def get_dates_in_range(start, end):
@@ -96,32 +256,20 @@ def get_dates_in_range(start, end):
 
     Args:
         start (str): The starting date
-        end (str): The ending date
+        end (str): The ending date, included
 
     Returns:
-        date_list (list): The list of dates
+        date_list (list): The list of dates, empty if end is before start
 
     Note:
         All dates are specified in the format "DD-MM-YYYY_HH"
     """
+    curr_date = datetime.datetime.strptime(start, "%d-%m-%Y_%H")
+    end_date = datetime.datetime.strptime(end, "%d-%m-%Y_%H")
+    hour = datetime.timedelta(hours=1)
+
     date_list = []
-    curr_date = ""
-    day, month, year, hour = start[:2], start[3:5], start[6:10], start[-2:]
-    day, month, year, hour = int(day), int(month), int(year), int(hour)
-
-    while curr_date != end:
-        curr_date = "%02d-%02d-%d_%02d" % (day, month, year, hour)
-        date_list.append(curr_date)
-        num_days_in_month = calendar.monthrange(year, month)
-        hour += 1
-        if hour >= 24:
-            hour = 0
-            day += 1
-        if day > num_days_in_month:
-            day = 0
-            month += 1
-        if month > 12:
-            month = 1
-            year += 1
-
-    return date_list
\ No newline at end of file
+    while curr_date <= end_date:
+        date_list.append(curr_date.strftime("%d-%m-%Y_%H"))
+        curr_date += hour
+    return date_list
@@ -1,35 +1,69 @@
 """This module initializes core functions such as logging and starts the threads. It is usually invoked by main.py
 
+The app runs in one of several roles: "all" of the threads, or only the "crawler", the "processor" or the "api". The
+modules of a thread are only imported when a role runs it, so a crawler on its own starts without loading the analysis
+or the web server, and loses fewer tweets whenever it is restarted.
+
 Attributes:
     threads (list): A list of running threads
+    ROLES (tuple): The roles the app can run in
 """
 
 import logging
-import Queue
 
-from deepthought import helpers, console
-from deepthought.processing import processor
-from deepthought.api import api_server
+from deepthought import config, helpers, console
 # List of threads
 threads = {}
 
+ROLES = ("all", "crawler", "processor", "api")
+
 
 class App(object):
-    """Initialize app and start threads"""
+    """Initialize app and start threads
+
+    Attributes:
+        role (str): The role of the app, one of ROLES
+    """
 
-    def __init__(self):
-        """Initializes logging and thread_names"""
+    def __init__(self, role="all"):
+        """Initializes logging and thread_names
+
+        Args:
+            role (str): The role of the app, one of ROLES
+        """
+        if role not in ROLES:
+            raise ValueError("Unknown role '" + role + "'")
         helpers.init_logging()
         self.logger = logging.getLogger(__name__)
+        self.role = role
+
+    def create_threads(self):
+        """Creates the threads of the role, importing their modules
+
+        Returns:
+            threads (dict): The threads, keyed by name
+        """
+        created = {}
+        if self.role in ("all", "processor"):
+            from deepthought.processing import processor
+            # On its own, the processor finds the hours sealed by the crawler process in the working dir
+            poll = config.processor_poll_interval if self.role == "processor" else None
+            created['processor'] = processor.Processor(poll=poll)
+        if self.role in ("all", "crawler"):
+            import crawler
+            # The crawler hands every finished hour to the processor through the processor's queue
+            sealed_queue = created['processor'].queue if 'processor' in created else None
+            created['crawler'] = crawler.Crawler(sealed_queue=sealed_queue)
+        if self.role in ("all", "api"):
+            from deepthought.api import api_server
+            created['api'] = api_server.APIServer()
+        return created
 
-    @staticmethod
-    def start():
-        """Starts all the threads with required variables"""
+    def start(self):
+        """Starts the threads of the role with required variables"""
 
         # Init threads to be started
-        global threads
-        threads['processor'] = processor.Processor()
-        threads['api'] = api_server.APIServer()
+        threads.update(self.create_threads())
         console_thread = console.Console()
 
         # Start the threads
@@ -37,4 +71,4 @@ class App(object):
             thread.start()
 
         # Starts console thread
-        console_thread.run()
\ No newline at end of file
+        console_thread.run()
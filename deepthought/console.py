@@ -5,9 +5,6 @@ import time
 import os
 import pprint
 
-from deepthought.processing import analyser
-from deepthought.api import api_server
-
 
 class Console(cmd.Cmd):
     """Start threads and allow users to interact with them
@@ -89,6 +86,10 @@ class Console(cmd.Cmd):
         Args:
             line (str): Arguments that might have been inputted by the user
         """
+        if 'crawler' not in self.threads:
+            print "The crawler is not running"
+            return
+
         status = self.threads['crawler'].status
         self.pp.pprint(status)
 
@@ -97,12 +98,56 @@ class Console(cmd.Cmd):
         """Help message for crawler command"""
         print 'crawler\nDisplays the current status of the crawler'
 
+    def do_tps(self, line):
+        """Displays the TPS of the crawler over the last seconds
+
+        Args:
+            line (str): The number of seconds to display, defaults to 60
+        """
+        if 'crawler' not in self.threads:
+            print "The crawler is not running"
+            return
+
+        try:
+            seconds = int(line) if line else 60
+        except ValueError:
+            print "Please provide the number of seconds to display"
+            return
+
+        history = self.threads['crawler'].clock.history.last(seconds)
+        for timestamp, tps in history:
+            print time.strftime('%H:%M:%S', time.localtime(timestamp)), tps
+
+    @staticmethod
+    def help_tps():
+        """Help message for tps command"""
+        print 'tps [seconds]\nDisplays the TPS of the crawler over the last seconds, up to an hour'
+
+    def do_spikes(self, line):
+        """Displays the spikes found by the crawler in real time
+
+        Args:
+            line (str): Arguments that might have been inputted by the user
+        """
+        if 'crawler' not in self.threads:
+            print "The crawler is not running"
+            return
+
+        self.pp.pprint(self.threads['crawler'].detector.recent())
+
+    @staticmethod
+    def help_spikes():
+        """Help message for spikes command"""
+        print 'spikes\nDisplays the spikes found by the crawler in real time, with the top words at the time'
+
     def do_analyse(self, file_path):
-        """Analyses a given dir (containing tweets.csv and tps.csv)
+        """Analyses a given dir (containing the tweets and tps.csv)
 
         Args:
             file_path (str): The file path to the dir to be analysed
         """
+        from deepthought.processing import analyser
+
         try:
             a = analyser.Analyser()
             a.analyse(file_path)
@@ -123,6 +168,8 @@ class Console(cmd.Cmd):
         print "analyse <file_path>\n Analyses provided files"
 
     def do_api(self, command):
+        from deepthought.api import api_server
+
         if (command == "stop" and "api" not in self.threads.keys()) or \
                 (command == "start" and "api" in self.threads.keys()):
             self.logger.error("API not running!" if command == "stop" else "API already running!")
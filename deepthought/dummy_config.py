@@ -10,12 +10,60 @@ Attributes:
     bucket_name (str): Name to use for the main bucket when storing files on Amazon S3 Servers
     log_dir (str): Directory where log files are stored
     working_dir (str): Directory where tmp files are stored
+    writer_queue_size (int): The maximum number of tweets waiting to be written before the crawler blocks
+    writer_batch_size (int): The maximum number of tweets written to disk in one batch
+    writer_flush_interval (float): The maximum number of seconds a tweet waits before it is written to disk
+    writer_fsync (str): When tweets.seg is fsynced: "never", after every "batch", or when the crawler "rotate"s dirs
+    segment_index_interval (int): The number of tweets between entries in the timestamp index of tweets.seg
+    writer_compress (bool): If True, tweets are written compressed to tweets.segz instead of tweets.seg
+    frame_size (int): The uncompressed size in bytes of each independently compressed frame of tweets.segz, with the
+        "batch" fsync policy a frame is also written at the end of every batch
+    frame_compression_level (int): The zlib compression level of the frames, 1 is the fastest
+    tps_history (int): The number of seconds of TPS kept in memory by the crawler
+    tps_flush_interval (int): The number of seconds of TPS batched before they are written to tps.csv
     ema_length (int): Length of EMA sample size in seconds
     growth_length (int): Refer to Analyser documentations (in seconds)
     spike_threshold (int): A arbitrary threshold for growth. If the growth is above this threshold, it is considered a spike.
     spike_contents_sample_size (int): An arbitrary value that 'defines' the duration of a spike
+    live_window (int): The number of seconds of words kept by the crawler to capture the contents of a live spike
+    live_events (int): The number of live spikes kept by the crawler
+    processor_workers (int): The number of processes analysing hours at once, 0 for one per core
+    processor_memory_limit (int): The total size in bytes of the hours being analysed at once, which bounds the memory
+        used by the analyses. An hour larger than this is still analysed, on its own.
+    processor_chunk_size (int): The size in bytes of the records above which an hour is split into chunks analysed in
+        parallel, 0 to never split hours
+    processor_poll_interval (float): The number of seconds between two scans of the working dir for sealed hours, when
+        the processor runs without the crawler
+    processor_seal_delay (float): The number of seconds after the end of an hour before a processor running without the
+        crawler analyses it, which leaves time for the crawler to seal it
+    word_frequency_mode (str): How the words of an hour are counted: "exact"ly, or in a bounded-memory "sketch"
+    sketch_capacity (int): The number of words kept by the sketch, whose counts are then within total words / capacity
+    topics_model_dir (str): Directory where the topic model shared by every hour is checkpointed
+    topics_num (int): The number of topics of the topic model
+    topics_vocabulary_size (int): The number of words of the topic model, chosen from the first hour it is built from
+    topics_vectorizer (str): How words are mapped to the terms of the topic model, "dictionary" to keep the
+        topics_vocabulary_size words of the first hour, or "hashing" to hash every word to topics_hash_size terms
+    topics_min_documents (int): The number of documents an hour needs for the topic model to be created from it, the
+        hours analysed before then have no topics
+    topics_hash_size (int): The number of terms of the topic model when topics_vectorizer is "hashing"
+    topics_decay (float): The weight of the previous hours relative to a new hour when the topic model is updated
+    topics_per_hour (int): The number of topics written to the .topics file of every hour
     api_port (int): The port for the API server to run on
     api_base_url (str): The url for the API server
+    api_cache_size (int): The maximum number of responses kept in the response cache of the API
+    api_cache_ttl (int): The number of seconds a response is kept in the response cache of the API
+    api_cache_publish_log (str): File the processor appends the name of every hour it publishes to, which invalidates
+        the responses cached by the API
+    api_cache_log_size (int): The size in bytes of the publish log at which it is replaced by a new one
+    search_index_dir (str): Directory of the inverted index of the word frequencies of every hour, used by the search API
+    search_index_fanout (int): The number of runs of the search index merged together once they have the same level
+    search_cache_budget (int): The maximum size in bytes of the files of every hour kept in each cache of the search API
+    search_max_terms (int): The maximum number of terms of a batch search
+    search_max_days (int): The maximum number of days of the range of hours of a search, listed one day at a time
+    stats_store_dir (str): Directory of the local store of the stats of every hour, read by the API
+    stats_store_ttl (int): The number of seconds after which the stats of an hour loaded from Amazon S3 by the API are
+        checked against Amazon S3 again
+    DEV_MODE (bool): If True, analysed hours are kept locally instead of being uploaded to Amazon S3
 """
 
 # ------- Twitter's API credentials  ------- #
@@ -33,12 +81,67 @@ bucket_name = "twitter-deepthought"
 log_dir = "logs/"
 working_dir = "thinking"
 
+# ------- Crawler writer settings ------- #
+writer_queue_size = 10000
+writer_batch_size = 500
+writer_flush_interval = 1.0
+writer_fsync = "rotate"
+segment_index_interval = 1000
+writer_compress = False
+frame_size = 256 * 1024
+frame_compression_level = 1
+
+# ------- Crawler metrics settings ------- #
+tps_history = 60 * 60
+tps_flush_interval = 10
+
 # ------- Spike detection settings ------- #
 ema_length = 15
 growth_length = 10
 spike_threshold = 1.3
 spike_contents_sample_size = 60 * 5
+live_window = 60
+live_events = 100
+
+# ------- Processor settings ------- #
+processor_workers = 0
+processor_memory_limit = 2 * 1024 * 1024 * 1024
+processor_chunk_size = 64 * 1024 * 1024
+processor_poll_interval = 60
+processor_seal_delay = 5 * 60
+
+# ------- Word frequency settings ------- #
+word_frequency_mode = "exact"
+sketch_capacity = 50000
+
+# ------- Topic model settings ------- #
+topics_model_dir = "topics-model"
+topics_num = 200
+topics_vocabulary_size = 50000
+topics_vectorizer = "hashing"
+topics_hash_size = 2 ** 16
+topics_min_documents = 10000
+topics_decay = 0.9
+topics_per_hour = 10
 
 # ------- API webservice settings  ------- #
 api_port = 8000
-api_base_url = "/api/"
\ No newline at end of file
+api_base_url = "/api/"
+api_cache_size = 256
+api_cache_ttl = 300
+api_cache_publish_log = "published.log"
+api_cache_log_size = 64 * 1024
+
+# ------- Search settings ------- #
+search_index_dir = "search-index"
+search_index_fanout = 8
+search_cache_budget = 2 * 1024 * 1024 * 1024
+search_max_terms = 100
+search_max_days = 92
+
+# ------- Stats store settings ------- #
+stats_store_dir = "stats-store"
+stats_store_ttl = 15 * 60
+
+# ------- Development settings ------- #
+DEV_MODE = False
@@ -1,15 +1,15 @@
-"""This module provides helper functions for other modules"""
+"""This module provides helper functions for other modules
+
+boto is only imported once Amazon S3 is used, so that the roles which never use it start faster.
+"""
 
 import logging
+import logging.handlers
 import bz2
 import os
 import shutil
 import threading
 
-from boto.s3.connection import S3Connection, Location
-from boto.s3.key import Key
-from boto.exception import BotoClientError, BotoServerError
-
 import config
 
 
@@ -77,6 +77,8 @@ class S3Bucket(object):
         if bucket_name is None:
             bucket_name = config.bucket_name
 
+        from boto.s3.connection import S3Connection, Location
+
         # Authenticate with Amazon S3
         self.logger.debug("Authenticating with Amazon S3")
         self.conn = S3Connection(config.boto_access, config.boto_secret)
@@ -99,15 +101,24 @@ class S3Bucket(object):
         self.logger.debug("Accessing bucket '" + bucket_name + "'")
         self.bucket = self.conn.get_bucket(bucket_name)
 
-    def list_keys(self):
+    def list_keys(self, prefixes=None):
         """List the keys in the bucket, sorted by the last modified date
 
+        Args:
+            prefixes (list): Only list the keys starting with one of these prefixes, with one request per prefix
+                instead of listing the whole bucket
+
         Returns
             key_list (list): The list of keys
         """
-        self.logger.debug("Listing keys in bucket '" + self.bucket.name + "'")
+        if prefixes is None:
+            self.logger.debug("Listing keys in bucket '" + self.bucket.name + "'")
+            key_list = list(self.bucket.list())
+        else:
+            self.logger.debug("Listing keys in bucket '" + self.bucket.name + "' under " + str(len(prefixes)) +
+                              " prefixes")
+            key_list = [key for prefix in prefixes for key in self.bucket.list(prefix=prefix)]
 
-        key_list = list(self.bucket.list())
         key_list.sort(key=lambda x: x.last_modified)
         return key_list
 
@@ -126,10 +137,19 @@ class S3Bucket(object):
                 return key
         return None
 
-    def find_keys(self, key_name):
+    def find_keys(self, key_name, prefixes=None):
+        """Find the keys in the bucket whose name contains a string
+
+        Args:
+            key_name (str): The string to be searched for
+            prefixes (list): Only search the keys starting with one of these prefixes, see :meth:`list_keys`
+
+        Returns:
+            key_list (list): The keys found
+        """
         self.logger.debug("Finding all keys with name of '" + key_name + "'")
         key_list = list()
-        for key in self.list_keys():
+        for key in self.list_keys(prefixes):
             if key_name in key.name:
                 key_list.append(key)
         return key_list
@@ -142,6 +162,9 @@ class S3Bucket(object):
             file_path (str): Path of the file to be uploaded
             key_name (str): The name of the key to upload the file as, defaults to the file path
         """
+        from boto.s3.key import Key
+        from boto.exception import BotoClientError, BotoServerError
+
         if key_name is None:
             key_name = file_path
 
@@ -196,16 +219,34 @@ class S3Bucket(object):
             thread.join()
 
 
+def hour_prefix(date):
+    """Returns the prefix of the keys of the files of an hour, or of the hours of a day
+
+    The files of an hour are uploaded by :func:`upload_dir` as <working dir>/<DD-MM-YYYY_HH>/<file name>.
+
+    Args:
+        date (str): The "DD-MM-YYYY_HH" name of the hour, or the "DD-MM-YYYY_" prefix of the hours of a day
+
+    Returns:
+        prefix (str): The prefix of the keys
+    """
+    prefix = os.path.join(config.working_dir, date).replace("\\", "/")
+    return prefix if date.endswith("_") else prefix + "/"
+
+
 def upload_dir(dir_path):
     """Upload a directory to Amazon S3
 
     This function iterates over the files in the directory, compresses them, then uploads them individually to the server.
+    Compressed segments written by the crawler are uploaded as they are.
 
     Then, the directory is deleted to save space.
 
     Args:
         dir_path (str): The path to the directory to be uploaded
     """
+    from boto.exception import BotoClientError, BotoServerError
+
     module_logger.debug("Processing dir '" + dir_path + "'")
 
     bucket = S3Bucket()
@@ -214,8 +255,9 @@ def upload_dir(dir_path):
             # Get the file path of current file
             file_path = os.path.join(root, name)
 
-            # Compress the file
-            file_path = compress_file(file_path)
+            # Compress the file, unless it was already compressed when it was written
+            if not file_path.endswith((".segz", ".npz")):
+                file_path = compress_file(file_path)
 
             # Upload the file
             try:
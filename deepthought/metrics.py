@@ -0,0 +1,170 @@
+"""This module keeps track of the crawler's tweets per second
+
+A single long-lived :class:`MetricsClock` snapshots an :class:`AtomicCounter` every second into a fixed-size
+:class:`RingBuffer`, so the recent TPS history can be queried without touching the disk.
+"""
+
+import time
+import logging
+import threading
+
+from deepthought import config
+
+
+class AtomicCounter(object):
+    """A counter which can be incremented and read-and-reset from different threads without losing counts"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def increment(self, n=1):
+        """Increments the counter
+
+        Args:
+            n (int): The amount to increment by
+        """
+        with self.lock:
+            self.value += n
+
+    def swap(self):
+        """Resets the counter to 0
+
+        Returns:
+            value (int): The value of the counter before it was reset
+        """
+        with self.lock:
+            value, self.value = self.value, 0
+        return value
+
+
+class RingBuffer(object):
+    """A fixed-size buffer of (timestamp, value) pairs, where the oldest pairs are overwritten first
+
+    Attributes:
+        size (int): The maximum number of pairs kept
+        count (int): The total number of pairs appended
+    """
+
+    def __init__(self, size):
+        """Initializes the buffer
+
+        Args:
+            size (int): The maximum number of pairs kept
+        """
+        self.size = size
+        self.timestamps = [0] * size
+        self.values = [0] * size
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def append(self, timestamp, value):
+        """Appends a pair, overwriting the oldest one if the buffer is full"""
+        with self.lock:
+            i = self.count % self.size
+            self.timestamps[i] = timestamp
+            self.values[i] = value
+            self.count += 1
+
+    def last(self, n=None):
+        """Returns the most recent pairs
+
+        Args:
+            n (int): The number of pairs to return, defaults to all of the pairs kept
+
+        Returns:
+            pairs (list): A list of (timestamp, value) tuples, from the oldest to the newest
+        """
+        with self.lock:
+            available = min(self.count, self.size)
+            n = available if n is None else max(min(n, available), 0)
+            start = self.count - n
+            return [(self.timestamps[i % self.size], self.values[i % self.size]) for i in xrange(start, self.count)]
+
+
+class MetricsClock(threading.Thread):
+    """Ticks once a second, recording the number of tweets counted since the last tick
+
+    Every tick is appended to the history and passed on to the listeners. The ticks are also written to tps.csv in
+    batches through the crawler's writer.
+
+    Attributes:
+        counter (AtomicCounter): The counter incremented for every tweet
+        writer (TweetWriter): The writer which the ticks are handed to in batches
+        history (RingBuffer): The TPS of each of the last <config.tps_history> seconds
+        listeners (list): Functions called with (timestamp, tps) on every tick
+        flush_interval (int): The number of ticks batched before they are handed to the writer
+        logger (logging.Logger): Logger used for logging
+    """
+
+    def __init__(self, counter, writer):
+        """Initializes the clock
+
+        Args:
+            counter (AtomicCounter): The counter incremented for every tweet
+            writer (TweetWriter): The writer which the ticks are handed to
+        """
+        super(MetricsClock, self).__init__()
+        self.daemon = True
+
+        self.counter = counter
+        self.writer = writer
+        self.history = RingBuffer(config.tps_history)
+        self.listeners = []
+        self.flush_interval = config.tps_flush_interval
+
+        self.pending = []
+        self.pending_lock = threading.Lock()
+        # Held while ticks are handed to the writer, so the crawler can rotate the writer in between
+        self.flush_lock = threading.RLock()
+        self.stopped = threading.Event()
+
+        self.logger = logging.getLogger(__name__)
+
+    def run(self):
+        """Main loop of the clock
+
+        The ticks are scheduled on whole seconds from the start, so the clock does not drift when a tick takes longer.
+        """
+        self.logger.debug("Metrics clock started")
+        next_tick = time.time() + 1
+        while not self.stopped.wait(max(next_tick - time.time(), 0)):
+            self.tick(next_tick)
+
+            # If the clock has fallen behind, the counts of the missed seconds are part of the next tick
+            next_tick += 1
+            while next_tick < time.time():
+                next_tick += 1
+
+    def tick(self, timestamp):
+        """Records the tweets counted since the last tick
+
+        Args:
+            timestamp (float): The time of the tick
+        """
+        tps = self.counter.swap()
+        self.history.append(timestamp, tps)
+
+        with self.pending_lock:
+            self.pending.append({'timestamp': timestamp, 'tps': tps})
+            full = len(self.pending) >= self.flush_interval
+        if full:
+            self.flush()
+
+        for listener in self.listeners:
+            listener(timestamp, tps)
+
+    def flush(self):
+        """Hands the ticks recorded so far to the writer"""
+        with self.flush_lock:
+            with self.pending_lock:
+                rows, self.pending = self.pending, []
+            if rows:
+                self.writer.put_tps(rows)
+
+    def stop(self):
+        """Stops the clock and hands the remaining ticks to the writer"""
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+        self.flush()
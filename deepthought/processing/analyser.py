@@ -1,91 +1,220 @@
-"""This module analyses tweets.csv and tps.csv files"""
+"""This module analyses the tweets and tps.csv files"""
 
 from __future__ import division
-import json
 import collections
 import csv
 import os
+import time
 import logging
 
-from nltk.corpus import stopwords
+import numpy as np
 
 from deepthought import config
-from langprocess import LanguageProcesser
+from deepthought.storage import reader
+from deepthought.processing import manifest, stages, timeseries
+
+# The version of the analysis as a whole, changing it analyses every hour again
+VERSION = 1
+
+# The version of the spike detection, changing it detects the spikes of every hour again
+SPIKES_VERSION = 1
+SPIKES_OUTPUTS = ["ema.csv", "growth.csv", "spikes.csv"]
+
+
+def spikes_settings():
+    """Returns the config settings that the spikes depend on"""
+    return {
+        'ema_length': config.ema_length,
+        'growth_length': config.growth_length,
+        'spike_threshold': config.spike_threshold,
+        'spike_contents_sample_size': config.spike_contents_sample_size
+    }
+
 
 class Analyser(object):
-    """Analyses tweets.csv and tps.csv and saves the result for later use
+    """Analyses the tweets and tps.csv and saves the result for later use
 
     Attributes:
         dir_path (str): The path of the directory containing the files to be analysed
-        tweets_f (file): The tweets file to be analysed
+        records (reader.Reader): Reader of the projected records of the tweets to be analysed
         tps_f (file): The tps file to be analysed
+        spikes (collections.OrderedDict): The timestamp of every spike, and the top words used during it
+        stages (list): The stages which every record of the hour is fed to, see :mod:`deepthought.processing.stages`
+        chunk (int): The index of the chunk of the hour being analysed by :meth:`analyse_chunk`, None for a whole hour
+        manifest (manifest.Manifest): What was already analysed in the hour, see :mod:`deepthought.processing.manifest`
     """
 
     def __init__(self):
-        """Initializes the analyser"""
+        """Initializes the analyser with the default stages"""
         # Initialize logger
         self.logger = logging.getLogger(__name__)
 
         self.dir_path = ""
-        self.tweets_f = None
+        self.records = None
         self.tps_f = None
+        self.spikes = collections.OrderedDict()
+        self.stages = stages.default_stages()
+        self.chunk = None
+        self.manifest = None
 
-    def analyse(self, dir_path):
+    def register_stage(self, stage):
+        """Adds a stage to the analysis
+
+        Args:
+            stage (stages.Stage): The stage, which will be fed every record of the hour along with the other stages
+        """
+        self.stages.append(stage)
+
+    def analyse(self, dir_path, chunk_stages=None):
         """Starts analysis of the files
 
+        Only the steps which are not up to date in the manifest of the hour are run, see :meth:`load_manifest`.
+
         Args:
             dir_path (str): The path of the directory containing the files to be analysed
+            chunk_stages (list): If the records of the hour were fed to the stages chunk by chunk with
+                :meth:`analyse_chunk`, the stages returned for every chunk, in order. They are merged instead of the
+                records being fed again.
         """
         self.dir_path = dir_path
 
         # Get the file path to the files
-        tweets_f_path = os.path.join(self.dir_path, "tweets.csv")
         tps_f_path = os.path.join(self.dir_path, "tps.csv")
 
         # Check if the files actually exist
-        if not (os.path.isfile(tweets_f_path) and os.path.isfile(tps_f_path)):
+        if not (reader.has_tweets(self.dir_path) and os.path.isfile(tps_f_path)):
             # Else, raise and exception
             self.logger.error("Invalid file path")
             raise ValueError("Invalid file path")
 
+        spikes_current = self.load_manifest()
+        if spikes_current and not self.stages:
+            self.logger.info("Dir '" + self.dir_path + "' is up to date")
+            return
+
         # Open the files for reading
-        self.tweets_f = open(tweets_f_path, 'rb')
+        start = time.time()
+        self.records = reader.open_records(self.dir_path)
         self.tps_f = open(tps_f_path, 'rb')
 
         self.logger.info("Starting analysing of dir '" + self.dir_path + "'")
 
-        # Generate dict containing the frequency of words
-        self.gen_freq_dict()
+        if not spikes_current:
+            # Run spike detection function, which only needs the tps file
+            spikes_start = time.time()
+            self.find_spikes()
+
+            # Find what the tweets were about during the spikes, reading only the tweets during the spikes
+            self.find_spike_contents()
+            self.write_stat("spikes", self.spikes)
+            self.manifest.record("spikes", SPIKES_VERSION, spikes_settings(), SPIKES_OUTPUTS,
+                                 time.time() - spikes_start)
 
-        # Run spike detection function
-        self.find_spikes()
+        # Decode the tweets once, feeding them to every stage
+        if chunk_stages is None:
+            self.run_stages()
+        else:
+            self.merge_stages(chunk_stages)
 
-        #Run keyword generation
-        LanguageProceser(tweets_f_path)
+        self.records.close()
+        self.tps_f.close()
 
+        self.manifest.data['seconds'] = time.time() - start
+        self.manifest.save()
         self.logger.info("Analysing done for '" + dir_path + "'")
 
-    def gen_freq_dict(self):
-        tweets_reader = csv.DictReader(self.tweets_f)
-        tweets = ""
+    def load_manifest(self):
+        """Loads the manifest of the hour, and leaves out the stages which are up to date
+
+        Returns:
+            bool: True if the spikes are up to date
+        """
+        self.manifest = manifest.Manifest.load(self.dir_path)
+        self.manifest.check(VERSION, manifest.input_sizes(self.dir_path))
+        self.stages = [stage for stage in self.stages
+                       if not self.manifest.is_current(stage.name, stage.version, stage.settings(), stage.outputs())]
+        return self.manifest.is_current("spikes", SPIKES_VERSION, spikes_settings(), SPIKES_OUTPUTS)
+
+    def up_to_date(self, dir_path):
+        """Checks if every step of the analysis of an hour is up to date, without analysing it
+
+        Args:
+            dir_path (str): The path of the directory of the hour
+
+        Returns:
+            bool: True if there is nothing to analyse
+        """
+        self.dir_path = dir_path
+        return self.load_manifest() and not self.stages
+
+    def run_stages(self):
+        """Reads the records of the hour once, feeding each of them to every stage in turn"""
+        for stage in self.stages:
+            stage.start(self)
+
+        if self.stages:
+            start = time.time()
+            feeds = [stage.feed for stage in self.stages]
+            for timestamp, record in self.records.read():
+                for feed in feeds:
+                    feed(timestamp, record)
+            self.manifest.data['read_seconds'] = time.time() - start
+
+        self.finish_stages()
+
+    def finish_stages(self):
+        """Writes the results of every stage, recording them in the manifest"""
+        for stage in self.stages:
+            self.logger.debug("Finishing stage '" + stage.name + "' for '" + self.dir_path + "'")
+            start = time.time()
+            stage.finish(self)
+            self.manifest.record(stage.name, stage.version, stage.settings(), stage.outputs(), time.time() - start)
+
+    def analyse_chunk(self, dir_path, start, end, chunk):
+        """Feeds the records of a chunk of the hour to the stages, without writing their results
 
-        # Concat each tweets' text
-        for tweet in tweets_reader:
-            tweets += json.loads(tweet['tweet'])['text'] + " "
+        Args:
+            dir_path (str): The path of the directory of the hour
+            start (float): The timestamp of the first record of the chunk, None for the first chunk
+            end (float): The timestamp after the last record of the chunk, None for the last chunk
+            chunk (int): The index of the chunk
 
-        # Some processing of the tweets
-        tweets = tweets.encode("utf-8", errors="replace")
-        tweets = tweets.lower()
-        tweets = tweets.split()
-        stop_words = set(stopwords.words("english"))
-        stop_words.update(["rt", "#"])
-        tweets = [word for word in tweets if word not in stop_words]
+        Returns:
+            stages (list): The stages which are not up to date, to be merged with those of the other chunks by
+                :meth:`analyse`
+        """
+        self.dir_path = dir_path
+        self.chunk = chunk
+        self.load_manifest()
+        self.records = reader.open_records(self.dir_path)
+        try:
+            for stage in self.stages:
+                stage.start(self)
+
+            feeds = [stage.feed for stage in self.stages]
+            if feeds:
+                for timestamp, record in self.records.read(start, end):
+                    for feed in feeds:
+                        feed(timestamp, record)
+
+            for stage in self.stages:
+                stage.partial(self)
+        finally:
+            self.records.close()
+        return self.stages
+
+    def merge_stages(self, chunk_stages):
+        """Merges the stages of every chunk of the hour in order, then writes their results
 
-        freq_dict = collections.Counter(tweets)
-        search_fp = os.path.join(self.dir_path, "search.json")
-        search_file = open(search_fp, "w")
-        json.dump(freq_dict, search_file)
+        Args:
+            chunk_stages (list): The stages returned by :meth:`analyse_chunk` for every chunk, in order
+        """
+        self.stages = chunk_stages[0]
+        for other_stages in chunk_stages[1:]:
+            for stage, other in zip(self.stages, other_stages):
+                stage.merge(other)
 
+        self.finish_stages()
 
     def find_spikes(self):
         """Find if any spikes occurred with the given tps file
@@ -100,116 +229,105 @@ class Analyser(object):
         The growth of the EMA is calculated using the formula (current - previous) / previous.
         It is essentially a percentage increase of the EMA
         """
-        # Load the TPS data from the file into a dict
-        tps_reader = csv.reader(self.tps_f)
-        tps_dict = dict(filter(None, tps_reader))
-
-        # Convert the timestamps from strings to integers
-        tps_dict.pop("timestamp", None)
-        tps_dict = {int(float(k)): int(v) for k, v in tps_dict.items()}
-
-        # Initialize variables for analysis
-        ema = []  # A list is used for storing EMA as we want a stack-like behaviour
-        growth = {}
-        spikes = {}
+        # Load the TPS data from the file into sorted arrays
+        series = timeseries.TPSSeries.from_csv([self.tps_f])
 
         # Arbitrary values to check for spikes, defined in the config
-        ema_length = config.ema_length
-        growth_length = config.growth_length
-        spike_threshold = config.spike_threshold
-
-        # Calculate the constant 'k', to be used later when calculating the EMA
-        k = 2 / (ema_length + 1)
-
-        # Go through each tps value with a counter i (in seconds), which is used for calculating EMA
-        for i, (timestamp, tps) in enumerate(tps_dict.iteritems()):
-            # As calculating EMA requires a list of values, the first EMA value to be calculated
-            # would be when there are enough values to calculate the EMA, which is defined by ema_length
-            # This checks if the length has been reached (when i equals the length)
-            if i == ema_length:
-                # The first EMA value is the average of the list of values
-                avg = sum(tps_dict.values()[:ema_length]) / ema_length
-                ema.append({timestamp: avg})
-            elif i > ema_length:  # For subsequent EMA values, a different formula is used
-                # Get the previous EMA value (i-1)
-                last_ema = ema[-1].values()[0]
-
-                # Use the EMA formula to calculate the EMA
-                current_ema = tps * k + last_ema * (1 - k)
-                ema.append({timestamp: current_ema})
-
-            # The growth of the EMA is calculated relative to previous values of EMA
-            # Thus, this checks if there are enough EMA values to calculate this growth
-            # (When there are <growth_length> number of EMA values)
-            if i >= ema_length + growth_length:
-                # Get the current EMA value, which is also the most recent value in the stack
-                current_ema = ema[-1].values()[0]
-
-                # Get the EMA value <growth_length> seconds before
-                prev_ema = ema[-(1 + growth_length)].values()[0]
-
-                # Calculates the growth with the formula (current-previous)/previous
-                # Which is the percentage increase in EMA
-                current_growth = (current_ema - prev_ema) / prev_ema
-                growth[timestamp] = current_growth
-
-                # Check if the growth has exceeded the threshold for it to be considered a spike
-                if current_growth >= spike_threshold:
-                    self.logger.info("Spike found at " + str(timestamp))
-
-                    # Add timestamp and contents of the spike to the list
-                    spikes[timestamp] = self.find_spike_contents(timestamp)
+        # The EMA, growth and spikes are calculated over the whole series at once, see the timeseries module
+        ema, growth, spikes = series.spikes(config.ema_length, config.growth_length, config.spike_threshold)
+        for timestamp in spikes:
+            self.logger.info("Spike found at " + str(timestamp))
 
+        # Only keep the values which are defined, as there are not enough values at the start to calculate them
         stats = {
-            # Combine the stack(list) of dicts into one big OrderedDict
-            "ema": collections.OrderedDict((k, v) for d in ema for (k, v) in d.items()),
-
-            # Sort the dict of values and store it in an OrderedDict
-            "growth": collections.OrderedDict(sorted(growth.items())),
-            "spikes": collections.OrderedDict(sorted(spikes.items()))
+            "ema": self.to_ordered_dict(series.timestamps, ema),
+            "growth": self.to_ordered_dict(series.timestamps, growth)
         }
 
+        # Add timestamp of the spikes to the list, their contents are found later by find_spike_contents
+        self.spikes = collections.OrderedDict((int(timestamp), []) for timestamp in spikes)
+
         # Dump the stats to their respective csv files
         for (stat, values) in stats.iteritems():
-            with open(os.path.join(self.dir_path, stat + ".csv"), 'w') as f:
-                field_names = ['timestamp', stat]
-                writer = csv.DictWriter(f, fieldnames=field_names)
-                writer.writeheader()
-                for timestamp, value in values.iteritems():
-                    writer.writerow({'timestamp': timestamp, stat: value})
+            self.write_stat(stat, values)
 
-    def find_spike_contents(self, timestamp):
-        """Given the timestamp of a spike, find what the tweets contained during the spike
+    @staticmethod
+    def to_ordered_dict(timestamps, values):
+        """Converts arrays of a stat into an OrderedDict, leaving out the timestamps where it is not defined
 
         Args:
-            timestamp (int): Timestamp of the spike
+            timestamps (numpy.ndarray): The timestamps
+            values (numpy.ndarray): The value of the stat at each timestamp, NaN where it is not defined
 
         Returns:
-            Returns the top 5 words used in tweets during the spike
+            values (collections.OrderedDict): The value of the stat at each timestamp
         """
-        # Open the tweets file for reading
-        tweets_reader = csv.DictReader(self.tweets_f)
-
-        # This is a string to store all the contents of tweets that happened during the spike
-        spike_tweets_text = ""
-
-        # Go through each tweet in the file
-        for tweet in tweets_reader:
-            # Get the timestamp of this tweet
-            tweet_timestamp = int(float(tweet['timestamp']))
-
-            # We check if this tweets falls into the range where the spike happened
-            # spike_contents_sample_size is an arbitrary value that 'defines' the duration of a spike
-            # If a tweet happen to fall within this duration, it interests us
-            if timestamp <= tweet_timestamp <= timestamp + config.spike_contents_sample_size:
-                tweet_text = json.loads(tweet['tweet'])['text']
-                spike_tweets_text += tweet_text
-
-            # If this tweet falls outside of the range where the spike happened,
-            # we break out of the loop as any tweets that happened after the spike doesnt interest us
-            elif tweet_timestamp > timestamp + config.spike_contents_sample_size:
-                break
-
-        # Using a prebuilt function, we find the top 5 words that the tweets contained
-        word_frequency_list = collections.Counter(spike_tweets_text.split()).most_common()
-        return word_frequency_list[:5]
+        defined = ~np.isnan(values)
+        return collections.OrderedDict(zip(timestamps[defined].tolist(), values[defined].tolist()))
+
+    def write_stat(self, stat, values):
+        """Dumps a stat to its csv file
+
+        Args:
+            stat (str): The name of the stat, which is also the name of the file and column
+            values (collections.OrderedDict): The value of the stat at each timestamp
+        """
+        with open(os.path.join(self.dir_path, stat + ".csv"), 'w') as f:
+            field_names = ['timestamp', stat]
+            writer = csv.DictWriter(f, fieldnames=field_names)
+            writer.writeheader()
+            for timestamp, value in values.iteritems():
+                writer.writerow({'timestamp': timestamp, stat: value})
+
+    def find_spike_contents(self):
+        """Find what the tweets contained during each spike
+
+        spike_contents_sample_size is an arbitrary value that 'defines' the duration of a spike. If a tweet happen to
+        fall within this duration after a spike, it interests us.
+
+        The windows of neighbouring spikes are merged, and each merged range is read with a seek through the index of
+        the records, so tweets outside of the spikes are never read and tweets shared by several spikes are only
+        decoded once. The words of the tweets are counted per second, and the window of each spike is slid over them.
+        """
+        size = config.spike_contents_sample_size
+        for start, end, timestamps in merge_windows(self.spikes.keys(), size):
+            # Count the words of the tweets in the range per second
+            # The end of the range is exclusive, so 1 is added to include the tweets in the last second
+            per_second = collections.defaultdict(collections.Counter)
+            for tweet_timestamp, record in self.records.read(start, end + 1):
+                per_second[int(tweet_timestamp)].update(record.text.split())
+
+            # Slide the window over the seconds, from one spike to the next
+            window = collections.Counter()
+            low, high = start, start
+            for timestamp in timestamps:
+                while high <= timestamp + size:
+                    window.update(per_second.get(high, {}))
+                    high += 1
+                while low < timestamp:
+                    window.subtract(per_second.get(low, {}))
+                    low += 1
+
+                # Using a prebuilt function, we find the top 5 words that the tweets contained
+                self.spikes[timestamp] = [(word, n) for word, n in window.most_common(5) if n > 0]
+
+
+def merge_windows(timestamps, size):
+    """Merges the overlapping windows of spikes
+
+    Args:
+        timestamps (list): The timestamps of the spikes
+        size (int): The duration of the window after each spike
+
+    Returns:
+        windows (list): A list of (start, end, timestamps) tuples, where end is inclusive and timestamps are the spikes
+            whose windows were merged into it
+    """
+    windows = []
+    for timestamp in sorted(timestamps):
+        if windows and timestamp <= windows[-1][1]:
+            windows[-1][1] = timestamp + size
+            windows[-1][2].append(timestamp)
+        else:
+            windows.append([timestamp, timestamp + size, [timestamp]])
+    return [tuple(window) for window in windows]
@@ -1,71 +1,389 @@
-""" This module extracts the topics from tweets.csv """
+""" This module extracts the topics from the cleaned text of the tweets
+
+The topics are found by a single LSI model shared by every hour. Each hour, the model is updated online with the
+documents of the hour, then the topics the hour is most about are written to its .topics file. The model and its
+dictionary are checkpointed to config.topics_model_dir, so an hour only costs the time to stream its own documents.
+
+The model is only created from an hour of at least config.topics_min_documents documents, so a partial hour, e.g. the
+one the crawler started in, does not fix the dictionary of every later hour. The hours analysed before then have no
+topics. The hours already added to the model are recorded with it, and are not added again when they are analysed
+again, e.g. after a failed upload.
+
+The documents are streamed from topics.txt one line at a time by :class:`CorpusFile`, and are never held in memory.
+
+If config.topics_vectorizer is "hashing", the default, the words are mapped to config.topics_hash_size ids by hashing
+them, see :class:`HashingVectorizer`, instead of by a dictionary built from the first hour. Every word of every hour is
+then part of the model, and the document frequencies of an hour are counted as its tweets are analysed, in every chunk
+of the hour at once, so the TF-IDF weights need no pass over topics.txt.
+"""
 
 from __future__ import division
-import json
-import collections
-import csv
 import os
+import json
+import time
+import zlib
+import fcntl
+import shutil
 import logging
-import cPickle as pickle
-import re, base64
-import helpers
+import collections
 
-from nltk.corpus import stopwords
-from gensim import corpora,models
+import numpy as np
+from gensim import corpora, models
+from gensim.models import tfidfmodel
 
 from deepthought import config
+from deepthought.processing import tokenizer
+
+
+module_logger = logging.getLogger(__name__)
+
+# The model loaded by this process, with the name of its checkpoint, to avoid loading it again
+_cache = {}
+
 
 def cleaner(text):
-   	def strip_emojis(tl):
-		myre = re.compile(
-            u'['u'\U0001f300-\U0001ffff'u'\U0001f600-\U0001f64f'u'\U0001f680-\U0001f6ff'u'\u2600-\u26ff\u2700-\u27bf]+',
-            re.UNICODE)
-		return myre.sub('', ' '.join(tl)).split(' ')
-	def strip_escape(text):
-		while True:
-			if text[:1] == '\n':
-				text = text[1:]
-			else:
-				break
-		return text
-	def strip_others(text):
-		t_stop = ['rt','#','http','@']
-		for a in t_stop:
-			if a in text:
-				return False
-		return True
-
-	tl = unicode(text.lower()).split(' ')
-	tl = strip_emojis(tl)
-   	tl = filter(lambda w: (not w in stop), tl)
-   	tl = map(strip_escape, tl)
-   	tl = filter(strip_others, tl)
-   	return ' '.join(tl)
+    """Returns the words of a tweet kept in the topics, see :func:`deepthought.processing.tokenizer.topic_words`"""
+    return u' '.join(tokenizer.topic_words(unicode(text)))
+
+
+class CorpusFile(object):
+    """Iterates over the documents of a topics.txt file as bags of words, reading one line at a time
+
+    Attributes:
+        path (str): The path of the file, with one cleaned tweet per line
+        dictionary (gensim.corpora.Dictionary): The dictionary mapping the words to their ids, or a
+            :class:`HashingVectorizer`
+    """
+
+    def __init__(self, path, dictionary):
+        self.path = path
+        self.dictionary = dictionary
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            for line in f:
+                yield self.dictionary.doc2bow(line.decode("utf-8").split())
+
+
+def iter_words(path):
+    """Iterates over the words of every document of a topics.txt file"""
+    with open(path, 'rb') as f:
+        for line in f:
+            yield line.decode("utf-8").split()
+
+
+class HashingVectorizer(object):
+    """Maps words to a fixed range of ids by hashing them, and counts the documents every id is used in
+
+    The id of a word does not depend on the other words, so the documents of every hour, and of every chunk of an hour,
+    are mapped to the same ids without first collecting the vocabulary. Words hashed to the same id are counted
+    together.
+
+    The vectorizer can be used as the id2word of a gensim model, mapping every id to one of the words counted which
+    were hashed to it.
+
+    Attributes:
+        size (int): The number of ids
+        dfs (collections.Counter): The number of documents every id was used in
+        num_docs (int): The number of documents counted
+        num_nnz (int): The total number of distinct ids of the documents counted
+        names (dict): One of the words hashed to every id counted
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.dfs = collections.Counter()
+        self.num_docs = 0
+        self.num_nnz = 0
+        self.names = {}
+
+    @classmethod
+    def from_file(cls, path, size):
+        """Counts the documents of a topics.txt file
+
+        Args:
+            path (str): The path of the file, with one cleaned tweet per line
+            size (int): The number of ids
+
+        Returns:
+            vectorizer (HashingVectorizer): The vectorizer
+        """
+        vectorizer = cls(size)
+        for words in iter_words(path):
+            vectorizer.add(words)
+        return vectorizer
+
+    def word_id(self, word):
+        """Returns the id of a word, which is the same in every process"""
+        return (zlib.crc32(word.encode("utf-8")) & 0xffffffff) % self.size
+
+    def doc2bow(self, words):
+        """Returns a document as a bag of words, sorted by id"""
+        return sorted(collections.Counter(self.word_id(word) for word in words).iteritems())
+
+    def add(self, words):
+        """Counts a document in the document frequencies"""
+        ids = set()
+        for word in words:
+            word_id = self.word_id(word)
+            ids.add(word_id)
+            self.names.setdefault(word_id, word)
+        self.dfs.update(ids)
+        self.num_docs += 1
+        self.num_nnz += len(ids)
+
+    def merge(self, other):
+        """Adds the documents counted by another vectorizer of the same size"""
+        self.dfs.update(other.dfs)
+        self.num_docs += other.num_docs
+        self.num_nnz += other.num_nnz
+        for word_id, word in other.names.iteritems():
+            self.names.setdefault(word_id, word)
+
+    def tfidf(self):
+        """Returns the TF-IDF model of the documents counted, without going over them again"""
+        model = models.TfidfModel(id2word=self)
+        model.num_docs, model.num_nnz = self.num_docs, self.num_nnz
+        model.dfs = dict(self.dfs)
+        model.idfs = tfidfmodel.precompute_idfs(model.wglobal, model.dfs, model.num_docs)
+        return model
+
+    def keys(self):
+        return xrange(self.size)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, word_id):
+        return self.names.get(word_id, u"#" + unicode(word_id))
+
+
+class TopicModel(object):
+    """The LSI model shared by every hour, and the dictionary it was built with
+
+    The dictionary is fixed when the model is created from the first hour of at least config.topics_min_documents
+    documents, keeping its config.topics_vocabulary_size most frequent words, as the number of terms of an LSI model
+    cannot change. Words which only appear later are left out of the topics, until the model is reset by deleting
+    config.topics_model_dir. A model whose words are hashed, the default, has no dictionary, and no word is left out.
+
+    Attributes:
+        dictionary (gensim.corpora.Dictionary): The dictionary of the model, None if its words are hashed
+        lsi (gensim.models.LsiModel): The model
+        hours (set): The names of the hours whose documents were added to the model
+    """
+
+    def __init__(self, dictionary, lsi, hours=None):
+        self.dictionary = dictionary
+        self.lsi = lsi
+        self.hours = set() if hours is None else hours
+
+    @classmethod
+    def create(cls, corpus_path, vectorizer=None):
+        """Creates an empty model, whose dictionary is built from the words of an hour
+
+        Args:
+            corpus_path (str): The path of the topics.txt of the hour
+            vectorizer (HashingVectorizer): The vectorizer of the hour, to create a model of hashed words instead
+
+        Returns:
+            model (TopicModel): The model, or None if the hour has fewer than config.topics_min_documents documents, or
+                no word used in two of them
+        """
+        if vectorizer is not None:
+            if vectorizer.num_docs < config.topics_min_documents:
+                return None
+            lsi = models.LsiModel(id2word=HashingVectorizer(vectorizer.size), num_topics=config.topics_num,
+                                  decay=config.topics_decay)
+            return cls(None, lsi)
+
+        dictionary = corpora.Dictionary(iter_words(corpus_path))
+        if dictionary.num_docs < config.topics_min_documents:
+            return None
+        dictionary.filter_extremes(no_below=2, no_above=1.0, keep_n=config.topics_vocabulary_size)
+        dictionary.compactify()
+        if not len(dictionary):
+            return None
+        lsi = models.LsiModel(id2word=dictionary, num_topics=config.topics_num, decay=config.topics_decay)
+        return cls(dictionary, lsi)
+
+    @classmethod
+    def load(cls, model_dir):
+        """Loads the last checkpoint saved by :meth:`save`, reusing the model already loaded by this process if it is
+        still the last one
+
+        Args:
+            model_dir (str): The directory of the checkpoints
+
+        Returns:
+            model (TopicModel): The model, or None if there is no checkpoint
+        """
+        current_path = os.path.join(model_dir, "current")
+        if not os.path.isfile(current_path):
+            return None
+
+        with open(current_path, 'r') as f:
+            name = f.read().strip()
+        if _cache.get('name') != name:
+            path = os.path.join(model_dir, name)
+            dictionary = None
+            if os.path.isfile(os.path.join(path, "dictionary")):
+                dictionary = corpora.Dictionary.load(os.path.join(path, "dictionary"))
+            hours = set()
+            if os.path.isfile(os.path.join(path, "hours.json")):
+                with open(os.path.join(path, "hours.json"), 'r') as f:
+                    hours = set(json.load(f))
+            _cache['model'] = cls(dictionary, models.LsiModel.load(os.path.join(path, "lsi")), hours)
+            _cache['name'] = name
+        return _cache['model']
+
+    def save(self, model_dir):
+        """Checkpoints the model to a new directory, then makes it the last checkpoint and deletes the previous ones
+
+        The model is made of several files, so the previous checkpoint is only replaced once the new one is completely
+        written, by renaming the file naming the last checkpoint.
+
+        Args:
+            model_dir (str): The directory of the checkpoints
+        """
+        name = "checkpoint-" + str(int(time.time() * 1000))
+        path = os.path.join(model_dir, name)
+        os.makedirs(path)
+        if self.dictionary is not None:
+            self.dictionary.save(os.path.join(path, "dictionary"))
+        self.lsi.save(os.path.join(path, "lsi"))
+        with open(os.path.join(path, "hours.json"), 'w') as f:
+            json.dump(sorted(self.hours), f)
+
+        current_path = os.path.join(model_dir, "current")
+        with open(current_path + ".tmp", 'w') as f:
+            f.write(name)
+        os.rename(current_path + ".tmp", current_path)
+        _cache['model'] = self
+        _cache['name'] = name
+
+        for other in os.listdir(model_dir):
+            if other.startswith("checkpoint-") and other != name:
+                shutil.rmtree(os.path.join(model_dir, other))
+
+    def hash_size(self):
+        """Returns the number of ids the words of the model are hashed to, or None if the model has a dictionary"""
+        return None if self.dictionary is not None else self.lsi.num_terms
+
+    def weigh(self, corpus_path, vectorizer=None):
+        """Weighs the documents of an hour by TF-IDF, with the document frequencies of the hour
+
+        Args:
+            corpus_path (str): The path of the topics.txt of the hour
+            vectorizer (HashingVectorizer): The vectorizer which counted the documents of the hour, if the words of the
+                model are hashed
+
+        Returns:
+            corpus (gensim.interfaces.TransformedCorpus): The TF-IDF weighted documents of the hour, streamed from the
+                file whenever they are iterated over
+        """
+        if vectorizer is not None:
+            corpus = CorpusFile(corpus_path, vectorizer)
+            tfidf = vectorizer.tfidf()
+        else:
+            corpus = CorpusFile(corpus_path, self.dictionary)
+            tfidf = models.TfidfModel(corpus, id2word=self.dictionary)
+        return tfidf[corpus]
+
+    def update(self, hour, corpus_path, vectorizer=None):
+        """Updates the model online with the documents of an hour, see :meth:`weigh`
+
+        Args:
+            hour (str): The name of the hour, recorded with the model
+            corpus_path (str): The path of the topics.txt of the hour
+            vectorizer (HashingVectorizer): The vectorizer which counted the documents of the hour, if the words of the
+                model are hashed
+
+        Returns:
+            corpus (gensim.interfaces.TransformedCorpus): The TF-IDF weighted documents of the hour
+        """
+        weighted = self.weigh(corpus_path, vectorizer)
+        self.lsi.add_documents(weighted)
+        self.hours.add(hour)
+        return weighted
+
+    def top_topics(self, corpus, n, vectorizer=None):
+        """Finds the topics which the documents of an hour are most about
+
+        Args:
+            corpus (iterable): The TF-IDF weighted documents of the hour
+            n (int): The number of topics
+            vectorizer (HashingVectorizer): The vectorizer of the hour, naming the words of the topics if the words of
+                the model are hashed
+
+        Returns:
+            topics (list): The formatted topics, from the strongest to the weakest
+        """
+        weights = np.zeros(self.lsi.num_topics)
+        for document in self.lsi[corpus]:
+            for topic_id, weight in document:
+                weights[topic_id] += abs(weight)
+
+        # The words of the hour are only needed to format its topics, not saved with the model
+        id2word = self.lsi.id2word
+        if vectorizer is not None:
+            self.lsi.id2word = vectorizer
+        try:
+            return [self.lsi.print_topic(int(topic_id)) for topic_id in np.argsort(-weights)[:n] if weights[topic_id]]
+        finally:
+            self.lsi.id2word = id2word
 
 
 class LanguageProcesser():
-    def __init__(self, f_p):
+    def __init__(self, f_p, vectorizer=None):
         self.fp = f_p
-        self.tweets_fp = os.path.join(f_p,'tweets.csv')
+        self.corpus_fp = os.path.join(f_p, 'topics.txt')
+        # The documents of the hour counted by a HashingVectorizer as they were written, if the words are hashed
+        self.vectorizer = vectorizer
+
     def process(self):
-        f = open(self.tweets_fp, 'rb')
-        reader = csv.DictReader(f)
-        g = open('.temp','w')
-        for tweet in tweets_reader:
-            g.write(cleaner((json.loads(tweet['tweet']))['text'] + '\n'))
+        # topics.txt is written by the analyser's TopicCorpusStage, one cleaned tweet per line
+        vectorizer = self.vectorizer
+        if vectorizer is None and config.topics_vectorizer == "hashing":
+            vectorizer = HashingVectorizer.from_file(self.corpus_fp, config.topics_hash_size)
+
+        model_dir = config.topics_model_dir
+        try:
+            os.makedirs(model_dir)
+        except OSError:
+            # Another process may have just created it
+            if not os.path.isdir(model_dir):
+                raise
+
+        # Hours are analysed in several processes, which take turns updating the model
+        with open(os.path.join(model_dir, "lock"), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            start = time.time()
+            model = TopicModel.load(model_dir)
+            if model is not None and model.hash_size() != (vectorizer.size if vectorizer is not None else None):
+                module_logger.warn("The topic model does not match config.topics_vectorizer, it will be replaced")
+                model = None
+            if model is None:
+                module_logger.info("Creating the topic model from '" + self.fp + "'")
+                model = TopicModel.create(self.corpus_fp, vectorizer)
+
+            hour = os.path.basename(os.path.normpath(self.fp))
+            if model is None:
+                module_logger.info("'" + self.fp + "' is too small to create the topic model from, it has no topics")
+                topics = []
+            elif hour in model.hours:
+                # The hour is analysed again, e.g. after a failed upload, and its documents are already in the model
+                topics = model.top_topics(model.weigh(self.corpus_fp, vectorizer), config.topics_per_hour, vectorizer)
+            else:
+                try:
+                    corpus = model.update(hour, self.corpus_fp, vectorizer)
+                except:
+                    # The model of this process may have been partially updated, load it again from the checkpoint
+                    _cache.clear()
+                    raise
+                model.save(model_dir)
+                topics = model.top_topics(corpus, config.topics_per_hour, vectorizer)
+            module_logger.debug("Topics of '" + self.fp + "' extracted in " + str(time.time() - start) + "s")
+
+        g = open(os.path.join(self.fp, '.topics'), 'w')
+        g.write(str(topics))
         g.close()
-        f = open('.temp','rb')
-        dict = corpora.Dictionary(line[:-1].lower().split() for line in f)
-        once_ids = [tokenid for tokenid, docfreq in dict.iteritems() if docfreq == 1]
-        dict.filter_tokens(once_ids)
-        dict.compactify()
-        pickle.dump(dict, open('.tempdict', 'w'))
-        f.close()
-        f = open(self.tweets_fp, 'rb')
-        corpus = [dict.doc2bow(line.split(' ')) for line in f]
-        corpora.MmCorpus.serialize(('.tempcorp'), corpus)
-        tfidf = models.TfidfModel(corpus = corpus, dictionary = dict)
-        corpus_Tfidf = tfidf[corpus]
-        lsi = lsimodel.LsiModel(corpus_Tfidf, id2word=dict, num_topics = 200)
-        g = open(os.path.join(self.fp,'.topics','w'))
-        g.write(os.path.join(self.fp, lsi[doc_tfidf]))
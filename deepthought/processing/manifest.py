@@ -0,0 +1,130 @@
+"""This module records which analyses were run on an hour, so that they are not run again
+
+Every hour directory gets a manifest.json, written once the hour has been analysed::
+
+    {
+        "version": <the version of the analysis as a whole>,
+        "inputs": {<file name>: <size in bytes>, ...},
+        "steps": {
+            <step name>: {"version": ..., "settings": {...}, "outputs": [<file name>, ...], "seconds": ...},
+            ...
+        },
+        "read_seconds": <the time taken to feed the records to the stages>,
+        "seconds": <the time taken by the whole analysis>,
+        "analysed_at": <timestamp>
+    }
+
+A step is the spike detection, or one of the stages. It is up to date if its version and the config settings it
+depends on have not changed, and all of its outputs are still in the directory. If the inputs or the version of the
+analysis change, every step is run again.
+"""
+
+import os
+import json
+import time
+import logging
+
+from deepthought.storage import reader
+
+
+module_logger = logging.getLogger(__name__)
+
+FILE_NAME = "manifest.json"
+
+
+def input_sizes(dir_path):
+    """Returns the size of the files an hour is analysed from
+
+    The files of a sealed hour are never written to again, so their sizes are enough to tell if they changed.
+
+    Args:
+        dir_path (str): The path of the directory of the hour
+
+    Returns:
+        sizes (dict): The size in bytes of every input file, keyed by file name
+    """
+    paths = [reader.find_segment(dir_path, "tweets"), reader.find_segment(dir_path, "records"),
+             os.path.join(dir_path, "tweets.csv"), os.path.join(dir_path, "tps.csv")]
+    return dict((os.path.basename(path), os.path.getsize(path)) for path in paths
+                if path is not None and os.path.isfile(path))
+
+
+class Manifest(object):
+    """The manifest of an hour
+
+    Attributes:
+        dir_path (str): The path of the directory of the hour
+        data (dict): The contents of manifest.json
+    """
+
+    def __init__(self, dir_path, data=None):
+        self.dir_path = dir_path
+        self.data = data or {'version': None, 'inputs': {}, 'steps': {}}
+
+    @classmethod
+    def load(cls, dir_path):
+        """Loads the manifest of an hour
+
+        Args:
+            dir_path (str): The path of the directory of the hour
+
+        Returns:
+            manifest (Manifest): The manifest, empty if the hour was never analysed or its manifest is unreadable
+        """
+        path = os.path.join(dir_path, FILE_NAME)
+        if not os.path.isfile(path):
+            return cls(dir_path)
+
+        try:
+            with open(path, 'r') as f:
+                return cls(dir_path, json.load(f))
+        except ValueError:
+            module_logger.warn("Ignoring the unreadable manifest of '" + dir_path + "'")
+            return cls(dir_path)
+
+    def save(self):
+        """Writes the manifest, replacing the previous one at once so that it is never seen half written"""
+        self.data['analysed_at'] = time.time()
+        path = os.path.join(self.dir_path, FILE_NAME)
+        with open(path + ".tmp", 'w') as f:
+            json.dump(self.data, f, indent=4, sort_keys=True)
+        os.rename(path + ".tmp", path)
+
+    def check(self, version, inputs):
+        """Forgets every step if the version of the analysis or the inputs changed
+
+        Args:
+            version (int): The version of the analysis as a whole
+            inputs (dict): The sizes of the input files, as returned by :func:`input_sizes`
+        """
+        if self.data['version'] != version or self.data['inputs'] != inputs:
+            self.data = {'version': version, 'inputs': inputs, 'steps': {}}
+
+    def is_current(self, name, version, settings, outputs):
+        """Checks if a step is up to date
+
+        Args:
+            name (str): The name of the step
+            version (int): The version of the code of the step
+            settings (dict): The config settings that the outputs of the step depend on
+            outputs (list): The names of the files the step writes
+
+        Returns:
+            bool: True if the step was run with the same version and settings, and its outputs are still there
+        """
+        step = self.data['steps'].get(name)
+        if step is None or step['version'] != version or step['settings'] != settings:
+            return False
+        return all(os.path.isfile(os.path.join(self.dir_path, output)) for output in outputs)
+
+    def record(self, name, version, settings, outputs, seconds):
+        """Records that a step was run
+
+        Args:
+            name (str): The name of the step
+            version (int): The version of the code of the step
+            settings (dict): The config settings that the outputs of the step depend on
+            outputs (list): The names of the files the step wrote
+            seconds (float): The time the step took
+        """
+        self.data['steps'][name] = {'version': version, 'settings': settings, 'outputs': outputs, 'seconds': seconds}
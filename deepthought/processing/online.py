@@ -0,0 +1,166 @@
+"""This module detects spikes in real time, as the crawler collects tweets
+
+The :class:`OnlineSpikeDetector` is fed the TPS of every second by the crawler's metrics clock and updates the EMA and
+growth in constant time per tick, with the same formulas and config values as
+:meth:`deepthought.processing.analyser.Analyser.find_spikes`. A spike is therefore reported within a second of
+happening, instead of once the hour has been analysed.
+
+The detector is also fed the records written by the crawler, and keeps the words of the last seconds in a rolling
+buffer, so that the top words of the live window can be captured when a spike is found.
+"""
+
+from __future__ import division
+import time
+import logging
+import threading
+import collections
+
+from deepthought import config
+
+
+def smoothing_factor(ema_length):
+    """Returns the constant 'k' used when calculating the EMA
+
+    Args:
+        ema_length (int): Length of EMA sample size in seconds
+    """
+    return 2 / (ema_length + 1)
+
+
+class OnlineSpikeDetector(object):
+    """Finds spikes in the TPS as it is being recorded
+
+    Attributes:
+        ema_length (int): Length of EMA sample size in seconds
+        growth_length (int): The number of seconds before which the growth is relative to
+        spike_threshold (float): The growth at or above which it is considered a spike
+        window (int): The number of seconds of words kept to capture the contents of a spike
+        ema (float): The current EMA, None until there are enough values
+        growth (float): The current growth, None until there are enough EMA values
+        events (collections.deque): The most recent spikes, as dicts of timestamp, growth, ema and top words
+        listeners (list): Functions called with every spike event
+        logger (logging.Logger): Logger used for logging
+    """
+
+    def __init__(self, ema_length=None, growth_length=None, spike_threshold=None, window=None):
+        """Initializes the detector, the parameters default to the config
+
+        Args:
+            ema_length (int): Length of EMA sample size in seconds
+            growth_length (int): The number of seconds before which the growth is relative to
+            spike_threshold (float): The growth at or above which it is considered a spike
+            window (int): The number of seconds of words kept to capture the contents of a spike
+        """
+        self.ema_length = ema_length or config.ema_length
+        self.growth_length = growth_length or config.growth_length
+        self.spike_threshold = spike_threshold or config.spike_threshold
+        self.window = window or config.live_window
+        self.k = smoothing_factor(self.ema_length)
+
+        self.ticks = 0
+        self.warmup_sum = 0
+        self.ema = None
+        self.growth = None
+        # The last <growth_length> + 1 EMA values, the oldest of which the growth is relative to
+        self.ema_history = collections.deque(maxlen=self.growth_length + 1)
+
+        # The words of every second in the window, as (second, collections.Counter) pairs
+        self.words = collections.deque()
+        self.words_lock = threading.Lock()
+
+        self.events = collections.deque(maxlen=config.live_events)
+        self.listeners = []
+        self.logger = logging.getLogger(__name__)
+
+    def tick(self, timestamp, tps):
+        """Updates the EMA and growth with the TPS of a second, reporting a spike if there is one
+
+        Args:
+            timestamp (float): The time of the tick
+            tps (int): The number of tweets in the last second
+        """
+        i = self.ticks
+        self.ticks += 1
+
+        # The first EMA value is the average of the first <ema_length> values
+        if i < self.ema_length:
+            self.warmup_sum += tps
+            return
+        elif i == self.ema_length:
+            self.ema = self.warmup_sum / self.ema_length
+        else:
+            self.ema = tps * self.k + self.ema * (1 - self.k)
+        self.ema_history.append(self.ema)
+
+        # The growth is relative to the EMA <growth_length> seconds before
+        if i < self.ema_length + self.growth_length:
+            return
+        prev_ema = self.ema_history[0]
+        if prev_ema:
+            self.growth = (self.ema - prev_ema) / prev_ema
+        else:
+            self.growth = float('inf') if self.ema > 0 else None
+
+        if self.growth is not None and self.growth >= self.spike_threshold:
+            self.report(timestamp)
+
+    def report(self, timestamp):
+        """Reports a spike, along with the top words of the live window
+
+        Args:
+            timestamp (float): The time of the spike
+        """
+        event = {
+            'timestamp': int(timestamp),
+            'growth': self.growth,
+            'ema': self.ema,
+            'words': self.top_words(5),
+            'detected_at': time.time()
+        }
+        self.logger.info("Live spike found at " + str(event['timestamp']))
+        self.events.append(event)
+        for listener in self.listeners:
+            listener(event)
+
+    def observe(self, records):
+        """Adds the words of records to the rolling buffer
+
+        Args:
+            records (list): A list of (timestamp, record) tuples, where the record is a
+                :class:`deepthought.storage.projection.Record`
+        """
+        with self.words_lock:
+            for timestamp, record in records:
+                second = int(timestamp)
+                if not self.words or self.words[-1][0] != second:
+                    self.words.append((second, collections.Counter()))
+                self.words[-1][1].update(record.text.split())
+
+            # Drop the seconds which have left the window
+            if self.words:
+                oldest = self.words[-1][0] - self.window
+                while self.words[0][0] <= oldest:
+                    self.words.popleft()
+
+    def top_words(self, n):
+        """Returns the most used words in the window
+
+        Args:
+            n (int): The number of words
+
+        Returns:
+            words (list): A list of (word, frequency) tuples
+        """
+        total = collections.Counter()
+        with self.words_lock:
+            for second, words in self.words:
+                total.update(words)
+        return total.most_common(n)
+
+    def recent(self):
+        """Returns the most recent spikes
+
+        Returns:
+            events (list): The spike events, from the oldest to the newest
+        """
+        return list(self.events)
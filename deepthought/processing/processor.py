@@ -1,70 +1,339 @@
-"""This module communicates with the crawler and processes incoming files"""
+"""This module communicates with the crawler and processes incoming files
+
+The hours are analysed in a pool of worker processes, so the analyses run on every core instead of contending for the
+GIL in threads. At most one analysis runs per worker, and an analysis only starts once the total size of the hours
+being analysed fits within config.processor_memory_limit, so recovering a backlog of hours does not thrash.
+
+An hour whose records are larger than config.processor_chunk_size is split into chunks along the index of its records
+(see :func:`deepthought.storage.reader.split_records`). The chunks are fed to the stages in parallel, then the stages
+of every chunk are merged and their results written by one last task.
+
+When the crawler runs in another process, the Processor is given a poll interval, and looks for the hours sealed by the
+crawler in the working dir instead of receiving them through its queue.
+"""
 import logging
 import threading
+import multiprocessing
+import Queue
+import cPickle
+import time
 import os
 import re
 
 from deepthought import config, helpers
 import crawler
 from deepthought.processing import analyser
+from deepthought.api import responsecache
+from deepthought.storage import reader, statstore
+
+
+module_logger = logging.getLogger(__name__)
+
+
+def analyse_hour(dir_path, chunk_stages=None):
+    """Analyses a directory in a worker process, stores its stats, then uploads it unless in DEV_MODE
+
+    Args:
+        dir_path (str): The path to the directory of the hour
+        chunk_stages (list): The stages of every chunk of the hour, if it was analysed in chunks
+
+    Returns:
+        dir_path (str): The path to the directory, or None if the analysis failed
+    """
+    a = analyser.Analyser()
+    try:
+        a.analyse(dir_path, chunk_stages)
+    except ValueError:
+        module_logger.error(dir_path + " is not a valid file path!?")
+    except Exception:
+        # The exception would otherwise only be raised in the pool, where nothing waits for it
+        module_logger.exception("Analysis of '" + dir_path + "' failed")
+        return None
+
+    try:
+        # The API reads the stats of the hour from the store instead of Amazon S3
+        statstore.StatsStore().add_hour(os.path.basename(os.path.normpath(dir_path)), dir_path)
+    except Exception:
+        module_logger.exception("Storing the stats of '" + dir_path + "' failed")
+
+    try:
+        if not config.DEV_MODE:
+            helpers.upload_dir(dir_path)
+        # The responses of the API depending on the hour are no longer up to date
+        responsecache.publish(os.path.basename(os.path.normpath(dir_path)))
+    except Exception:
+        # The pool does not call the callback of a task which raised, so the room taken by the hour would never be
+        # released. The hour is uploaded again when it is recovered.
+        module_logger.exception("Upload of '" + dir_path + "' failed")
+        return None
+    return dir_path
+
+
+def analyse_chunk(dir_path, start, end, chunk):
+    """Feeds a chunk of an hour to the stages in a worker process, see :meth:`analyser.Analyser.analyse_chunk`
+
+    The stages are pickled here rather than by the pool, which does not call the callback of a task whose result fails
+    to pickle, so the room taken by the chunk would never be released.
+
+    Returns:
+        stages (str): The pickled stages fed the chunk, or None if the analysis failed
+    """
+    try:
+        return cPickle.dumps(analyser.Analyser().analyse_chunk(dir_path, start, end, chunk), cPickle.HIGHEST_PROTOCOL)
+    except Exception:
+        module_logger.exception("Analysis of chunk " + str(chunk) + " of '" + dir_path + "' failed")
+        return None
+
+
+def input_size(dir_path):
+    """Returns the total size in bytes of the files of an hour, which the memory used to analyse it grows with"""
+    return sum(os.path.getsize(os.path.join(dir_path, name)) for name in os.listdir(dir_path))
 
 
 class Processor(threading.Thread):
-    """Processes incoming files from the crawler"""
+    """Processes incoming files from the crawler
 
-    def __init__(self):
+    Attributes:
+        queue (Queue.Queue): The shared queue between the Crawler and Processor, where the Crawler puts every sealed hour
+        workers (int): The number of worker processes, which is the maximum number of analyses running at once
+        pool (multiprocessing.Pool): The worker processes
+        running (int): The number of analyses running
+        running_size (int): The total size in bytes of the hours, or chunks of hours, being analysed
+        pending (int): The number of hours submitted whose analysis has not finished
+        poll (float): The number of seconds between two scans of the working dir for sealed hours, None to only
+            receive them through the queue
+        submitted (set): The hours submitted since the Processor started, which are not recovered again
+    """
+
+    def __init__(self, queue=None, workers=None, poll=None):
         """Initializes the Processor
 
+        The pool of workers is started right away, so that the Processor is created before the other threads are
+        started: forking only copies the current thread, and any lock held by another thread would stay locked.
+
         Args:
-            file_queue (Queue.Queue): The shared queue between the Crawler and Processor to send files
+            queue (Queue.Queue): The shared queue between the Crawler and Processor to send files, a new queue is
+                created if none is given
+            workers (int): The number of worker processes, defaults to config.processor_workers, or to one per core
+            poll (float): The number of seconds between two scans of the working dir for hours sealed by a crawler in
+                another process, None if the crawler puts them onto the queue
         """
         super(Processor, self).__init__()
         self.logger = logging.getLogger(__name__)
+        self.queue = Queue.Queue() if queue is None else queue
+
+        self.workers = workers or config.processor_workers or multiprocessing.cpu_count()
+        self.pool = multiprocessing.Pool(self.workers)
+        self.admission = threading.Condition()
+        self.running = 0
+        self.running_size = 0
+        self.pending = 0
+        self.poll = poll
+        self.submitted = set()
 
     def run(self):
         """Main function to start processing of files received from the crawler
 
-        This is done in a infinite while loop. In each iteration, the Processor will wait for the Crawler to put a file
-        into the shared Queue.
+        Hours left over from a previous run, e.g. after a crash, are recovered first. Then, in a infinite while loop,
+        the Processor will wait for the Crawler to put the directory of a sealed hour into the shared Queue.
 
-        When it receives a file, it will start analysis.
+        When it receives a directory, it will start analysis in the pool, as soon as there is room for it. If the
+        Processor polls, the working dir is scanned again whenever nothing was received for <poll> seconds.
 
         After analysis, the directory, along with the results of the analysis, will be uploaded to Amazon S3 servers.
         """
         self.logger.warn("Processor started")
-        self.scan_dir()
+        # A crawler in another process may not have sealed the last hour yet
+        self.recover(config.processor_seal_delay if self.poll else 0)
 
-    def scan_dir(self):
-        def analyse_dir(dir):
-            a = analyser.Analyser()
+        while True:
             try:
-                a.analyse(dir)
-            except ValueError:
-                self.logger.error(dir + " is not a valid file path!?")
-
-            if not config.DEV_MODE:
-                helpers.upload_dir(dir)
-
-        threads = list()
-        dirs = next(os.walk(config.working_dir))[1]
-        pattern = re.compile("\d{2}-\d{2}-\d{4}_\d{2}")
-        for dir in dirs:
-            if os.path.join(config.working_dir, dir) == crawler.Crawler.get_curr_hour() or not pattern.match(dir) or len(dir) != 13:
-                dirs.remove(dir)
+                dir_path = self.queue.get(timeout=self.poll)
+            except Queue.Empty:
+                # The crawler of another process does not put the hours it seals onto the queue
+                self.recover(config.processor_seal_delay)
+                continue
+
+            # None is put onto the queue when the Processor is stopped
+            if dir_path is None:
+                break
+
+            self.logger.info("Received sealed dir '" + dir_path + "'")
+            self.submit(dir_path)
+
+        # Let the hours being analysed finish, including the last task of those split into chunks
+        with self.admission:
+            while self.pending:
+                self.admission.wait()
+        self.pool.close()
+        self.pool.join()
+
+    def recover(self, delay=0):
+        """Analyses the hours left in the working dir, except for the one the crawler is currently writing to
+
+        Args:
+            delay (float): The number of seconds after the end of an hour before it is analysed, which leaves time for
+                a crawler in another process to seal it
+        """
+        if not os.path.isdir(config.working_dir):
+            return
+
+        pattern = re.compile("\d{2}-\d{2}-\d{4}_\d{2}$")
+        for dir_name in sorted(next(os.walk(config.working_dir))[1]):
+            dir_path = os.path.join(config.working_dir, dir_name)
+            if dir_path == crawler.Crawler.get_curr_hour() or not pattern.match(dir_name) or dir_path in self.submitted:
                 continue
+            if delay and time.mktime(time.strptime(dir_name, "%d-%m-%Y_%H")) + 60 * 60 + delay > time.time():
+                continue
+
+            self.logger.info("Recovering dir '" + dir_path + "'")
+            self.submit(dir_path)
+
+    def submit(self, dir_path):
+        """Analyses an hour in the pool, in chunks if it is large, waiting until there is room for every task
+
+        The steps of the analysis which are up to date in the manifest of the hour are skipped, see
+        :mod:`deepthought.processing.manifest`.
 
-            t = threading.Thread(target=analyse_dir, args=(os.path.join(config.working_dir, dir),))
-            t.start()
-            threads.append(t)
+        Args:
+            dir_path (str): The path to the directory of the hour
+        """
+        self.submitted.add(dir_path)
+
+        # An hour is only analysed again if the analysis changed since, or if it was not uploaded yet
+        up_to_date = analyser.Analyser().up_to_date(dir_path)
+        if up_to_date and config.DEV_MODE:
+            self.logger.info("Skipping dir '" + dir_path + "', it is up to date")
+            return
+
+        ranges = [(None, None)] if up_to_date else reader.split_records(dir_path, config.processor_chunk_size)
+        size = input_size(dir_path) // len(ranges)
+        with self.admission:
+            self.pending += 1
+
+        if len(ranges) == 1:
+            self.admit(size)
+            self.pool.apply_async(analyse_hour, (dir_path,), callback=lambda result: self.finish_hour(size))
+            return
 
-        for t in threads:
-            t.join()
+        self.logger.info("Analysing '" + dir_path + "' in " + str(len(ranges)) + " chunks")
+        hour = ChunkedHour(self, dir_path, len(ranges), size)
+        for chunk, (start, end) in enumerate(ranges):
+            self.admit(size)
+            self.pool.apply_async(analyse_chunk, (dir_path, start, end, chunk), callback=hour.callback(chunk))
 
-        threading.Timer(5 * 60, self.scan_dir).start()
+    def admit(self, size):
+        """Waits until a worker is free and an analysis of <size> bytes fits within the memory limit
+
+        An analysis is always admitted when none is running, however large it is.
+
+        Args:
+            size (int): The size in bytes of the hour, or chunk of hour, to be analysed
+        """
+        with self.admission:
+            while self.running and (self.running >= self.workers or
+                                    self.running_size + size > config.processor_memory_limit):
+                self.admission.wait()
+            self.running += 1
+            self.running_size += size
+
+    def release(self, size):
+        """Frees the room taken by an analysis admitted by :meth:`admit`"""
+        with self.admission:
+            self.running -= 1
+            self.running_size -= size
+            self.admission.notify_all()
+
+    def resize(self, size, new_size):
+        """Changes the size of an analysis admitted by :meth:`admit`, without waiting for room
+
+        Args:
+            size (int): The size admitted for the analysis
+            new_size (int): The size of the analysis taking its place, e.g. the merge of the chunks of an hour
+        """
+        with self.admission:
+            self.running_size += new_size - size
+            self.admission.notify_all()
+
+    def finish_hour(self, size=None):
+        """Called by the pool when the analysis of an hour is done
+
+        Args:
+            size (int): The size admitted for the analysis, if it was admitted by :meth:`admit`
+        """
+        if size is not None:
+            self.release(size)
+        with self.admission:
+            self.pending -= 1
+            self.admission.notify_all()
 
     def stop(self):
         """Stops the Processor
 
         It also checks if there were any queued files when the Processor was stopped.
         """
+        if not self.queue.empty():
+            self.logger.warn(str(self.queue.qsize()) + " sealed dirs left in the queue, they will be recovered on restart")
+        self.queue.put(None)
         self.logger.warn("Processor stopped")
+
+
+class ChunkedHour(object):
+    """Collects the stages of the chunks of an hour as they are analysed, and merges them once all of them are
+
+    Attributes:
+        processor (Processor): The processor which submitted the chunks
+        dir_path (str): The path to the directory of the hour
+        chunk_stages (list): The stages of every chunk, None until the chunk is analysed
+        remaining (int): The number of chunks left to analyse
+        size (int): The size admitted for the analysis of every chunk, the merge of the chunks being admitted the size
+            of all of them
+    """
+
+    def __init__(self, processor, dir_path, chunks, size):
+        self.processor = processor
+        self.dir_path = dir_path
+        self.chunk_stages = [None] * chunks
+        self.remaining = chunks
+        self.size = size
+        self.lock = threading.Lock()
+
+    def callback(self, chunk):
+        """Returns the function called by the pool with the stages of a chunk"""
+        return lambda stages: self.chunk_done(chunk, stages)
+
+    def chunk_done(self, chunk, stages):
+        """Keeps the stages of a chunk, then submits the merge of all of them once it was the last chunk
+
+        This is called from the result thread of the pool, so it must not wait for room in the pool. The room taken by
+        the last chunk is kept for the merge instead, and grown to the size of every chunk.
+
+        Args:
+            chunk (int): The index of the chunk
+            stages (str): The pickled stages of the chunk, None if its analysis failed
+        """
+        if stages is not None:
+            try:
+                stages = cPickle.loads(stages)
+            except Exception:
+                self.processor.logger.exception("Loading chunk " + str(chunk) + " of '" + self.dir_path + "' failed")
+                stages = None
+
+        with self.lock:
+            self.chunk_stages[chunk] = stages
+            self.remaining -= 1
+            last = not self.remaining
+
+        if not last:
+            self.processor.release(self.size)
+            return
+
+        if any(stages is None for stages in self.chunk_stages):
+            self.processor.logger.error("'" + self.dir_path + "' was not analysed, it will be recovered on restart")
+            self.processor.finish_hour(self.size)
+            return
+
+        merge_size = self.size * len(self.chunk_stages)
+        self.processor.resize(self.size, merge_size)
+        self.processor.pool.apply_async(analyse_hour, (self.dir_path, self.chunk_stages),
+                                        callback=lambda result: self.processor.finish_hour(merge_size))
@@ -0,0 +1,244 @@
+"""This module provides a bounded-memory sketch of the frequencies of the words of an hour
+
+The exact frequencies of an hour keep every token ever seen, including the links, typos and words used once, so they
+grow without limit with the vocabulary. The :class:`SpaceSaving` sketch keeps at most ``capacity`` words instead, and
+still finds every frequent word, with bounded error.
+
+Error bounds, where N is the number of words added to the sketch (or to all the sketches merged into it) and k is the
+capacity:
+
+* the count of a word is never below its true frequency, and is above it by at most the error of the word
+* the error of every word, and the frequency of every word which is not kept, is at most :attr:`SpaceSaving.floor`
+* the floor is at most N / k, so every word more frequent than N / k is kept
+
+Sketches are mergeable: merging the sketches of several hours gives a sketch of all of them with the same bounds, so
+day and week views can be built from the hourly sketches without reading the tweets again. The merge is the one of
+Agarwal et al., "Mergeable Summaries", through the isomorphism between Space-Saving and Misra-Gries.
+"""
+
+from __future__ import division
+import os
+import json
+import heapq
+import collections
+
+
+class SpaceSaving(object):
+    """The Space-Saving sketch of the frequencies of words
+
+    Words are counted exactly until the sketch is full. Then, a new word replaces the word with the lowest count, and
+    takes over its count. The words with the same count are kept together, so that adding a word takes constant time.
+
+    Attributes:
+        capacity (int): The maximum number of words kept
+        total (int): The number of words added to the sketch
+        floor (int): The highest frequency that a word which is not kept can have, and the highest error of a count
+        counts (dict): The count of every word kept, which is an upper bound of its frequency
+        errors (dict): How much the count of every word kept can be above its frequency
+    """
+
+    def __init__(self, capacity):
+        """Initializes an empty sketch
+
+        Args:
+            capacity (int): The maximum number of words kept
+        """
+        if capacity < 1:
+            raise ValueError("The capacity of a sketch must be at least 1")
+        self.capacity = capacity
+        self.total = 0
+        self.floor = 0
+        self.counts = {}
+        self.errors = {}
+        # The words of every count, and the lowest count
+        self.buckets = collections.defaultdict(set)
+        self.min_count = None
+
+    def add(self, word):
+        """Counts an occurrence of a word
+
+        Args:
+            word (unicode): The word
+        """
+        self.total += 1
+        count = self.counts.get(word)
+
+        if count is not None:
+            bucket = self.buckets[count]
+            bucket.discard(word)
+            if not bucket:
+                del self.buckets[count]
+                if count == self.min_count:
+                    self.min_count = count + 1
+            self.counts[word] = count + 1
+            self.buckets[count + 1].add(word)
+            return
+
+        if len(self.counts) >= self.capacity:
+            # Replace a word with the lowest count, which bounds the frequency of any word not kept from now on
+            bucket = self.buckets[self.min_count]
+            evicted = bucket.pop()
+            del self.counts[evicted]
+            del self.errors[evicted]
+            self.floor = self.min_count
+            if bucket:
+                self.set(word, self.floor + 1, self.floor)
+                return
+            del self.buckets[self.min_count]
+
+        # The word may have been seen before, up to <floor> times, and no word kept has a lower count than it
+        self.set(word, self.floor + 1, self.floor)
+        self.min_count = self.floor + 1
+
+    def update(self, words):
+        """Counts an occurrence of every word, like :meth:`collections.Counter.update`
+
+        Args:
+            words (iterable): The words
+        """
+        add = self.add
+        for word in words:
+            add(word)
+
+    def count(self, word):
+        """Returns the count of a word, which is an upper bound of its frequency
+
+        Args:
+            word (unicode): The word
+
+        Returns:
+            count (int): The count of the word, or the floor if it is not kept
+        """
+        return self.counts.get(word, self.floor)
+
+    def bounds(self, word):
+        """Returns the bounds of the frequency of a word
+
+        Args:
+            word (unicode): The word
+
+        Returns:
+            (lower, upper) (tuple): The lowest and highest frequency that the word can have
+        """
+        if word in self.counts:
+            return self.counts[word] - self.errors[word], self.counts[word]
+        return 0, self.floor
+
+    def most_common(self, n=None):
+        """Returns the words with the highest counts, like :meth:`collections.Counter.most_common`
+
+        Args:
+            n (int): The number of words, or None for all the words kept
+
+        Returns:
+            words (list): A list of (word, count) tuples, from the highest count to the lowest
+        """
+        if n is None:
+            return sorted(self.counts.iteritems(), key=lambda item: item[1], reverse=True)
+        return heapq.nlargest(n, self.counts.iteritems(), key=lambda item: item[1])
+
+    def merge(self, other, capacity=None):
+        """Merges two sketches
+
+        The counts are turned into Misra-Gries counters by subtracting the floor of each sketch, and added up. If more
+        than <capacity> words are left, the count of the word after the <capacity> highest is subtracted from all of
+        them and added to the floor, which keeps the floor under N / k.
+
+        Args:
+            other (SpaceSaving): The sketch to merge with this one
+            capacity (int): The capacity of the merged sketch, defaults to the lowest capacity of the two
+
+        Returns:
+            sketch (SpaceSaving): A new sketch of the words of both sketches
+        """
+        capacity = capacity or min(self.capacity, other.capacity)
+        counters = collections.Counter()
+        for sketch in (self, other):
+            for word, count in sketch.counts.iteritems():
+                if count > sketch.floor:
+                    counters[word] += count - sketch.floor
+        floor = self.floor + other.floor
+
+        if len(counters) > capacity:
+            cut = heapq.nlargest(capacity + 1, counters.itervalues())[-1]
+            floor += cut
+            counters = dict((word, counter - cut) for word, counter in counters.iteritems() if counter > cut)
+
+        merged = SpaceSaving(capacity)
+        merged.total = self.total + other.total
+        merged.floor = floor
+        for word, counter in counters.iteritems():
+            merged.set(word, counter + floor, floor)
+        return merged
+
+    def set(self, word, count, error):
+        """Sets the count and error of a word kept, used when loading or merging sketches"""
+        self.counts[word] = count
+        self.errors[word] = error
+        self.buckets[count].add(word)
+        if self.min_count is None or count < self.min_count:
+            self.min_count = count
+
+    def to_dict(self):
+        """Returns the sketch as a dict which can be serialized to JSON"""
+        return {
+            'capacity': self.capacity,
+            'total': self.total,
+            'floor': self.floor,
+            'words': [[word, count, self.errors[word]] for word, count in self.most_common()]
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        """Returns the sketch of a dict returned by :meth:`to_dict`"""
+        sketch = cls(d['capacity'])
+        sketch.total = d['total']
+        sketch.floor = d['floor']
+        for word, count, error in d['words']:
+            sketch.set(word, count, error)
+        return sketch
+
+    def save(self, path):
+        """Saves the sketch to a JSON file"""
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a sketch saved by :meth:`save`"""
+        with open(path, 'r') as f:
+            return cls.from_dict(json.load(f))
+
+
+def merge(sketches, capacity=None):
+    """Merges several sketches, see :meth:`SpaceSaving.merge`
+
+    Args:
+        sketches (list): The sketches
+        capacity (int): The capacity of the merged sketch, defaults to the lowest capacity of the sketches
+
+    Returns:
+        sketch (SpaceSaving): The sketch of all the words, or None if there are no sketches
+    """
+    sketches = list(sketches)
+    if not sketches:
+        return None
+    capacity = capacity or min(sketch.capacity for sketch in sketches)
+    merged = sketches[0]
+    for sketch in sketches[1:]:
+        merged = merged.merge(sketch, capacity)
+    return merged
+
+
+def merge_dirs(dir_paths, capacity=None):
+    """Merges the sketches saved in the directories of several hours, e.g. to build the view of a day or week
+
+    Args:
+        dir_paths (list): The paths of the directories, those without a sketch are skipped
+        capacity (int): The capacity of the merged sketch, defaults to the lowest capacity of the sketches
+
+    Returns:
+        sketch (SpaceSaving): The sketch of all the hours, or None if none of them have a sketch
+    """
+    paths = [os.path.join(dir_path, "sketch.json") for dir_path in dir_paths]
+    return merge((SpaceSaving.load(path) for path in paths if os.path.isfile(path)), capacity)
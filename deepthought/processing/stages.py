@@ -0,0 +1,284 @@
+"""This module provides the stages of the analysis of an hour
+
+The :class:`deepthought.processing.analyser.Analyser` decodes the records of an hour once, and feeds each of them to
+every registered stage. Each stage keeps its own incremental state, and writes its results once all the records have
+been fed. Adding a stage therefore does not cost another pass over the hour.
+
+A large hour may be split into chunks which are fed to separate instances of the stages, in separate processes. The
+instances are then sent back to the processor, and merged in the order of the chunks before the results are written.
+"""
+
+import os
+import json
+import shutil
+import collections
+
+from deepthought import config
+from deepthought.processing import sketch, termseries, tokenizer
+from deepthought.storage import index
+
+
+class Stage(object):
+    """Base class of the analysis stages
+
+    Attributes:
+        name (str): The name of the stage, used in logging and in the manifest of the hour
+        version (int): The version of the code of the stage, to be increased whenever its outputs change, so that they
+            are written again for the hours already analysed
+    """
+
+    name = None
+    version = 1
+
+    def settings(self):
+        """Returns the config settings that the outputs of the stage depend on
+
+        Returns:
+            settings (dict): The settings, keyed by name
+        """
+        return {}
+
+    def outputs(self):
+        """Returns the names of the files written by the stage in the directory of the hour"""
+        return []
+
+    def start(self, analyser):
+        """Called before the first record is fed
+
+        Args:
+            analyser (Analyser): The analyser running the stage, holding the directory of the hour
+        """
+        pass
+
+    def feed(self, timestamp, record):
+        """Called for every record of the hour, in order
+
+        Args:
+            timestamp (float): The time the tweet was received
+            record (deepthought.storage.projection.Record): The projected tweet
+        """
+        raise NotImplementedError
+
+    def partial(self, analyser):
+        """Called instead of :meth:`finish` after the last record of a chunk of the hour has been fed
+
+        The stage is then pickled to be merged with the stages of the other chunks, so it must not hold any open file.
+
+        Args:
+            analyser (Analyser): The analyser running the stage
+        """
+        pass
+
+    def merge(self, other):
+        """Adds the state of the same stage fed the next chunk of the hour
+
+        Args:
+            other (Stage): The stage of the next chunk
+        """
+        raise NotImplementedError
+
+    def finish(self, analyser):
+        """Called after the last record has been fed, to write the results
+
+        Args:
+            analyser (Analyser): The analyser running the stage
+        """
+        pass
+
+
+class WordFrequencyStage(Stage):
+    """Counts the frequency of every word of the hour, and saves it to search.json for the search API
+
+    The frequencies are also added to the search index in config.search_index_dir, see
+    :mod:`deepthought.storage.index`, unless the directory is not named after its hour.
+
+    If config.word_frequency_mode is "sketch", the words are counted in a
+    :class:`deepthought.processing.sketch.SpaceSaving` sketch of config.sketch_capacity words instead, so the memory
+    used and the size of search.json are bounded whatever the vocabulary. search.json then holds the counts of the words
+    kept, and the sketch itself is saved to sketch.json, to be merged with the sketches of other hours.
+
+    Attributes:
+        freq_dict (collections.Counter): The frequency of every word, or its sketch
+    """
+
+    name = "word frequency"
+
+    def __init__(self):
+        if config.word_frequency_mode == "sketch":
+            self.freq_dict = sketch.SpaceSaving(config.sketch_capacity)
+        else:
+            self.freq_dict = collections.Counter()
+
+    def settings(self):
+        if config.word_frequency_mode == "sketch":
+            return {'word_frequency_mode': "sketch", 'sketch_capacity': config.sketch_capacity}
+        return {'word_frequency_mode': config.word_frequency_mode}
+
+    def outputs(self):
+        if config.word_frequency_mode == "sketch":
+            return ["search.json", "sketch.json"]
+        return ["search.json"]
+
+    def feed(self, timestamp, record):
+        self.freq_dict.update(tokenizer.words(record.text))
+
+    def merge(self, other):
+        if isinstance(self.freq_dict, sketch.SpaceSaving):
+            self.freq_dict = self.freq_dict.merge(other.freq_dict)
+        else:
+            self.freq_dict.update(other.freq_dict)
+
+    def finish(self, analyser):
+        freq_dict = self.freq_dict
+        if isinstance(freq_dict, sketch.SpaceSaving):
+            freq_dict.save(os.path.join(analyser.dir_path, "sketch.json"))
+            freq_dict = freq_dict.counts
+
+        search_fp = os.path.join(analyser.dir_path, "search.json")
+        with open(search_fp, "w") as search_file:
+            json.dump(freq_dict, search_file)
+
+        try:
+            index.InvertedIndex().add_hour(os.path.basename(os.path.normpath(analyser.dir_path)), freq_dict)
+        except ValueError:
+            # Only the directories named after their hour are searched
+            pass
+
+
+class TermSeriesStage(Stage):
+    """Counts the frequency of every word in every minute of the hour, and saves it to terms.npz
+
+    See :mod:`deepthought.processing.termseries` for the format of the file.
+
+    Attributes:
+        hour_start (int): The timestamp of the first minute of the hour, set by the first record
+        ids (dict): The id of every word, in the order the words were first used
+        minute_counters (collections.defaultdict): A collections.Counter of the word ids used in every minute
+    """
+
+    name = "term series"
+
+    def __init__(self):
+        self.hour_start = None
+        self.ids = {}
+        self.minute_counters = collections.defaultdict(collections.Counter)
+
+    def outputs(self):
+        return ["terms.npz"]
+
+    def feed(self, timestamp, record):
+        if self.hour_start is None:
+            self.hour_start = termseries.hour_start(timestamp)
+
+        # Tweets past the end of the hour, e.g. after a change of the clock, are counted in its last minute
+        minute = min(max((int(timestamp) - self.hour_start) // 60, 0), termseries.MINUTES - 1)
+        ids = self.ids
+        counter = self.minute_counters[minute]
+        counter.update([ids.setdefault(word, len(ids)) for word in tokenizer.words(record.text)])
+
+    def merge(self, other):
+        if other.hour_start is None:
+            return
+        if self.hour_start is None:
+            self.hour_start = other.hour_start
+
+        words = dict((i, word) for word, i in other.ids.iteritems())
+        shift = (other.hour_start - self.hour_start) // 60
+        ids = self.ids
+        for minute, other_counter in other.minute_counters.iteritems():
+            counter = self.minute_counters[min(max(minute + shift, 0), termseries.MINUTES - 1)]
+            for i, count in other_counter.iteritems():
+                counter[ids.setdefault(words[i], len(ids))] += count
+
+    def finish(self, analyser):
+        words = [None] * len(self.ids)
+        for word, i in self.ids.iteritems():
+            words[i] = word
+
+        series = termseries.TermSeries.from_counters(self.hour_start or 0, words, self.minute_counters)
+        series.save(os.path.join(analyser.dir_path, "terms.npz"))
+
+
+class TopicCorpusStage(Stage):
+    """Writes the cleaned text of every tweet to topics.txt in the directory, then extracts the topics from it
+
+    The tweets of a chunk of the hour are written to topics.<chunk>.txt instead, and the files of the chunks are joined
+    in order into topics.txt.
+
+    If config.topics_vectorizer is "hashing", the document frequencies of the hashed words are counted as the tweets
+    are written, see :class:`deepthought.processing.langprocess.HashingVectorizer`.
+
+    Attributes:
+        corpus_path (str): The path of the file the cleaned text is written to
+        corpus_f (file): The file the cleaned text is written to
+        parts (list): The paths of the files of the next chunks, once merged
+        vectorizer (HashingVectorizer): The document frequencies of the tweets written, None unless the words are hashed
+    """
+
+    name = "topics"
+    version = 2
+
+    def __init__(self):
+        self.corpus_path = None
+        self.corpus_f = None
+        self.parts = []
+        self.vectorizer = None
+        if config.topics_vectorizer == "hashing":
+            from deepthought.processing import langprocess
+            self.vectorizer = langprocess.HashingVectorizer(config.topics_hash_size)
+
+    def settings(self):
+        if config.topics_vectorizer == "hashing":
+            return {'topics_vectorizer': "hashing", 'topics_hash_size': config.topics_hash_size}
+        return {'topics_vectorizer': config.topics_vectorizer}
+
+    def outputs(self):
+        return ["topics.txt", ".topics"]
+
+    def start(self, analyser):
+        name = "topics.txt" if analyser.chunk is None else "topics." + str(analyser.chunk) + ".txt"
+        self.corpus_path = os.path.join(analyser.dir_path, name)
+        self.corpus_f = open(self.corpus_path, 'w')
+
+    def feed(self, timestamp, record):
+        # Every tweet is written on its own line
+        words = tokenizer.topic_words(record.text)
+        self.corpus_f.write(u" ".join(words).encode("utf-8") + '\n')
+        if self.vectorizer is not None:
+            self.vectorizer.add(words)
+
+    def partial(self, analyser):
+        self.corpus_f.close()
+        self.corpus_f = None
+
+    def merge(self, other):
+        self.parts.append(other.corpus_path)
+        self.parts.extend(other.parts)
+        if self.vectorizer is not None:
+            self.vectorizer.merge(other.vectorizer)
+
+    def finish(self, analyser):
+        if self.corpus_f is not None:
+            self.corpus_f.close()
+
+        corpus_path = os.path.join(analyser.dir_path, "topics.txt")
+        if self.corpus_path != corpus_path:
+            os.rename(self.corpus_path, corpus_path)
+            with open(corpus_path, 'ab') as corpus_f:
+                for part in self.parts:
+                    with open(part, 'rb') as part_f:
+                        shutil.copyfileobj(part_f, corpus_f)
+                    os.remove(part)
+
+        # gensim is only imported once there are topics to extract
+        from deepthought.processing import langprocess
+        langprocess.LanguageProcesser(analyser.dir_path, self.vectorizer).process()
+
+
+def default_stages():
+    """Returns new instances of the stages run on every hour
+
+    Returns:
+        stages (list): The stages, in the order in which they are fed
+    """
+    return [WordFrequencyStage(), TermSeriesStage(), TopicCorpusStage()]
@@ -0,0 +1,156 @@
+"""This module provides the per-minute frequency of every word of an hour
+
+The counts are a sparse matrix of words by minutes, stored in compressed sparse row (CSR) form in terms.npz:
+
+* vocab: the words of the hour, sorted, joined by newlines and UTF-8 encoded, as an array of bytes. The id of a word is
+  its index in the sorted list, so a word is found by binary search, and the words with a prefix are contiguous.
+* indptr: the counts of the word with id i are at [indptr[i], indptr[i + 1]) in minutes and counts
+* minutes: the minutes of the hour in which the word was used, in increasing order
+* counts: the number of times the word was used in each of these minutes
+* start: the timestamp of the first minute of the hour
+
+Only the minutes in which a word was used are stored, and the arrays are compressed, so the file is a fraction of the
+size of the same counts as JSON.
+"""
+
+from __future__ import division
+import time
+import bisect
+import collections
+
+import numpy as np
+
+
+# The number of minutes in an hour, which are the columns of the matrix
+MINUTES = 60
+
+
+def hour_start(timestamp):
+    """Returns the timestamp of the start of the local hour of a timestamp
+
+    Args:
+        timestamp (float): The timestamp
+
+    Returns:
+        start (int): The timestamp of the start of the hour
+    """
+    timestamp = int(timestamp)
+    local = time.localtime(timestamp)
+    return timestamp - local.tm_min * 60 - local.tm_sec
+
+
+class TermSeries(object):
+    """The per-minute frequency of every word of an hour
+
+    Attributes:
+        start (int): The timestamp of the first minute of the hour
+        vocab (list): The words of the hour, sorted
+        indptr (numpy.ndarray): The offsets of the counts of every word in minutes and counts
+        minutes (numpy.ndarray): The minutes in which every word was used
+        counts (numpy.ndarray): The number of times every word was used in each of these minutes
+    """
+
+    def __init__(self, start, vocab, indptr, minutes, counts):
+        self.start = start
+        self.vocab = vocab
+        self.indptr = indptr
+        self.minutes = minutes
+        self.counts = counts
+
+    @classmethod
+    def from_counters(cls, start, words, minute_counters):
+        """Builds the matrix from the counters of word ids of every minute
+
+        Args:
+            start (int): The timestamp of the first minute of the hour
+            words (list): The words, indexed by id
+            minute_counters (dict): A collections.Counter of the word ids used in every minute, keyed by minute
+
+        Returns:
+            series (TermSeries): The series
+        """
+        rows, cols, values = [], [], []
+        for minute, counter in minute_counters.iteritems():
+            rows.extend(counter.iterkeys())
+            values.extend(counter.itervalues())
+            cols.extend([minute] * len(counter))
+
+        # Renumber the words in sorted order, then sort the counts by word and minute
+        order = sorted(xrange(len(words)), key=words.__getitem__)
+        rank = np.empty(len(words), dtype=np.int64)
+        rank[order] = np.arange(len(words))
+        rows = rank[np.asarray(rows, dtype=np.int64)]
+        cols = np.asarray(cols, dtype=np.uint8)
+        values = np.asarray(values, dtype=np.min_scalar_type(max(values or [0])))
+        by_word = np.lexsort((cols, rows))
+
+        indptr = np.zeros(len(words) + 1, dtype=np.int32)
+        np.cumsum(np.bincount(rows, minlength=len(words)), out=indptr[1:])
+        return cls(start, [words[i] for i in order], indptr, cols[by_word], values[by_word])
+
+    def save(self, path):
+        """Saves the series to a compressed .npz file"""
+        vocab = np.frombuffer(u"\n".join(self.vocab).encode("utf-8"), dtype=np.uint8)
+        np.savez_compressed(path, start=np.int64(self.start), vocab=vocab, indptr=self.indptr, minutes=self.minutes,
+                            counts=self.counts)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a series saved by :meth:`save`"""
+        with np.load(path) as data:
+            vocab = data['vocab'].tostring().decode("utf-8")
+            return cls(int(data['start']), vocab.split(u"\n") if vocab else [], data['indptr'], data['minutes'],
+                       data['counts'])
+
+    def word_id(self, word):
+        """Returns the id of a word, or None if it was not used in the hour"""
+        i = bisect.bisect_left(self.vocab, word)
+        if i < len(self.vocab) and self.vocab[i] == word:
+            return i
+        return None
+
+    def prefix_ids(self, prefix):
+        """Returns the ids [begin, end) of the words of the hour which start with a prefix, which are contiguous"""
+        begin = end = bisect.bisect_left(self.vocab, prefix)
+        while end < len(self.vocab) and self.vocab[end].startswith(prefix):
+            end += 1
+        return begin, end
+
+    def minute_counts(self, word, prefix=False):
+        """Returns the number of times a word was used in every minute of the hour
+
+        Args:
+            word (unicode): The word
+            prefix (bool): True to count every word starting with the word instead
+
+        Returns:
+            counts (numpy.ndarray): The counts of the <MINUTES> minutes of the hour
+        """
+        if prefix:
+            first, last = self.prefix_ids(word)
+        else:
+            i = self.word_id(word)
+            first, last = (i, i + 1) if i is not None else (0, 0)
+        # The counts of the words with ids [first, last) are contiguous
+        begin, end = self.indptr[first], self.indptr[last]
+        return np.bincount(self.minutes[begin:end], weights=self.counts[begin:end], minlength=MINUTES).astype(np.int64)
+
+    def dates(self, resolution=1):
+        """Returns the "DD-MM-YYYY_HH:MM" dates of the first minute of every <resolution> minutes of the hour"""
+        return [time.strftime("%d-%m-%Y_%H:%M", time.localtime(self.start + i * resolution * 60))
+                for i in xrange(MINUTES // resolution)]
+
+    def series(self, word, resolution=1, prefix=False):
+        """Returns the frequency of a word over the hour
+
+        Args:
+            word (unicode): The word
+            resolution (int): The number of minutes counted together, which must divide an hour
+            prefix (bool): True to count every word starting with the word instead
+
+        Returns:
+            series (collections.OrderedDict): The number of times the word was used, keyed by the
+                "DD-MM-YYYY_HH:MM" date of the first minute of every <resolution> minutes
+        """
+        counts = self.minute_counts(word, prefix).reshape(-1, resolution).sum(axis=1)
+        return collections.OrderedDict((date, int(count)) for date, count in zip(self.dates(resolution), counts))
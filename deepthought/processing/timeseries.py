@@ -0,0 +1,210 @@
+"""This module provides the vectorized time series engine used to find spikes in the TPS
+
+The TPS is held as sorted arrays of timestamps and values, and the EMA, growth and spikes are computed over the whole
+series at once. Many combinations of (ema_length, growth_length, spike_threshold) can be evaluated in a single call to
+:meth:`TPSSeries.sweep`, which makes it cheap to tune the spike detection over weeks of archived tps.csv files.
+
+The formulas are the same as the ones documented in :meth:`deepthought.processing.analyser.Analyser.find_spikes`:
+
+* the first EMA value, at index ema_length, is the average of the first ema_length values
+* every subsequent EMA value is tps * k + previous EMA * (1 - k), where k = 2 / (ema_length + 1)
+* the growth at index i >= ema_length + growth_length is (EMA[i] - EMA[i - growth_length]) / EMA[i - growth_length]
+* a spike is a growth at or above the spike threshold
+
+The same formulas are applied one second at a time by :class:`deepthought.processing.online.OnlineSpikeDetector`.
+"""
+
+from __future__ import division
+import os
+import csv
+import math
+import logging
+
+import numpy as np
+
+from deepthought.processing.online import smoothing_factor
+
+
+module_logger = logging.getLogger(__name__)
+
+# The largest factor that values are scaled by within a block of the EMA, which bounds the loss of precision
+_MAX_SCALE = 1e6
+
+
+def ema(values, ema_length):
+    """Calculates the EMA of a series
+
+    The EMA is a linear recurrence, which is solved in closed form within blocks of values, vectorized over all the
+    blocks at once. Only the value carried from one block to the next is calculated in a loop, over the blocks.
+
+    Args:
+        values (numpy.ndarray): The values of the series
+        ema_length (int): Length of EMA sample size
+
+    Returns:
+        ema (numpy.ndarray): The EMA at each index of the series, NaN where there are not enough values yet
+    """
+    values = np.asarray(values, dtype=np.float64)
+    result = np.full(len(values), np.nan)
+    if len(values) <= ema_length:
+        return result
+
+    # The first EMA value is the average of the first <ema_length> values
+    result[ema_length] = values[:ema_length].mean()
+    rest = values[ema_length + 1:]
+    if not len(rest):
+        return result
+
+    k = smoothing_factor(ema_length)
+    a = 1 - k
+    if a == 0:
+        result[ema_length + 1:] = rest
+        return result
+
+    # Within a block, EMA[j] = a^(j+1) * carry + k * a^j * sum(x[i] / a^i for i <= j)
+    block = max(int(math.log(_MAX_SCALE) / -math.log(a)), 1)
+    n_blocks = -(-len(rest) // block)
+    padded = np.zeros(n_blocks * block)
+    padded[:len(rest)] = rest
+    blocks = padded.reshape(n_blocks, block)
+
+    powers = a ** np.arange(block)
+    partial = k * powers * np.cumsum(blocks / powers, axis=1)
+
+    # Carry the last EMA value of every block over to the next one
+    carries = np.empty(n_blocks)
+    carry = result[ema_length]
+    decay = a ** block
+    for i in xrange(n_blocks):
+        carries[i] = carry
+        carry = partial[i, -1] + decay * carry
+
+    full = partial + np.outer(carries, powers * a)
+    result[ema_length + 1:] = full.ravel()[:len(rest)]
+    return result
+
+
+def growth(ema_values, growth_length):
+    """Calculates the growth of the EMA relative to <growth_length> values before
+
+    Args:
+        ema_values (numpy.ndarray): The EMA of the series, as returned by :func:`ema`
+        growth_length (int): The number of values before which the growth is relative to
+
+    Returns:
+        growth (numpy.ndarray): The growth at each index of the series, NaN where there are not enough EMA values yet.
+            A growth from an EMA of 0 is infinite.
+    """
+    result = np.full(len(ema_values), np.nan)
+    if len(ema_values) <= growth_length:
+        return result
+
+    current = ema_values[growth_length:]
+    previous = ema_values[:len(ema_values) - growth_length]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result[growth_length:] = (current - previous) / previous
+    return result
+
+
+class TPSSeries(object):
+    """A TPS series, as sorted arrays of timestamps and values
+
+    Attributes:
+        timestamps (numpy.ndarray): The timestamps, in seconds, in increasing order
+        values (numpy.ndarray): The TPS at each timestamp
+    """
+
+    def __init__(self, timestamps, values):
+        """Initializes the series, sorting it by timestamp
+
+        Args:
+            timestamps (list): The timestamps
+            values (list): The TPS at each timestamp
+        """
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        order = np.argsort(timestamps, kind='mergesort')
+        self.timestamps = timestamps[order]
+        self.values = values[order]
+
+    @classmethod
+    def from_csv(cls, files):
+        """Loads a series from tps.csv files
+
+        As with the original dict of TPS, a timestamp appearing more than once keeps its last value.
+
+        Args:
+            files (list): The open tps.csv files, or their paths
+
+        Returns:
+            series (TPSSeries): The series of all the files
+        """
+        tps_dict = {}
+        for f in files:
+            if isinstance(f, basestring):
+                f = open(f, 'rb')
+            with f:
+                for row in csv.DictReader(f):
+                    tps_dict[int(float(row['timestamp']))] = int(row['tps'])
+        return cls(tps_dict.keys(), tps_dict.values())
+
+    @classmethod
+    def from_dirs(cls, dir_paths):
+        """Loads a series from the tps.csv of hour directories
+
+        Args:
+            dir_paths (list): The paths of the directories
+
+        Returns:
+            series (TPSSeries): The series of all the hours
+        """
+        paths = [os.path.join(dir_path, "tps.csv") for dir_path in dir_paths]
+        return cls.from_csv([path for path in paths if os.path.isfile(path)])
+
+    def ema(self, ema_length):
+        """Returns the EMA of the series, see :func:`ema`"""
+        return ema(self.values, ema_length)
+
+    def spikes(self, ema_length, growth_length, spike_threshold):
+        """Finds the spikes of the series
+
+        Args:
+            ema_length (int): Length of EMA sample size in seconds
+            growth_length (int): The number of seconds before which the growth is relative to
+            spike_threshold (float): The growth at or above which it is considered a spike
+
+        Returns:
+            (ema, growth, spikes) (tuple): The EMA and growth at each timestamp, NaN where they are not defined, and
+                the timestamps of the spikes
+        """
+        ema_values = self.ema(ema_length)
+        growth_values = growth(ema_values, growth_length)
+        with np.errstate(invalid='ignore'):
+            spikes = self.timestamps[growth_values >= spike_threshold]
+        return ema_values, growth_values, spikes
+
+    def sweep(self, ema_lengths, growth_lengths, spike_thresholds):
+        """Finds the spikes for every combination of parameters
+
+        The EMA is calculated once per ema_length and the growth once per (ema_length, growth_length), while all the
+        thresholds are compared at once.
+
+        Args:
+            ema_lengths (list): The EMA lengths to try
+            growth_lengths (list): The growth lengths to try
+            spike_thresholds (list): The spike thresholds to try
+
+        Returns:
+            spikes (dict): The timestamps of the spikes, keyed by (ema_length, growth_length, spike_threshold)
+        """
+        thresholds = np.asarray(spike_thresholds, dtype=np.float64)
+        results = {}
+        for ema_length in ema_lengths:
+            ema_values = self.ema(ema_length)
+            for growth_length in growth_lengths:
+                growth_values = growth(ema_values, growth_length)
+                with np.errstate(invalid='ignore'):
+                    crossed = growth_values[np.newaxis, :] >= thresholds[:, np.newaxis]
+                for threshold, mask in zip(spike_thresholds, crossed):
+                    results[(ema_length, growth_length, threshold)] = self.timestamps[mask]
+        return results
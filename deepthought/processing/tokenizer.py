@@ -0,0 +1,53 @@
+"""This module splits the text of tweets into words, for the word frequencies and the topics
+
+Every pattern is compiled and the stopword table built once, when the module is imported. A tweet is tokenized in a
+single pass over its text, so the words of an hour can be counted tweet by tweet instead of joining the whole hour into
+one string first.
+"""
+
+import re
+
+from nltk.corpus import stopwords
+
+
+# The English stopwords, which are neither counted nor kept in the topics
+STOP_WORDS = frozenset(stopwords.words("english"))
+
+# The words which are not counted in the word frequencies, on top of the stopwords
+FREQUENCY_STOP_WORDS = STOP_WORDS | frozenset([u"rt", u"#"])
+
+try:
+    _EMOJIS = re.compile(u"[\U0001f300-\U0001ffff\u2600-\u26ff\u2700-\u27bf]+", re.UNICODE)
+except re.error:
+    # Narrow builds of Python store the characters outside of the BMP as surrogate pairs
+    _EMOJIS = re.compile(u"(?:[\ud83c-\ud83f][\udc00-\udfff]|[\u2600-\u27bf])+", re.UNICODE)
+
+# Retweet markers, hashtags, mentions and links, which are left out of the topics
+_NOISE = re.compile(u"^(?:rt$|[#@]|https?:|www\.)", re.UNICODE)
+
+
+def words(text):
+    """Returns the words of a tweet counted in the word frequencies
+
+    Args:
+        text (unicode): The text of the tweet
+
+    Returns:
+        words (list): The lowercase words, without the stopwords
+    """
+    return [word for word in text.lower().split() if word not in FREQUENCY_STOP_WORDS]
+
+
+def topic_words(text):
+    """Returns the words of a tweet kept in the topics
+
+    Emojis are removed, as well as the stopwords, retweet markers, hashtags, mentions and links.
+
+    Args:
+        text (unicode): The text of the tweet
+
+    Returns:
+        words (list): The lowercase words
+    """
+    return [word for word in _EMOJIS.sub(u"", text.lower()).split()
+            if word not in STOP_WORDS and not _NOISE.match(word)]
@@ -0,0 +1,225 @@
+"""This module provides offline sources of tweets for the crawler, to test and load-test it without the Twitter API
+
+A source is an iterable of tweets. The crawler iterates over it exactly like it does over the Twitter stream, so the
+whole pipeline behind the crawler can be driven by replayed or synthetic tweets.
+"""
+
+import math
+import time
+import random
+import logging
+
+from deepthought.storage import reader
+
+
+module_logger = logging.getLogger(__name__)
+
+
+class StreamSource(object):
+    """Base class of the sources of tweets
+
+    Attributes:
+        speed (float): How much faster than real time the tweets are emitted, or None to emit them as fast as possible
+    """
+
+    def __init__(self, speed=1.0):
+        """Initializes the source
+
+        Args:
+            speed (float): The speed multiplier, or None to emit the tweets as fast as possible
+        """
+        self.speed = speed
+        self.logger = logging.getLogger(__name__)
+
+    def __iter__(self):
+        """Iterates over the tweets
+
+        Yields:
+            tweet (dict): The tweets, in the same form as the Twitter stream returns them
+        """
+        raise NotImplementedError
+
+    def pace(self, wall_start, elapsed):
+        """Sleeps until it is time to emit a tweet
+
+        Args:
+            wall_start (float): The wall time when the source started emitting
+            elapsed (float): The number of seconds between the first tweet and this one, in the time of the source
+        """
+        if not self.speed:
+            return
+        delay = wall_start + elapsed / self.speed - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class ReplaySource(StreamSource):
+    """Replays archived hours, in any format readable by :func:`deepthought.storage.reader.open_tweets`
+
+    The original spacing between the tweets is kept, scaled by the speed multiplier.
+
+    Attributes:
+        dir_paths (list): The directories of the hours to replay, in order
+    """
+
+    def __init__(self, dir_paths, speed=1.0):
+        """Initializes the source
+
+        Args:
+            dir_paths (list): The directories of the hours to replay, in order
+            speed (float): The speed multiplier, or None to replay as fast as possible
+        """
+        super(ReplaySource, self).__init__(speed)
+        self.dir_paths = dir_paths
+
+    def __iter__(self):
+        first_timestamp = None
+        wall_start = time.time()
+
+        for dir_path in self.dir_paths:
+            self.logger.info("Replaying '" + dir_path + "'")
+            with reader.open_tweets(dir_path) as tweets:
+                for timestamp, tweet in tweets.read():
+                    if first_timestamp is None:
+                        first_timestamp = timestamp
+                    self.pace(wall_start, timestamp - first_timestamp)
+                    yield tweet
+
+
+def constant(tps):
+    """Returns a TPS curve which stays the same
+
+    Args:
+        tps (float): The number of tweets per second
+    """
+    return lambda second: tps
+
+
+def daily(base, amplitude, period=24 * 60 * 60):
+    """Returns a TPS curve which rises and falls like a day of the sample stream
+
+    Args:
+        base (float): The average number of tweets per second
+        amplitude (float): How far the TPS goes above and below the average
+        period (int): The length of the cycle in seconds
+    """
+    return lambda second: base + amplitude * math.sin(2 * math.pi * second / period)
+
+
+class Spike(object):
+    """A burst of tweets injected into a synthetic stream
+
+    Attributes:
+        start (int): The second, from the start of the stream, when the spike begins
+        duration (int): The length of the spike in seconds
+        multiplier (float): How many times the TPS is multiplied by during the spike
+        words (list): The words which the tweets in the spike are about
+    """
+
+    def __init__(self, start, duration, multiplier, words):
+        self.start = start
+        self.duration = duration
+        self.multiplier = multiplier
+        self.words = words
+
+    def active(self, second):
+        """Checks if the spike is happening at a second"""
+        return self.start <= second < self.start + self.duration
+
+
+class SyntheticSource(StreamSource):
+    """Generates tweets following a TPS curve, with spikes injected into it
+
+    Attributes:
+        curve (function): Returns the TPS at a second from the start of the stream
+        spikes (list): The :class:`Spike` s injected into the stream
+        duration (int): The number of seconds generated, or None to generate forever
+        vocabulary (list): The words the tweets are made of
+    """
+
+    vocabulary = ["the", "event", "breaking", "news", "love", "game", "tonight", "music", "vote", "happy", "world",
+                  "live", "video", "photo", "follow", "today", "people", "new", "time", "best", "watch", "free", "win",
+                  "day", "morning", "school", "friends", "party", "weekend", "movie", "team", "season", "finally"]
+
+    def __init__(self, curve=None, spikes=(), duration=None, speed=1.0, seed=None):
+        """Initializes the source
+
+        Args:
+            curve (function): The TPS curve, defaults to a constant 50 TPS
+            spikes (list): The spikes to inject
+            duration (int): The number of seconds to generate, defaults to forever
+            speed (float): The speed multiplier, or None to generate as fast as possible
+            seed (int): The seed of the random generator, to generate the same tweets again
+        """
+        super(SyntheticSource, self).__init__(speed)
+        self.curve = curve or constant(50)
+        self.spikes = list(spikes)
+        self.duration = duration
+        self.random = random.Random(seed)
+
+    def __iter__(self):
+        wall_start = time.time()
+        tweet_id = 0
+        second = 0
+        # The fraction of a tweet left over from the previous seconds, so that a TPS under 1 still generates tweets
+        remainder = 0.0
+
+        while self.duration is None or second < self.duration:
+            tps = max(self.curve(second), 0)
+            spikes = [spike for spike in self.spikes if spike.active(second)]
+            for spike in spikes:
+                tps *= spike.multiplier
+
+            # Spread the tweets of this second evenly over it
+            n = int(tps + remainder)
+            remainder += tps - n
+            for i in xrange(n):
+                self.pace(wall_start, second + i / float(n))
+                tweet_id += 1
+                yield self.make_tweet(tweet_id, spikes)
+
+            second += 1
+
+    def make_tweet(self, tweet_id, spikes):
+        """Generates a tweet shaped like the ones returned by the sample stream
+
+        Args:
+            tweet_id (int): The id of the tweet
+            spikes (list): The spikes which are happening, whose words will be in the tweet
+
+        Returns:
+            tweet (dict): The tweet
+        """
+        rand = self.random
+        words = [rand.choice(self.vocabulary) for _ in xrange(rand.randint(4, 16))]
+        for spike in spikes:
+            words.extend(spike.words)
+
+        hashtags = [word for word in words if rand.random() < 0.05]
+        mentions = ["user%d" % rand.randint(1, 10 ** 6) for _ in xrange(rand.randint(0, 1))]
+        text = " ".join(["@" + name for name in mentions] + words + ["#" + tag for tag in hashtags])
+
+        tweet = {
+            'id': tweet_id,
+            'id_str': str(tweet_id),
+            'text': text,
+            'lang': 'en',
+            'created_at': time.strftime("%a %b %d %H:%M:%S +0000 %Y", time.gmtime()),
+            'user': {
+                'id': rand.randint(1, 10 ** 9),
+                'screen_name': "user%d" % rand.randint(1, 10 ** 6),
+                'followers_count': rand.randint(0, 10 ** 5),
+                'lang': 'en'
+            },
+            'entities': {
+                'hashtags': [{'text': tag} for tag in hashtags],
+                'user_mentions': [{'screen_name': name} for name in mentions],
+                'urls': []
+            },
+            'retweet_count': 0,
+            'favorite_count': 0
+        }
+        if rand.random() < 0.3:
+            tweet['text'] = "RT " + text
+            tweet['retweeted_status'] = {'id': rand.randint(1, tweet_id), 'text': text}
+        return tweet
@@ -0,0 +1,3 @@
+"""
+This package contains the modules that write the crawler's output to disk and read it back for analysis
+"""
@@ -0,0 +1,214 @@
+"""This module provides the compressed variant of the segment format
+
+Instead of individual records, a compressed segment holds frames. Each frame is a batch of records, encoded the same
+way as in an uncompressed segment, that is compressed on its own with zlib::
+
+    <first timestamp: float64> <last timestamp: float64> <records: uint32> <compressed length: uint32>
+    <compressed records: compressed length bytes>
+
+As frames are independent of each other, a reader only has to decompress the frames overlapping the time range it
+wants, and frames can be read as soon as they are written, before the segment is complete. The index holds an entry
+for every frame.
+"""
+
+import os
+import zlib
+import struct
+import bisect
+import logging
+
+from deepthought import config
+from deepthought.storage.segment import RECORD_HEADER, INDEX_ENTRY, index_path, load_index
+
+
+MAGIC = "DTSEGZ01"
+FRAME_HEADER = struct.Struct("<ddII")
+
+module_logger = logging.getLogger(__name__)
+
+
+class CompressedSegmentWriter(object):
+    """Buffers records into frames, and appends each frame to a compressed segment once it is large enough
+
+    Attributes:
+        path (str): The path to the compressed segment file
+        frame_size (int): The number of uncompressed bytes buffered before a frame is written
+        level (int): The zlib compression level
+        offset (int): The byte offset where the next frame will be written
+        count (int): The number of records written, including the ones still buffered
+    """
+
+    def __init__(self, path, frame_size=None, level=None):
+        """Creates the compressed segment file and its index
+
+        Args:
+            path (str): The path to the compressed segment file
+            frame_size (int): The uncompressed size of a frame in bytes, defaults to the config
+            level (int): The zlib compression level, defaults to the config
+        """
+        self.path = path
+        self.frame_size = frame_size or config.frame_size
+        self.level = config.frame_compression_level if level is None else level
+        self.count = 0
+
+        self.buffer = []
+        self.buffer_size = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.offset = len(MAGIC)
+        self.index_file = open(index_path(path), 'wb')
+
+    def write_batch(self, records):
+        """Adds a batch of records to the current frame, writing it out once it is full
+
+        Args:
+            records (list): A list of (timestamp, payload) tuples, where the payload is a str
+        """
+        for timestamp, payload in records:
+            if self.first_timestamp is None:
+                self.first_timestamp = timestamp
+            self.last_timestamp = timestamp
+
+            self.buffer.append(RECORD_HEADER.pack(timestamp, len(payload)))
+            self.buffer.append(payload)
+            self.buffer_size += RECORD_HEADER.size + len(payload)
+            self.count += 1
+
+            if self.buffer_size >= self.frame_size:
+                self.write_frame()
+
+    def write_frame(self):
+        """Compresses the buffered records and appends them to the segment as a frame"""
+        if not self.buffer:
+            return
+
+        data = zlib.compress("".join(self.buffer), self.level)
+        header = FRAME_HEADER.pack(self.first_timestamp, self.last_timestamp, len(self.buffer) // 2, len(data))
+        self.file.write(header + data)
+        self.index_file.write(INDEX_ENTRY.pack(self.first_timestamp, self.offset))
+        self.offset += len(header) + len(data)
+
+        self.buffer = []
+        self.buffer_size = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+    def flush(self):
+        """Flushes the frames written so far, the current frame is kept until it is full"""
+        self.file.flush()
+        self.index_file.flush()
+
+    def sync(self):
+        """Writes the current frame, even if it is not full, then flushes and fsyncs the frames written so far
+
+        With the "batch" fsync policy of the writer, every batch is thus durable and readable once it is written, at
+        the cost of smaller frames which compress less.
+        """
+        self.write_frame()
+        self.flush()
+        os.fsync(self.file.fileno())
+        os.fsync(self.index_file.fileno())
+
+    def close(self):
+        """Writes the current frame, then flushes and closes the segment and its index"""
+        self.write_frame()
+        self.flush()
+        self.file.close()
+        self.index_file.close()
+
+
+class CompressedSegmentReader(object):
+    """Reads records from a compressed segment, only decompressing the frames in the requested time range
+
+    Attributes:
+        path (str): The path to the compressed segment file
+        timestamps (list): The first timestamp of each frame
+        offsets (list): The byte offset of each frame
+    """
+
+    def __init__(self, path):
+        """Opens the compressed segment
+
+        Args:
+            path (str): The path to the compressed segment file
+        """
+        self.path = path
+        self.timestamps, self.offsets = load_index(path)
+
+        self.file = open(path, 'rb')
+        if self.file.read(len(MAGIC)) != MAGIC:
+            self.file.close()
+            raise ValueError("'" + path + "' is not a compressed segment file")
+
+    def seek(self, start):
+        """Finds the byte offset of the frame containing a timestamp
+
+        Args:
+            start (float): The timestamp to start at
+
+        Returns:
+            offset (int): The offset of the last frame starting before the timestamp, or of the first frame
+        """
+        i = bisect.bisect_left(self.timestamps, start) - 1
+        if i < 0:
+            return len(MAGIC)
+        return self.offsets[i]
+
+    def frames(self, start=None, end=None):
+        """Iterates over the decompressed frames overlapping a time range
+
+        Args:
+            start (float): Frames which end before this timestamp are skipped without being decompressed
+            end (float): Frames which start at or after this timestamp are not read
+
+        Yields:
+            data (str): The records of each frame
+        """
+        self.file.seek(len(MAGIC) if start is None else self.seek(start))
+        while True:
+            header = self.file.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                break
+            first_timestamp, last_timestamp, count, length = FRAME_HEADER.unpack(header)
+
+            if end is not None and first_timestamp >= end:
+                break
+            if start is not None and last_timestamp < start:
+                self.file.seek(length, os.SEEK_CUR)
+                continue
+
+            data = self.file.read(length)
+            # Stop at a frame that has not been completely written yet
+            if len(data) < length:
+                break
+            yield zlib.decompress(data)
+
+    def read_raw(self, start=None, end=None):
+        """Iterates over the records in a time range
+
+        Args:
+            start (float): Only records with a timestamp at or after this are returned, defaults to the first record
+            end (float): Only records with a timestamp before this are returned, defaults to the last record
+
+        Yields:
+            (timestamp, payload) (tuple): The timestamp and payload of each record
+        """
+        for data in self.frames(start, end):
+            offset = 0
+            while offset < len(data):
+                timestamp, length = RECORD_HEADER.unpack_from(data, offset)
+                begin = offset + RECORD_HEADER.size
+                offset = begin + length
+
+                if end is not None and timestamp >= end:
+                    return
+                if start is not None and timestamp < start:
+                    continue
+                yield timestamp, data[begin:offset]
+
+    def close(self):
+        """Closes the compressed segment"""
+        self.file.close()
@@ -0,0 +1,497 @@
+"""This module provides the inverted index of the word frequencies of every hour, used by the search API
+
+The index maps every word to its postings: the hours in which it was used, with the number of times it was. It is a
+directory of immutable runs, each indexing some of the hours, and of runs.json, which lists the runs in the order they
+were written::
+
+    {"next": <the number of the next run>, "runs": [{"name": ..., "level": ..., "hours": [...]}, ...]}
+
+A run is a directory of four .npy arrays, which are memory-mapped when it is read:
+
+* terms: the words of the run, sorted, UTF-8 encoded and concatenated
+* term_offsets: the word with id i is terms[term_offsets[i]:term_offsets[i + 1]]
+* postings: the postings of every word, as varints (see :func:`encode_varints`): the hours in increasing order, each
+  as the difference with the previous one, followed by the count
+* postings_offsets: the postings of the word with id i are postings[postings_offsets[i]:postings_offsets[i + 1]]
+
+A word is found in a run by binary search, and reading its postings only touches the pages they are on, whatever the
+number of hours. The words with a prefix are contiguous, so their postings are read at once. An hour is identified by
+the number of hours between the epoch and its "DD-MM-YYYY_HH" name.
+
+An hour is added as a run of level 0. Whenever <fanout> runs have the same level, they are merged into one run of the
+next level, so that there are only a few runs per level whatever the number of hours. If an hour is added again, the
+postings of the newest run which has it replace the others.
+
+Runs are written under an exclusive lock, then runs.json is replaced at once, so readers in other processes always see
+complete runs.
+"""
+
+import os
+import json
+import time
+import fcntl
+import shutil
+import logging
+import calendar
+import threading
+
+import numpy as np
+
+from deepthought import config
+
+
+module_logger = logging.getLogger(__name__)
+
+RUNS_FILE = "runs.json"
+ARRAYS = ("terms", "term_offsets", "postings", "postings_offsets")
+
+# The number of times the runs are loaded again when a writer deletes some of them while they are being loaded
+RELOAD_ATTEMPTS = 5
+
+
+def hour_number(name):
+    """Returns the number of an hour
+
+    Args:
+        name (str): The "DD-MM-YYYY_HH" name of the hour
+
+    Returns:
+        number (int): The number of hours between the epoch and the hour, as if it was in UTC
+    """
+    return calendar.timegm(time.strptime(name, "%d-%m-%Y_%H")) // 3600
+
+
+def hour_name(number):
+    """Returns the "DD-MM-YYYY_HH" name of an hour from its number, see :func:`hour_number`"""
+    return time.strftime("%d-%m-%Y_%H", time.gmtime(number * 3600))
+
+
+def encode_varints(values):
+    """Encodes non-negative integers as varints: 7 bits per byte, with the high bit set on all but the last byte
+
+    Args:
+        values (numpy.ndarray): The integers
+
+    Returns:
+        (data, lengths) (tuple): The bytes of the varints as an array of uint8, and the number of bytes of each integer
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        lengths += rest > 0
+        rest >>= np.uint64(7)
+
+    data = np.empty(lengths.sum(), dtype=np.uint8)
+    starts = np.cumsum(lengths) - lengths
+    rest = values.copy()
+    for i in xrange(lengths.max() if len(lengths) else 0):
+        selected = lengths > i
+        more = (lengths[selected] > i + 1).astype(np.uint8) << 7
+        data[starts[selected] + i] = (rest[selected] & np.uint64(0x7f)).astype(np.uint8) | more
+        rest[selected] >>= np.uint64(7)
+    return data, lengths
+
+
+def decode_varints(data):
+    """Decodes the varints written by :func:`encode_varints`
+
+    Args:
+        data (numpy.ndarray): The bytes of the varints
+
+    Returns:
+        (values, ends) (tuple): The integers, and the offset of the last byte of each of them in data
+    """
+    data = np.asarray(data, dtype=np.uint8)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.empty_like(ends)
+    starts[:1] = 0
+    starts[1:] = ends[:-1] + 1
+    lengths = ends - starts + 1
+
+    values = np.zeros(len(ends), dtype=np.uint64)
+    for i in xrange(lengths.max() if len(lengths) else 0):
+        selected = lengths > i
+        values[selected] |= (data[starts[selected] + i] & 0x7f).astype(np.uint64) << np.uint64(7 * i)
+    return values, ends
+
+
+class Run(object):
+    """An immutable run of the index, whose arrays are memory-mapped
+
+    Attributes:
+        path (str): The path of the directory of the run
+        hours (numpy.ndarray): The numbers of the hours indexed by the run
+        terms, term_offsets, postings, postings_offsets (numpy.ndarray): The arrays of the run, see the module
+    """
+
+    def __init__(self, path, hours):
+        self.path = path
+        self.hours = np.asarray(hours, dtype=np.int64)
+        for name in ARRAYS:
+            array_path = os.path.join(path, name + ".npy")
+            try:
+                setattr(self, name, np.load(array_path, mmap_mode='r'))
+            except ValueError:
+                # An empty array cannot be memory-mapped
+                setattr(self, name, np.load(array_path))
+
+    def __len__(self):
+        return len(self.term_offsets) - 1
+
+    def term(self, i):
+        """Returns the UTF-8 encoded word with id i"""
+        return self.terms[self.term_offsets[i]:self.term_offsets[i + 1]].tostring()
+
+    def all_terms(self):
+        """Returns every UTF-8 encoded word of the run, in order"""
+        terms = self.terms.tostring()
+        offsets = self.term_offsets.tolist()
+        return [terms[offsets[i]:offsets[i + 1]] for i in xrange(len(self))]
+
+    def bisect(self, term):
+        """Returns the id of the first word of the run which is not lower than a UTF-8 encoded word"""
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.term(middle) < term:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def find(self, term):
+        """Returns the id of a UTF-8 encoded word, or None if it is not in the run"""
+        i = self.bisect(term)
+        if i < len(self) and self.term(i) == term:
+            return i
+        return None
+
+    def prefix_range(self, term):
+        """Returns the ids [begin, end) of the words of the run which start with a UTF-8 encoded prefix"""
+        begin = self.bisect(term)
+        # The first word after them is not lower than the prefix with its last byte incremented
+        term = term.rstrip("\xff")
+        if not term:
+            return begin, len(self)
+        return begin, self.bisect(term[:-1] + chr(ord(term[-1]) + 1))
+
+    def word_postings(self, i):
+        """Returns the postings of the word with id i
+
+        Returns:
+            (hours, counts) (tuple): The numbers of the hours the word was used in, increasing, and its counts in them
+        """
+        values, ends = decode_varints(self.postings[self.postings_offsets[i]:self.postings_offsets[i + 1]])
+        return np.cumsum(values[0::2].astype(np.int64)), values[1::2].astype(np.int64)
+
+    def entries(self, begin=0, end=None):
+        """Returns every posting of the run, or of the words with ids [begin, end)
+
+        Returns:
+            (term_ids, hours, counts) (tuple): The id of the word, the number of the hour and the count of every
+                posting, sorted by word then hour
+        """
+        end = len(self) if end is None else end
+        start = self.postings_offsets[begin]
+        values, ends = decode_varints(self.postings[start:self.postings_offsets[end]])
+        # The word of a value is found from the offset of its last byte
+        term_ids = np.searchsorted(self.postings_offsets, ends + start, side='right')[0::2] - 1
+        deltas, counts = values[0::2].astype(np.int64), values[1::2].astype(np.int64)
+
+        # The first hour of every word is whole, the next ones are differences
+        hours = np.cumsum(deltas)
+        first = np.ones(len(term_ids), dtype=bool)
+        first[1:] = term_ids[1:] != term_ids[:-1]
+        bases = hours - deltas
+        hours -= np.maximum.accumulate(np.where(first, bases, 0))
+        return term_ids, hours, counts
+
+    @classmethod
+    def write(cls, path, terms, term_ids, hours, counts, run_hours):
+        """Writes a run
+
+        Args:
+            path (str): The path of the directory of the run, which must not exist
+            terms (list): The UTF-8 encoded words, sorted
+            term_ids (numpy.ndarray): The id of the word of every posting
+            hours (numpy.ndarray): The number of the hour of every posting
+            counts (numpy.ndarray): The count of every posting
+            run_hours (list): The numbers of the hours indexed by the run
+
+        Returns:
+            run (Run): The run
+        """
+        order = np.lexsort((hours, term_ids))
+        term_ids, hours, counts = term_ids[order], hours[order], counts[order]
+
+        first = np.ones(len(term_ids), dtype=bool)
+        first[1:] = term_ids[1:] != term_ids[:-1]
+        deltas = hours.copy()
+        deltas[~first] -= hours[:-1][~first[1:]]
+
+        values = np.empty(2 * len(hours), dtype=np.int64)
+        values[0::2] = deltas
+        values[1::2] = counts
+        data, lengths = encode_varints(values)
+        postings_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        sizes = np.bincount(term_ids, weights=lengths[0::2] + lengths[1::2], minlength=len(terms))
+        np.cumsum(sizes.astype(np.int64), out=postings_offsets[1:])
+
+        term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum([len(term) for term in terms], out=term_offsets[1:])
+
+        os.makedirs(path)
+        np.save(os.path.join(path, "terms.npy"), np.frombuffer("".join(terms), dtype=np.uint8))
+        np.save(os.path.join(path, "term_offsets.npy"), term_offsets)
+        np.save(os.path.join(path, "postings.npy"), data)
+        np.save(os.path.join(path, "postings_offsets.npy"), postings_offsets)
+        return cls(path, run_hours)
+
+
+class InvertedIndex(object):
+    """The inverted index of the word frequencies of every hour
+
+    The index can be read by several threads, while another process adds hours to it.
+
+    Attributes:
+        dir_path (str): The path of the directory of the index
+        fanout (int): The number of runs of a level merged into a run of the next level
+        runs (list): The runs, from the oldest to the newest
+        state (dict): The contents of runs.json
+        version (tuple): The inode, modification time and size of runs.json when the runs were loaded
+    """
+
+    def __init__(self, dir_path=None, fanout=None):
+        self.dir_path = dir_path or config.search_index_dir
+        self.fanout = fanout or config.search_index_fanout
+        self.runs = []
+        self.state = {'next': 0, 'runs': []}
+        self.version = None
+        self.lock = threading.Lock()
+
+    def reload(self):
+        """Loads the runs again if runs.json changed since they were loaded
+
+        A writer in another process deletes the runs merged away right after replacing runs.json, so the runs listed
+        by the runs.json being read can disappear. The new runs.json is then read instead.
+
+        Raises:
+            IOError: If the runs could not be loaded after RELOAD_ATTEMPTS attempts
+        """
+        path = os.path.join(self.dir_path, RUNS_FILE)
+        for attempt in xrange(RELOAD_ATTEMPTS):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return
+
+            with self.lock:
+                # runs.json is replaced by a new file whenever it changes
+                if (stat.st_ino, stat.st_mtime, stat.st_size) == self.version:
+                    return
+                try:
+                    with open(path, 'r') as f:
+                        stat = os.fstat(f.fileno())
+                        state = json.load(f)
+                    runs = [Run(os.path.join(self.dir_path, run['name']), run['hours']) for run in state['runs']]
+                except (IOError, OSError):
+                    module_logger.debug("The runs of '" + self.dir_path + "' changed while they were loaded, retrying")
+                    continue
+                self.runs = runs
+                self.state = state
+                self.version = (stat.st_ino, stat.st_mtime, stat.st_size)
+                return
+
+        raise IOError("The runs of '" + self.dir_path + "' kept changing while they were loaded")
+
+    def hours(self):
+        """Returns the "DD-MM-YYYY_HH" names of the hours in the index"""
+        self.reload()
+        return set(hour_name(hour) for run in self.state['runs'] for hour in run['hours'])
+
+    def hour_numbers(self, first=None, last=None):
+        """Returns the numbers of the hours in the index, sorted, optionally only those within [first, last]"""
+        self.reload()
+        numbers = set(hour for run in self.state['runs'] for hour in run['hours'])
+        return sorted(hour for hour in numbers if (first is None or hour >= first) and (last is None or hour <= last))
+
+    def lookup(self, word):
+        """Returns the number of times a word was used in every hour of the index in which it was
+
+        Args:
+            word (unicode): The word
+
+        Returns:
+            counts (dict): The counts, keyed by the "DD-MM-YYYY_HH" name of the hour
+        """
+        return dict((hour_name(hour), count) for hour, count in self.lookup_many([(word, False)])[0].iteritems())
+
+    def lookup_many(self, queries, first=None, last=None):
+        """Returns the number of times each of several words, or words with a prefix, was used in every hour
+
+        The runs are only loaded once for all of the words.
+
+        Args:
+            queries (list): (word, prefix) tuples, where prefix is True to count every word starting with the word
+            first (int): The number of the first hour counted, None to start from the first hour of the index
+            last (int): The number of the last hour counted, None to end with the last hour of the index
+
+        Returns:
+            counts (list): The counts of each query, as dicts keyed by the number of the hours in which they are not 0
+        """
+        self.reload()
+        runs = self.runs
+        results = [{} for query in queries]
+        replaced = np.empty(0, dtype=np.int64)
+        # The newest run of an hour replaces the older ones
+        for run in reversed(runs):
+            for (word, prefix), counts in zip(queries, results):
+                term = word.encode("utf-8") if isinstance(word, unicode) else word
+                if prefix:
+                    begin, end = run.prefix_range(term)
+                else:
+                    i = run.find(term)
+                    begin, end = (i, i + 1) if i is not None else (0, 0)
+                if begin == end:
+                    continue
+
+                term_ids, hours, word_counts = run.entries(begin, end)
+                kept = ~np.in1d(hours, replaced)
+                if first is not None:
+                    kept &= hours >= first
+                if last is not None:
+                    kept &= hours <= last
+                # The counts of the words with the prefix are summed per hour
+                hours, inverse = np.unique(hours[kept], return_inverse=True)
+                sums = np.bincount(inverse, weights=word_counts[kept], minlength=len(hours))
+                for hour, count in zip(hours.tolist(), sums.tolist()):
+                    counts[hour] = int(count)
+            replaced = np.union1d(replaced, run.hours)
+        return results
+
+    def add_hour(self, name, counts):
+        """Adds the word frequencies of an hour to the index, replacing them if the hour was already added
+
+        Args:
+            name (str): The "DD-MM-YYYY_HH" name of the hour
+            counts (dict): The number of times every word was used in the hour
+
+        Raises:
+            ValueError: If the name is not the name of an hour
+        """
+        hour = hour_number(name)
+        items = sorted((word.encode("utf-8"), count) for word, count in counts.iteritems() if count > 0)
+        terms = [term for term, count in items]
+
+        with self.write_lock():
+            self.reload()
+            run = self.write_run(terms, np.arange(len(terms), dtype=np.int64), np.full(len(terms), hour, np.int64),
+                                 np.array([count for term, count in items], dtype=np.int64), [hour])
+            runs = self.state['runs'] + [{'name': os.path.basename(run.path), 'level': 0, 'hours': [hour]}]
+
+            # Merge the runs of a level once there are <fanout> of them, the lower levels always being the newest
+            level = 0
+            while sum(1 for r in runs if r['level'] == level) >= self.fanout:
+                merged = [r for r in runs if r['level'] == level]
+                run = self.merge([os.path.join(self.dir_path, r['name']) for r in merged],
+                                 [r['hours'] for r in merged])
+                hours = sorted(set(hour for r in merged for hour in r['hours']))
+                runs = [r for r in runs if r['level'] != level]
+                runs.append({'name': os.path.basename(run.path), 'level': level + 1, 'hours': hours})
+                level += 1
+            self.save(runs)
+        module_logger.debug("Added '" + name + "' to the search index")
+
+    def compact(self):
+        """Merges every run into one, so that a word is found with a single binary search"""
+        with self.write_lock():
+            self.reload()
+            runs = self.state['runs']
+            if len(runs) < 2:
+                return
+            run = self.merge([os.path.join(self.dir_path, r['name']) for r in runs], [r['hours'] for r in runs])
+            hours = sorted(set(hour for r in runs for hour in r['hours']))
+            self.save([{'name': os.path.basename(run.path), 'level': max(r['level'] for r in runs), 'hours': hours}])
+
+    def merge(self, paths, run_hours):
+        """Merges runs into a new run, keeping the postings of an hour from the newest run which has it
+
+        Args:
+            paths (list): The paths of the runs, from the oldest to the newest
+            run_hours (list): The numbers of the hours of every run
+
+        Returns:
+            run (Run): The new run
+        """
+        runs = [Run(path, hours) for path, hours in zip(paths, run_hours)]
+        run_terms = [run.all_terms() for run in runs]
+        terms = sorted(set().union(*run_terms))
+        ids = dict((term, i) for i, term in enumerate(terms))
+
+        all_ids, all_hours, all_counts = [], [], []
+        replaced = np.array([], dtype=np.int64)
+        for run, old_terms in reversed(zip(runs, run_terms)):
+            term_ids, hours, counts = run.entries()
+            kept = ~np.in1d(hours, replaced)
+            new_ids = np.array([ids[term] for term in old_terms], dtype=np.int64)
+            all_ids.append(new_ids[term_ids[kept]])
+            all_hours.append(hours[kept])
+            all_counts.append(counts[kept])
+            replaced = np.union1d(replaced, run.hours)
+
+        return self.write_run(terms, np.concatenate(all_ids), np.concatenate(all_hours), np.concatenate(all_counts),
+                              replaced.tolist())
+
+    def write_run(self, terms, term_ids, hours, counts, run_hours):
+        """Writes a new run in the directory of the index, see :meth:`Run.write`"""
+        name = "run-%08d" % self.state['next']
+        self.state['next'] += 1
+        path = os.path.join(self.dir_path, name)
+        if os.path.isdir(path):
+            # Left over by a write which did not finish
+            shutil.rmtree(path)
+        return Run.write(path, terms, term_ids, hours, counts, run_hours)
+
+    def save(self, runs):
+        """Replaces runs.json at once, then deletes the runs which are not in it anymore"""
+        state = {'next': self.state['next'], 'runs': runs}
+        path = os.path.join(self.dir_path, RUNS_FILE)
+        with open(path + ".tmp", 'w') as f:
+            json.dump(state, f)
+        os.rename(path + ".tmp", path)
+
+        # Readers which still have a deleted run mapped keep reading it until they reload
+        names = set(run['name'] for run in runs)
+        for name in os.listdir(self.dir_path):
+            if name.startswith("run-") and name not in names:
+                shutil.rmtree(os.path.join(self.dir_path, name))
+        self.reload()
+
+    def write_lock(self):
+        """Returns a context manager holding the lock of the index, shared with the other processes"""
+        if not os.path.isdir(self.dir_path):
+            try:
+                os.makedirs(self.dir_path)
+            except OSError:
+                # Another process may have just created it
+                if not os.path.isdir(self.dir_path):
+                    raise
+        return _FileLock(os.path.join(self.dir_path, "lock"))
+
+
+class _FileLock(object):
+    """Holds an exclusive flock on a file while in a with block"""
+
+    def __init__(self, path):
+        self.path = path
+        self.f = None
+
+    def __enter__(self):
+        self.f = open(self.path, 'w')
+        fcntl.flock(self.f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.f.close()
+        return False
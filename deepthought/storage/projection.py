@@ -0,0 +1,81 @@
+"""This module projects tweets onto the few fields that the analysis uses
+
+A full tweet from the stream is several KB of JSON, most of which (the user, entities, etc.) is never looked at. The
+crawler also writes every tweet as a compact binary record, which is what the analysis reads::
+
+    <id: uint64> <retweet: uint8> <text length: uint32> <lang length: uint16> <hashtags length: uint16>
+    <mentions length: uint16> <text> <lang> <hashtags> <mentions>
+
+All the strings are UTF-8 encoded. The hashtags and mentions are separated by spaces, as they cannot contain any.
+"""
+
+import struct
+import collections
+
+
+Record = collections.namedtuple("Record", ["id", "text", "lang", "hashtags", "mentions", "retweet"])
+
+HEADER = struct.Struct("<QBIHHH")
+
+
+def project(tweet):
+    """Projects a tweet onto a record
+
+    Args:
+        tweet (dict): The tweet, as returned by the stream
+
+    Returns:
+        record (Record): The record, or None if it is not a tweet, such as the deletion notices in the stream
+    """
+    if 'text' not in tweet:
+        return None
+
+    entities = tweet.get('entities') or {}
+    return Record(
+        id=tweet.get('id') or 0,
+        text=tweet['text'],
+        lang=tweet.get('lang') or u"",
+        hashtags=tuple(hashtag['text'] for hashtag in entities.get('hashtags', ())),
+        mentions=tuple(mention['screen_name'] for mention in entities.get('user_mentions', ())),
+        retweet='retweeted_status' in tweet
+    )
+
+
+def encode(record):
+    """Encodes a record
+
+    Args:
+        record (Record): The record
+
+    Returns:
+        payload (str): The encoded record
+    """
+    text = record.text.encode("utf-8")
+    lang = record.lang.encode("utf-8")
+    hashtags = u" ".join(record.hashtags).encode("utf-8")
+    mentions = u" ".join(record.mentions).encode("utf-8")
+    header = HEADER.pack(record.id, record.retweet, len(text), len(lang), len(hashtags), len(mentions))
+    return "".join((header, text, lang, hashtags, mentions))
+
+
+def decode(payload):
+    """Decodes a record
+
+    Args:
+        payload (str): The encoded record
+
+    Returns:
+        record (Record): The record
+    """
+    tweet_id, retweet, text_length, lang_length, hashtags_length, mentions_length = HEADER.unpack_from(payload)
+
+    offset = HEADER.size
+    text = payload[offset:offset + text_length].decode("utf-8")
+    offset += text_length
+    lang = payload[offset:offset + lang_length].decode("utf-8")
+    offset += lang_length
+    hashtags = payload[offset:offset + hashtags_length].decode("utf-8")
+    offset += hashtags_length
+    mentions = payload[offset:offset + mentions_length].decode("utf-8")
+
+    return Record(tweet_id, text, lang, tuple(hashtags.split()), tuple(mentions.split()), bool(retweet))
@@ -0,0 +1,254 @@
+"""This module provides a common interface to read back the tweets of an hour, whichever format they were saved in
+
+Besides the raw tweets, the crawler writes a compact record of every tweet (see
+:mod:`deepthought.storage.projection`), which is what the analysis should read through :func:`open_records`.
+"""
+
+import os
+import csv
+import json
+import logging
+
+from deepthought.storage import segment, frames, projection
+
+
+module_logger = logging.getLogger(__name__)
+
+
+def find_segment(dir_path, name):
+    """Finds a segment in a directory, compressed or not
+
+    Args:
+        dir_path (str): The path of the directory of the hour
+        name (str): The name of the segment without its extension, such as "tweets"
+
+    Returns:
+        path (str): The path to the segment, or None if there is no such segment
+    """
+    for extension in (".segz", ".seg"):
+        path = os.path.join(dir_path, name + extension)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def open_segment(path):
+    """Opens a segment for reading, compressed or not
+
+    Args:
+        path (str): The path to the segment
+
+    Returns:
+        reader: A :class:`deepthought.storage.frames.CompressedSegmentReader` or
+            :class:`deepthought.storage.segment.SegmentReader`
+    """
+    if path.endswith(".segz"):
+        return frames.CompressedSegmentReader(path)
+    return segment.SegmentReader(path)
+
+
+def open_tweets(dir_path):
+    """Opens the tweets of an hour for reading
+
+    Segments, compressed or not, are preferred. Older hours that were saved as tweets.csv are read through the same
+    interface.
+
+    Args:
+        dir_path (str): The path of the directory of the hour
+
+    Returns:
+        reader: A :class:`SegmentTweetsReader` or :class:`CSVTweetsReader`
+
+    Raises:
+        ValueError: If there are no tweets in the directory
+    """
+    segment_path = find_segment(dir_path, "tweets")
+    if segment_path is not None:
+        return SegmentTweetsReader(segment_path)
+
+    csv_path = os.path.join(dir_path, "tweets.csv")
+    if os.path.isfile(csv_path):
+        return CSVTweetsReader(csv_path)
+
+    raise ValueError("No tweets found in '" + dir_path + "'")
+
+
+def open_records(dir_path):
+    """Opens the projected records of the tweets of an hour for reading
+
+    Hours which were saved before the records were written have their tweets projected as they are read.
+
+    Args:
+        dir_path (str): The path of the directory of the hour
+
+    Returns:
+        reader: A :class:`SegmentRecordsReader` or :class:`ProjectedRecordsReader`
+
+    Raises:
+        ValueError: If there are no tweets in the directory
+    """
+    segment_path = find_segment(dir_path, "records")
+    if segment_path is not None:
+        return SegmentRecordsReader(segment_path)
+    return ProjectedRecordsReader(open_tweets(dir_path))
+
+
+def split_records(dir_path, chunk_size):
+    """Splits the records of an hour into time ranges of about <chunk_size> bytes, so they can be analysed in parallel
+
+    The ranges start at the timestamps of the index of the records segment, so reading each of them seeks straight to
+    its first record. As the ranges are half-open and do not overlap, every record is read in exactly one of them.
+
+    Args:
+        dir_path (str): The path of the directory of the hour
+        chunk_size (int): The approximate number of bytes of records in each range
+
+    Returns:
+        ranges (list): A list of (start, end) tuples, to be passed to :meth:`Reader.read`. The first start and last
+            end are None. A single range is returned if the records are smaller than a chunk or are not indexed.
+    """
+    path = find_segment(dir_path, "records")
+    if path is None or not chunk_size:
+        return [(None, None)]
+
+    bounds = []
+    next_offset = chunk_size
+    timestamps, offsets = segment.load_index(path)
+    for timestamp, offset in zip(timestamps, offsets):
+        if offset >= next_offset and (not bounds or timestamp > bounds[-1]):
+            bounds.append(timestamp)
+            next_offset = offset + chunk_size
+
+    edges = [None] + bounds + [None]
+    return zip(edges[:-1], edges[1:])
+
+
+def has_tweets(dir_path):
+    """Checks if a directory contains tweets in any of the formats
+
+    Args:
+        dir_path (str): The path of the directory of the hour
+
+    Returns:
+        bool: True if the directory contains tweets
+    """
+    return find_segment(dir_path, "tweets") is not None or os.path.isfile(os.path.join(dir_path, "tweets.csv"))
+
+
+class Reader(object):
+    """Base class of the readers
+
+    Every call to :meth:`read` starts a new pass, so the same reader can be used to read several time ranges.
+    """
+
+    def read(self, start=None, end=None):
+        """Iterates over the tweets in a time range
+
+        Args:
+            start (float): Only tweets received at or after this timestamp are returned
+            end (float): Only tweets received before this timestamp are returned
+
+        Yields:
+            (timestamp, tweet) (tuple): The timestamp and the tweet
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Closes the underlying file"""
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+class TweetsReader(Reader):
+    """Base class of the readers of the raw tweets"""
+
+    def read_raw(self, start=None, end=None):
+        """Iterates over the tweets in a time range without decoding them
+
+        Args:
+            start (float): Only tweets received at or after this timestamp are returned
+            end (float): Only tweets received before this timestamp are returned
+
+        Yields:
+            (timestamp, tweet) (tuple): The timestamp and the JSON encoded tweet
+        """
+        raise NotImplementedError
+
+    def read(self, start=None, end=None):
+        for timestamp, tweet in self.read_raw(start, end):
+            yield timestamp, json.loads(tweet)
+
+
+class SegmentTweetsReader(TweetsReader):
+    """Reads tweets from a segment, seeking to the requested time range using its index"""
+
+    def __init__(self, path):
+        self.segment = open_segment(path)
+
+    def read_raw(self, start=None, end=None):
+        return self.segment.read_raw(start, end)
+
+    def close(self):
+        self.segment.close()
+
+
+class CSVTweetsReader(TweetsReader):
+    """Reads tweets from a tweets.csv, which has to be scanned from the start for every time range"""
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+
+    def read_raw(self, start=None, end=None):
+        self.file.seek(0)
+        for row in csv.DictReader(self.file):
+            timestamp = float(row['timestamp'])
+            if end is not None and timestamp >= end:
+                break
+            if start is not None and timestamp < start:
+                continue
+            yield timestamp, row['tweet']
+
+    def close(self):
+        self.file.close()
+
+
+class SegmentRecordsReader(Reader):
+    """Reads the projected records from a records segment
+
+    Yields (timestamp, record) tuples, where the record is a :class:`deepthought.storage.projection.Record`
+    """
+
+    def __init__(self, path):
+        self.segment = open_segment(path)
+
+    def read(self, start=None, end=None):
+        decode = projection.decode
+        for timestamp, payload in self.segment.read_raw(start, end):
+            yield timestamp, decode(payload)
+
+    def close(self):
+        self.segment.close()
+
+
+class ProjectedRecordsReader(Reader):
+    """Projects the raw tweets of an hour which has no records segment as they are read
+
+    Yields (timestamp, record) tuples, where the record is a :class:`deepthought.storage.projection.Record`
+    """
+
+    def __init__(self, tweets):
+        self.tweets = tweets
+
+    def read(self, start=None, end=None):
+        for timestamp, tweet in self.tweets.read(start, end):
+            record = projection.project(tweet)
+            if record is not None:
+                yield timestamp, record
+
+    def close(self):
+        self.tweets.close()
@@ -0,0 +1,203 @@
+"""This module provides the append-only segment format that the crawler writes tweets in
+
+A segment file starts with a magic header, followed by length-prefixed records::
+
+    <timestamp: float64> <length: uint32> <payload: length bytes>
+
+Alongside each segment is a sparse index file, holding a (timestamp, byte offset) pair for every N-th record.
+As records are appended in the order they are received, the timestamps are increasing, so a reader can binary search
+the index to seek straight to a time range instead of scanning the whole hour.
+
+A record is only complete once its whole payload is on disk, so readers simply stop at a truncated record. This makes
+it safe to read a segment that is still being written to.
+"""
+
+import os
+import mmap
+import struct
+import bisect
+import logging
+
+from deepthought import config
+
+
+MAGIC = "DTSEG001"
+RECORD_HEADER = struct.Struct("<dI")
+INDEX_ENTRY = struct.Struct("<dQ")
+
+module_logger = logging.getLogger(__name__)
+
+
+def index_path(segment_path):
+    """Returns the path of the index file of a segment
+
+    Args:
+        segment_path (str): The path to the segment file
+
+    Returns:
+        index_path (str): The path to the index file
+    """
+    return os.path.splitext(segment_path)[0] + ".idx"
+
+
+def load_index(segment_path):
+    """Loads the sparse index of a segment
+
+    Args:
+        segment_path (str): The path to the segment file
+
+    Returns:
+        (timestamps, offsets) (tuple): Two lists, the timestamps of the indexed records and their byte offsets.
+            Both are empty if the segment has no index.
+    """
+    timestamps, offsets = [], []
+    path = index_path(segment_path)
+    if not os.path.isfile(path):
+        return timestamps, offsets
+
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    # Ignore a partially written last entry
+    for i in xrange(len(data) // INDEX_ENTRY.size):
+        timestamp, offset = INDEX_ENTRY.unpack_from(data, i * INDEX_ENTRY.size)
+        timestamps.append(timestamp)
+        offsets.append(offset)
+    return timestamps, offsets
+
+
+class SegmentWriter(object):
+    """Appends records to a segment file and maintains its sparse index
+
+    Attributes:
+        path (str): The path to the segment file
+        index_interval (int): An index entry is written for every <index_interval> records
+        offset (int): The byte offset where the next record will be written
+        count (int): The number of records written
+    """
+
+    def __init__(self, path, index_interval=None):
+        """Creates the segment file and its index
+
+        Args:
+            path (str): The path to the segment file
+            index_interval (int): The number of records between index entries, defaults to the config
+        """
+        self.path = path
+        self.index_interval = index_interval or config.segment_index_interval
+        self.count = 0
+
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self.offset = len(MAGIC)
+        self.index_file = open(index_path(path), 'wb')
+
+    def write_batch(self, records):
+        """Appends a batch of records to the segment
+
+        Args:
+            records (list): A list of (timestamp, payload) tuples, where the payload is a str
+        """
+        chunks = []
+        index_entries = []
+        for timestamp, payload in records:
+            if self.count % self.index_interval == 0:
+                index_entries.append(INDEX_ENTRY.pack(timestamp, self.offset))
+
+            chunks.append(RECORD_HEADER.pack(timestamp, len(payload)))
+            chunks.append(payload)
+            self.offset += RECORD_HEADER.size + len(payload)
+            self.count += 1
+
+        self.file.write("".join(chunks))
+        if index_entries:
+            self.index_file.write("".join(index_entries))
+
+    def flush(self):
+        """Flushes the segment before its index, so that the index never points past the data"""
+        self.file.flush()
+        self.index_file.flush()
+
+    def sync(self):
+        """Flushes and fsyncs the segment and its index"""
+        self.flush()
+        os.fsync(self.file.fileno())
+        os.fsync(self.index_file.fileno())
+
+    def close(self):
+        """Flushes and closes the segment and its index"""
+        self.flush()
+        self.file.close()
+        self.index_file.close()
+
+
+class SegmentReader(object):
+    """Reads records from a segment file through mmap
+
+    Attributes:
+        path (str): The path to the segment file
+        timestamps (list): The timestamps of the indexed records
+        offsets (list): The byte offsets of the indexed records
+    """
+
+    def __init__(self, path):
+        """Opens and maps the segment
+
+        Args:
+            path (str): The path to the segment file
+        """
+        self.path = path
+        self.timestamps, self.offsets = load_index(path)
+
+        self.file = open(path, 'rb')
+        if self.file.read(len(MAGIC)) != MAGIC:
+            self.file.close()
+            raise ValueError("'" + path + "' is not a segment file")
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def seek(self, start):
+        """Finds the byte offset to start reading from to get all the records at or after a timestamp
+
+        Args:
+            start (float): The timestamp to start at
+
+        Returns:
+            offset (int): The offset of the last indexed record before the timestamp, or of the first record
+        """
+        i = bisect.bisect_left(self.timestamps, start) - 1
+        if i < 0:
+            return len(MAGIC)
+        return self.offsets[i]
+
+    def read_raw(self, start=None, end=None):
+        """Iterates over the records in a time range
+
+        Args:
+            start (float): Only records with a timestamp at or after this are returned, defaults to the first record
+            end (float): Only records with a timestamp before this are returned, defaults to the last record
+
+        Yields:
+            (timestamp, payload) (tuple): The timestamp and payload of each record
+        """
+        data = self.data
+        size = len(data)
+        offset = len(MAGIC) if start is None else self.seek(start)
+
+        while offset + RECORD_HEADER.size <= size:
+            timestamp, length = RECORD_HEADER.unpack_from(data, offset)
+            begin = offset + RECORD_HEADER.size
+            offset = begin + length
+
+            # Stop at a record that has not been completely written yet
+            if offset > size:
+                break
+            if end is not None and timestamp >= end:
+                break
+            if start is not None and timestamp < start:
+                continue
+            yield timestamp, data[begin:offset]
+
+    def close(self):
+        """Unmaps and closes the segment"""
+        self.data.close()
+        self.file.close()
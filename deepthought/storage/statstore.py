@@ -0,0 +1,219 @@
+"""This module provides the local store of the stats of every hour, served by the API
+
+The stats of an hour are its TPS, along with the EMA, growth and spikes found by the analysis, which are written to
+tps.csv, ema.csv, growth.csv and spikes.csv in the directory of the hour. The processor loads them into the store once
+the hour is analysed, so that the API reads them from the local disk instead of downloading and parsing the CSV files
+from Amazon S3 on every request.
+
+The store is a directory with a link per hour, named after the hour, to the directory of the current version of its
+stats, which holds:
+
+* tps.npy, ema.npy and growth.npy: the (timestamp, value) pairs of each stat, as a structured array of fixed-width
+  numbers, sorted by timestamp, which is memory-mapped when it is read
+* spikes.json: the top words of every spike, as a list of [timestamp, [[word, count], ...]] pairs
+* etags.json: for the hours loaded from Amazon S3 by the API, e.g. those analysed on another machine, the ETag of every
+  key they were loaded from. Once the file is older than config.stats_store_ttl seconds, the hour is stale, and the
+  API checks the keys again, see :meth:`StatsStore.is_stale`.
+
+The directory of a version is written in full before the link of the hour is renamed over to it, so readers only ever
+see complete hours. Versions are written under a lock shared by the processes storing hours, e.g. the processor and
+the API loading a cold hour, so the last one linked is kept, and the versions it replaced are removed. The values which
+are not finite, e.g. the growth from a TPS of 0, are read as None, as they cannot be written to JSON.
+"""
+
+import os
+import ast
+import csv
+import json
+import math
+import time
+import uuid
+import fcntl
+import shutil
+import logging
+import collections
+
+import numpy as np
+
+from deepthought import config
+
+
+module_logger = logging.getLogger(__name__)
+
+# The dtype of the values of every numeric stat
+NUMERIC_STATS = collections.OrderedDict([("tps", np.int64), ("ema", np.float64), ("growth", np.float64)])
+STATS = list(NUMERIC_STATS) + ["spikes"]
+
+
+def read_csv(path, stat):
+    """Reads the (timestamp, value) rows of a stat from its csv file
+
+    Args:
+        path (str): The path of the csv file
+        stat (str): The name of the stat, which is also the name of its column
+
+    Returns:
+        rows (list): The (timestamp, value) rows, sorted by timestamp. The value of a spike is its list of
+            (word, count) tuples, the others are numbers.
+    """
+    rows = {}
+    with open(path, 'rb') as f:
+        for row in csv.DictReader(f):
+            value = row[stat]
+            if stat in NUMERIC_STATS:
+                value = NUMERIC_STATS[stat](float(value))
+            else:
+                value = ast.literal_eval(value)
+            # As with the TPS series, a timestamp appearing more than once keeps its last value
+            rows[int(float(row['timestamp']))] = value
+    return sorted(rows.iteritems())
+
+
+def finite(value):
+    """Returns a number, or None if it is infinite or NaN, which JSON cannot represent"""
+    if isinstance(value, float) and (math.isinf(value) or math.isnan(value)):
+        return None
+    return value
+
+
+class StatsStore(object):
+    """The local store of the stats of every hour
+
+    Attributes:
+        dir_path (str): The path of the directory of the store
+    """
+
+    def __init__(self, dir_path=None):
+        self.dir_path = dir_path or config.stats_store_dir
+        self.logger = logging.getLogger(__name__)
+
+    def add_hour(self, name, dir_path, etags=None):
+        """Loads the stats of an hour from the csv files in a directory, replacing those in the store if any
+
+        The stats whose csv file is missing are left out.
+
+        Args:
+            name (str): The "DD-MM-YYYY_HH" name of the hour
+            dir_path (str): The path of the directory of the csv files, e.g. the directory of the hour
+            etags (dict): The ETag of every key of Amazon S3 the csv files were downloaded from, keyed by name, None
+                if the hour was analysed here
+        """
+        try:
+            os.makedirs(self.dir_path)
+        except OSError:
+            if not os.path.isdir(self.dir_path):
+                raise
+
+        hour_path = os.path.join(self.dir_path, name)
+        version = name + "." + uuid.uuid4().hex
+        with open(os.path.join(self.dir_path, "lock"), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            version_path = os.path.join(self.dir_path, version)
+            os.mkdir(version_path)
+            for stat in STATS:
+                csv_path = os.path.join(dir_path, stat + ".csv")
+                if not os.path.isfile(csv_path):
+                    continue
+                rows = read_csv(csv_path, stat)
+                if stat in NUMERIC_STATS:
+                    values = np.array(rows, dtype=[('timestamp', np.int64), ('value', NUMERIC_STATS[stat])])
+                    np.save(os.path.join(version_path, stat + ".npy"), values)
+                else:
+                    with open(os.path.join(version_path, stat + ".json"), 'w') as f:
+                        json.dump(rows, f)
+            if etags is not None:
+                with open(os.path.join(version_path, "etags.json"), 'w') as f:
+                    json.dump(etags, f)
+
+            link_path = version_path + ".link"
+            os.symlink(version, link_path)
+            os.rename(link_path, hour_path)
+
+            # Along with the version replaced, this removes those left by a process which crashed while storing the hour
+            for file_name in os.listdir(self.dir_path):
+                if not file_name.startswith(name + ".") or file_name == version:
+                    continue
+                path = os.path.join(self.dir_path, file_name)
+                if os.path.islink(path):
+                    os.remove(path)
+                else:
+                    shutil.rmtree(path, ignore_errors=True)
+        self.logger.debug("Stored the stats of '" + name + "'")
+
+    def get(self, name):
+        """Reads the stats of an hour
+
+        Args:
+            name (str): The "DD-MM-YYYY_HH" name of the hour
+
+        Returns:
+            stats (dict): The value of every stat at each timestamp, as a collections.OrderedDict sorted by timestamp,
+                keyed by the name of the stat, or None if the hour is not in the store
+        """
+        # The version linked is resolved once, so every stat is read from the same one
+        hour_path = os.path.realpath(os.path.join(self.dir_path, name))
+        try:
+            files = os.listdir(hour_path)
+        except OSError:
+            return None
+
+        stats = {}
+        try:
+            for stat in NUMERIC_STATS:
+                if stat + ".npy" not in files:
+                    continue
+                try:
+                    values = np.load(os.path.join(hour_path, stat + ".npy"), mmap_mode='r')
+                except ValueError:
+                    # An empty array cannot be memory-mapped
+                    values = np.load(os.path.join(hour_path, stat + ".npy"))
+                stats[stat] = collections.OrderedDict(zip(map(str, values['timestamp'].tolist()),
+                                                          map(finite, values['value'].tolist())))
+
+            if "spikes.json" in files:
+                with open(os.path.join(hour_path, "spikes.json"), 'r') as f:
+                    stats["spikes"] = collections.OrderedDict((str(timestamp), words)
+                                                              for timestamp, words in json.load(f))
+        except IOError:
+            # The hour was replaced while it was being read
+            return None
+        return stats
+
+    def is_stale(self, name):
+        """Returns True if the stats of an hour were loaded from Amazon S3 more than config.stats_store_ttl seconds ago
+
+        The hour may have been analysed again and uploaded since, so its keys are to be checked against
+        :meth:`etags`, after which :meth:`mark_checked` makes it fresh again. The hours analysed here are never stale.
+
+        Args:
+            name (str): The "DD-MM-YYYY_HH" name of the hour
+        """
+        try:
+            checked = os.path.getmtime(os.path.join(self.dir_path, name, "etags.json"))
+        except OSError:
+            return False
+        return checked + config.stats_store_ttl < time.time()
+
+    def etags(self, name):
+        """Returns the ETags of the keys the stats of an hour were loaded from, keyed by name, None if there are none
+
+        Args:
+            name (str): The "DD-MM-YYYY_HH" name of the hour
+        """
+        try:
+            with open(os.path.join(self.dir_path, name, "etags.json"), 'r') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    def mark_checked(self, name):
+        """Records that the keys of an hour loaded from Amazon S3 did not change, which makes it fresh again
+
+        Args:
+            name (str): The "DD-MM-YYYY_HH" name of the hour
+        """
+        try:
+            os.utime(os.path.join(self.dir_path, name, "etags.json"), None)
+        except OSError:
+            # The hour was replaced meanwhile
+            pass
@@ -0,0 +1,329 @@
+"""This module writes the tweets collected by the crawler to disk on a dedicated thread"""
+
+import os
+import csv
+import json
+import time
+import logging
+import threading
+import Queue
+
+from deepthought import config
+from deepthought.storage.segment import SegmentWriter
+from deepthought.storage.frames import CompressedSegmentWriter
+from deepthought.storage import projection
+
+
+# Markers put onto the queue in place of a timestamp to control the writer
+_ROTATE = object()
+_TPS = object()
+_STOP = object()
+
+
+class TweetWriter(threading.Thread):
+    """Drains a bounded queue of tweets and writes them to disk in batches
+
+    The crawler's stream thread only has to put tweets onto the queue, so a slow disk no longer stalls the stream.
+    Serialization of the tweets is also done on this thread, as well as their projection onto the compact records read
+    by the analysis. The writer also writes tps.csv, so that all the files of an hour are closed together. Once they
+    are, the directory of the hour is sealed: it is put onto the sealed queue for the Processor to analyse.
+
+    Attributes:
+        queue (Queue.Queue): Bounded queue of (timestamp, tweet) tuples waiting to be written
+        batch_size (int): The maximum number of tweets written in one batch
+        flush_interval (float): The maximum number of seconds a tweet waits in the queue before it is written
+        fsync (str): When the file is fsynced, one of "never", "batch" or "rotate"
+        compress (bool): Whether the segments are compressed (.segz) or not (.seg)
+        dir (str): The directory currently being written to
+        hour_start (float): The timestamp of the start of the hour of the directory, the older ticks are dropped
+        segment (SegmentWriter): The segment of raw tweets currently being written to
+        records (SegmentWriter): The segment of projected records currently being written to
+        tps_file (file): The tps.csv currently being written to
+        tps_writer (csv.DictWriter): CSV writer of the current tps.csv
+        written (int): The total number of tweets written
+        batches (int): The total number of batches written
+        last_latency (float): The number of seconds the last batch took to be written
+        max_latency (float): The highest number of seconds a batch took to be written
+        sealed_queue (Queue.Queue): The queue where the directory of every finished hour is put, if any
+        listeners (list): Functions called with the (timestamp, record) tuples of every batch once it is written
+        error (Exception): The error which stopped the writer, if any
+        logger (logging.Logger): Logger used for logging
+    """
+
+    def __init__(self, queue_size=None, batch_size=None, flush_interval=None, fsync=None, compress=None,
+                 sealed_queue=None):
+        """Initializes the writer
+
+        Args:
+            queue_size (int): The maximum number of tweets waiting to be written, defaults to the config
+            batch_size (int): The maximum number of tweets written in one batch, defaults to the config
+            flush_interval (float): The maximum time in seconds between flushes, defaults to the config
+            fsync (str): The fsync policy, one of "never", "batch" or "rotate", defaults to the config
+            compress (bool): Whether to write compressed segments, defaults to the config
+            sealed_queue (Queue.Queue): The queue where the directory of every finished hour is put
+        """
+        super(TweetWriter, self).__init__()
+        self.daemon = True
+
+        self.queue = Queue.Queue(queue_size or config.writer_queue_size)
+        self.batch_size = batch_size or config.writer_batch_size
+        self.flush_interval = config.writer_flush_interval if flush_interval is None else flush_interval
+        self.fsync = fsync or config.writer_fsync
+        if self.fsync not in ("never", "batch", "rotate"):
+            raise ValueError("Invalid fsync policy '" + self.fsync + "'")
+        self.compress = config.writer_compress if compress is None else compress
+
+        self.dir = ""
+        self.hour_start = None
+        self.segment = None
+        self.records = None
+        self.tps_file = None
+        self.tps_writer = None
+        self.written = 0
+        self.batches = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.sealed_queue = sealed_queue
+        self.listeners = []
+        self.error = None
+
+        self.logger = logging.getLogger(__name__)
+
+    def put(self, timestamp, tweet):
+        """Queues a tweet to be written
+
+        This blocks if the queue is full, which only happens if the disk cannot keep up with the stream.
+
+        Args:
+            timestamp (float): The time the tweet was received
+            tweet (dict): The tweet
+
+        Raises:
+            IOError: If the writer stopped after an error
+        """
+        self.enqueue((timestamp, tweet))
+
+    def rotate(self, dir_path, hour_start=None):
+        """Queues a change of the directory being written to
+
+        Tweets queued before this call are written to the old directory, those queued after to the new one.
+        The old directory is sealed once its files are closed.
+
+        Args:
+            dir_path (str): The path of the new directory, which must already exist
+            hour_start (float): The timestamp of the start of the hour of the directory. The ticks of the previous
+                hours which are queued after this call are dropped instead of being written to its tps.csv.
+        """
+        self.enqueue((_ROTATE, (dir_path, hour_start)))
+
+    def put_tps(self, rows):
+        """Queues a batch of rows to be appended to tps.csv
+
+        Args:
+            rows (list): A list of dicts with the keys 'timestamp' and 'tps'
+        """
+        self.enqueue((_TPS, rows))
+
+    def enqueue(self, item):
+        """Puts an item onto the queue, waiting for room as long as the writer is running
+
+        Raises:
+            IOError: If the writer stopped after an error, in which case nothing would ever make room in the queue
+        """
+        while True:
+            if self.error is not None:
+                raise IOError("The writer stopped after an error: " + str(self.error))
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except Queue.Full:
+                pass
+
+    def stop(self):
+        """Writes the remaining tweets, closes the file and waits for the writer to finish"""
+        try:
+            self.enqueue((_STOP, None))
+        except IOError:
+            # The writer already stopped
+            pass
+        self.join()
+
+    def stats(self):
+        """Returns the current statistics of the writer
+
+        Returns:
+            stats (dict): The queue depth, number of tweets and batches written, and write latencies in milliseconds
+        """
+        return {
+            'queue_depth': self.queue.qsize(),
+            'written': self.written,
+            'batches': self.batches,
+            'last_latency_ms': round(self.last_latency * 1000, 3),
+            'max_latency_ms': round(self.max_latency * 1000, 3)
+        }
+
+    def run(self):
+        """Runs the main loop of the writer, recording the error which stopped it if any
+
+        The crawler and the clock then fail to queue anything more, instead of waiting forever for room in the queue.
+        """
+        try:
+            self.write_loop()
+        except Exception as e:
+            self.error = e
+            self.logger.exception("Writer stopped after an error")
+
+    def write_loop(self):
+        """Main loop of the writer
+
+        Tweets are collected into a batch until either the batch is full or the flush interval has passed since the
+        first tweet of the batch was received, at which point the whole batch is written at once.
+        """
+        self.logger.debug("Writer started")
+        batch = []
+        deadline = time.time() + self.flush_interval
+
+        while True:
+            try:
+                # Nothing has to be written until a tweet is received
+                item = self.queue.get(timeout=max(deadline - time.time(), 0) if batch else None)
+            except Queue.Empty:
+                item = None
+
+            if item is not None:
+                if item[0] is _ROTATE:
+                    self.write_batch(batch)
+                    batch = []
+                    sealed_dir = self.dir
+                    self.open(*item[1])
+                    if sealed_dir and self.sealed_queue is not None:
+                        self.logger.debug("Sealed '" + sealed_dir + "'")
+                        self.sealed_queue.put(sealed_dir)
+                    continue
+                elif item[0] is _TPS:
+                    self.write_tps(item[1])
+                    continue
+                elif item[0] is _STOP:
+                    self.write_batch(batch)
+                    self.close()
+                    self.logger.debug("Writer stopped")
+                    return
+                if not batch:
+                    deadline = time.time() + self.flush_interval
+                batch.append(item)
+
+            # Write the batch if it is full or if it has waited for too long
+            if len(batch) >= self.batch_size or time.time() >= deadline:
+                self.write_batch(batch)
+                batch = []
+                deadline = time.time() + self.flush_interval
+
+    def write_batch(self, batch):
+        """Appends a batch of tweets to the current segments
+
+        Args:
+            batch (list): A list of (timestamp, tweet) tuples
+        """
+        if not batch:
+            return
+
+        start = time.time()
+        try:
+            self.segment.write_batch([(timestamp, json.dumps(tweet)) for timestamp, tweet in batch])
+
+            records = []
+            for timestamp, tweet in batch:
+                record = projection.project(tweet)
+                if record is not None:
+                    records.append((timestamp, record))
+            self.records.write_batch([(timestamp, projection.encode(record)) for timestamp, record in records])
+
+            for segment in (self.segment, self.records):
+                if self.fsync == "batch":
+                    segment.sync()
+                else:
+                    segment.flush()
+        except (ValueError, AttributeError):
+            self.logger.error("Failed to write to the segments in '" + self.dir + "'")
+            raise
+
+        # Update the statistics
+        self.last_latency = time.time() - start
+        self.max_latency = max(self.max_latency, self.last_latency)
+        self.written += len(batch)
+        self.batches += 1
+
+        for listener in self.listeners:
+            listener(records)
+
+    def write_tps(self, rows):
+        """Appends rows to the current tps.csv
+
+        Args:
+            rows (list): A list of dicts with the keys 'timestamp' and 'tps'
+        """
+        if self.hour_start is not None:
+            # The ticks of the previous hour, which was already sealed, would skew the spikes of this one
+            late = [row for row in rows if row['timestamp'] < self.hour_start]
+            if late:
+                self.logger.warn("Dropping " + str(len(late)) + " ticks of the previous hour")
+                rows = [row for row in rows if row['timestamp'] >= self.hour_start]
+
+        try:
+            self.tps_writer.writerows(rows)
+            self.tps_file.flush()
+            if self.fsync == "batch":
+                os.fsync(self.tps_file.fileno())
+        except (ValueError, AttributeError):
+            self.logger.error("Failed to write to tps.csv in '" + self.dir + "'")
+            raise
+
+    def open(self, dir_path, hour_start=None):
+        """Closes the current files and opens new ones in the given directory
+
+        Args:
+            dir_path (str): The directory to write to
+            hour_start (float): The timestamp of the start of the hour of the directory, if known
+        """
+        self.close()
+        self.logger.debug("Writing tweets to '" + dir_path + "'")
+
+        self.dir = dir_path
+        self.hour_start = hour_start
+        self.segment = self.open_segment("tweets")
+        self.records = self.open_segment("records")
+
+        self.tps_file = open(os.path.join(dir_path, "tps.csv"), 'wb')
+        self.tps_writer = csv.DictWriter(self.tps_file, fieldnames=['timestamp', 'tps'])
+        self.tps_writer.writeheader()
+
+    def open_segment(self, name):
+        """Creates a segment in the current directory
+
+        Args:
+            name (str): The name of the segment without its extension
+
+        Returns:
+            segment: A :class:`CompressedSegmentWriter` or :class:`SegmentWriter`, depending on the compress setting
+        """
+        if self.compress:
+            return CompressedSegmentWriter(os.path.join(self.dir, name + ".segz"))
+        return SegmentWriter(os.path.join(self.dir, name + ".seg"))
+
+    def close(self):
+        """Flushes and closes the current segments and tps.csv"""
+        if self.segment is None:
+            return
+
+        if self.fsync != "never":
+            self.segment.sync()
+            self.records.sync()
+            self.tps_file.flush()
+            os.fsync(self.tps_file.fileno())
+        self.segment.close()
+        self.records.close()
+        self.tps_file.close()
+        self.segment = None
+        self.records = None
+        self.tps_file = None
+        self.tps_writer = None
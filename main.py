@@ -2,17 +2,35 @@
 
 This module initializes the app and starts it.
 In the unlikely event it crashes, it will dump the stack trace and attempt to restart it.
+
+Usage::
+
+    python main.py [--role {all,crawler,processor,api}]
+
+Only the threads of the role are started, and only their modules imported, see :mod:`deepthought.app`.
 """
 
+import argparse
 import traceback
 import time
 
 import deepthought.app
 
 
-a = deepthought.app.App()
+def parse_role():
+    """Parses the command line arguments to choose the role of the app
+
+    Returns:
+        role (str): The role, "all" by default
+    """
+    parser = argparse.ArgumentParser(description="Collects and analyses tweets, and serves the results")
+    parser.add_argument("--role", choices=deepthought.app.ROLES, default="all",
+                        help="only run the crawler, the processor or the API")
+    return parser.parse_args().role
+
 
 if __name__ == '__main__':
+    a = deepthought.app.App(parse_role())
     while True:
         try:
             a.start()
@@ -22,4 +40,4 @@ if __name__ == '__main__':
             print div + "Fatal error occurred! Dumping stack trace to '" + dump_file_path + "'" + div
             traceback.print_exc(file=open(dump_file_path, 'wb'))
         else:
-            break
\ No newline at end of file
+            break